@@ -0,0 +1,4 @@
+import time
+
+# When the package was imported, where the process' startup timings start (see vfs_api.health)
+STARTED_AT = time.monotonic()
@@ -3,20 +3,58 @@ Main FastAPI application entry point.
 This module initializes the FastAPI application and includes all routes.
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import argparse
 import logging
-import uvicorn
+import sys
 
 # Import service routers
 from vfs_api.routes import router as api_router
+from vfs_api.db_utils import POOL_CONFIG, open_pool, close_pool, configure_pool, get_pool_stats
+from vfs_api.cache import CACHE_CONFIG, close_cache, configure_cache, get_cache_stats
+from vfs_api.events import close_notifier, get_events_stats
+from vfs_api.responses import configure_responses
+from vfs_api.health import get_startup_stats, readiness, start_warmup, stop_warmup
+from vfs_api.server import SERVER_CONFIG, configure_server, get_server_stats, serve, worker_pool_size
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The pool is bound to the running event loop, so it is created here, by each worker.
+    # Startup does not wait for the database, the pool is warmed up in the background.
+    await open_pool()
+    start_warmup()
+    yield
+    await stop_warmup()
+    # Requests in flight have finished, or were cancelled after the shutdown timeout
+    await close_notifier()
+    await close_pool()
+    await close_cache()
 
 def create_app(args):
+    configure_pool(
+        min_size=args.db_pool_min_size,
+        max_size=args.db_pool_max_size,
+        timeout=args.db_pool_timeout,
+        max_waiting=args.db_pool_max_waiting,
+        max_lifetime=args.db_pool_max_lifetime,
+        max_idle=args.db_pool_max_idle,
+        warmup=args.db_pool_warmup,
+    )
+    configure_cache(
+        max_entries=args.cache_max_entries,
+        ttl=args.cache_ttl,
+        redis_url=args.cache_redis_url,
+    )
+    configure_responses(validate=args.validate_responses)
+
     app = FastAPI(
         title="VFS API",
         description="Virtual File System API for managing directories and files",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
 
     # Add CORS middleware for HTTP endpoints
@@ -33,14 +71,26 @@ def create_app(args):
     # Include service routers
     app.include_router(api_router)
 
+    # Liveness: the process serves requests, whether or not the database is reachable
     @app.get("/health")
     async def health_check():
         return {"status": "ok"}
 
+    # Readiness: the pool is warm and reaches the database
+    @app.get("/ready")
+    async def ready_check():
+        status_code, body = await readiness()
+        return JSONResponse(body, status_code=status_code)
+
+    @app.get("/stats")
+    async def stats():
+        return {"server": get_server_stats(), "startup": get_startup_stats(), "pool": get_pool_stats(),
+                "cache": get_cache_stats(), "events": get_events_stats()}
+
     return app
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", type=str, default="0.0.0.0")
     parser.add_argument("--port", type=int, default=5678)
@@ -62,19 +112,77 @@ def main():
     parser.add_argument("--cors_max_age", type=int, default=600,
                         help="Maximum time (in seconds) to cache CORS preflight responses")
 
+    # Database connection pool settings (default to the DB_POOL_* environment variables)
+    parser.add_argument("--db_pool_min_size", type=int, default=None,
+                        help="Minimum number of pooled database connections")
+    parser.add_argument("--db_pool_max_size", type=int, default=None,
+                        help="Maximum number of pooled database connections")
+    parser.add_argument("--db_pool_timeout", type=float, default=None,
+                        help="Seconds to wait for a free connection before failing with 503")
+    parser.add_argument("--db_pool_max_waiting", type=int, default=None,
+                        help="Maximum number of requests queued for a connection (0 = unbounded)")
+    parser.add_argument("--db_pool_max_lifetime", type=float, default=None,
+                        help="Seconds after which a connection is recycled")
+    parser.add_argument("--db_pool_max_idle", type=float, default=None,
+                        help="Seconds an idle connection above the minimum is kept open")
+    parser.add_argument("--db_pool_warmup", type=int, default=None,
+                        help="Connections opened on startup before the API reports ready on /ready")
+
+    # Listing cache settings (default to the CACHE_* environment variables)
+    parser.add_argument("--cache_max_entries", type=int, default=None,
+                        help="Maximum number of cached listing and directory responses (0 = disabled)")
+    parser.add_argument("--cache_ttl", type=float, default=None,
+                        help="Seconds a cached response is served before being fetched again")
+    parser.add_argument("--cache_redis_url", type=str, default=None,
+                        help="Redis-compatible store to share the cache between processes")
+
+    # Response settings (default to the API_VALIDATE_RESPONSES environment variable)
+    parser.add_argument("--validate_responses", action="store_true", default=None,
+                        help="Validate the database's JSON against the response models (debugging)")
+
+    # Server settings (default to the API_WORKERS, API_PRELOAD, DB_CONNECTION_BUDGET and
+    # API_SHUTDOWN_TIMEOUT environment variables)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes serving the API (0 = one per CPU core)")
+    parser.add_argument("--preload", action="store_true", default=None,
+                        help="Build the application once before forking the workers")
+    parser.add_argument("--db_connection_budget", type=int, default=None,
+                        help="Database connections shared by all workers, setting each worker's pool size")
+    parser.add_argument("--shutdown_timeout", type=float, default=None,
+                        help="Seconds requests in flight are given to finish on shutdown")
+
+    return parser
+
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
     # Move logging configuration here and set it based on verbose flag
     log_level = logging.DEBUG if args.verbose else logging.ERROR
     logging.basicConfig(level=log_level)
 
-    # Create FastAPI app
-    app = create_app(args)
-
+    configure_server(
+        workers=args.workers,
+        preload=args.preload,
+        connection_budget=args.db_connection_budget,
+        shutdown_timeout=args.shutdown_timeout,
+    )
+    workers = SERVER_CONFIG['workers']
+    if SERVER_CONFIG['connection_budget']:
+        try:
+            args.db_pool_max_size = worker_pool_size(SERVER_CONFIG['connection_budget'], workers)
+        except ValueError as e:
+            parser.error(str(e))
+        args.db_pool_min_size = min(args.db_pool_min_size or POOL_CONFIG['min_size'], args.db_pool_max_size)
+    if workers > 1 and not (args.cache_redis_url or CACHE_CONFIG['redis_url']):
+        # Writes would only drop the cached responses of the worker that made them
+        logging.warning("The in-process cache is disabled with several workers, set CACHE_REDIS_URL to share one")
+        args.cache_max_entries = 0
 
     app_log_level = "debug" if args.verbose else "error"
 
-    uvicorn.run(app, host=args.host, port=args.port, log_level=app_log_level)
+    sys.exit(serve(lambda: create_app(args), args.host, args.port, app_log_level))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,316 @@
+# Read-through cache for directory listings and details.
+# Entries are grouped by (user_token, directory ID), the root level being the None
+# directory, so that a write can drop everything cached about the directories it
+# changed. The cache lives in process memory, or in a Redis-compatible store shared
+# by several API processes when CACHE_REDIS_URL is set.
+
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration, overridable from the command line (see configure_cache)
+CACHE_CONFIG = {
+    # Maximum number of cached responses per process (0 = cache disabled)
+    'max_entries': int(os.getenv('CACHE_MAX_ENTRIES', '10000')),
+    # Seconds after which a response is fetched again, a bound on staleness for
+    # changes made outside the API
+    'ttl': float(os.getenv('CACHE_TTL', '30')),
+    # Redis-compatible store shared by all API processes, e.g. redis://localhost:6379/0
+    'redis_url': os.getenv('CACHE_REDIS_URL') or None,
+}
+
+# (user_token, directory ID or None for the root level)
+GroupKey = Tuple[str, Optional[str]]
+
+def canonical_id(dir_id: Optional[str]) -> Optional[str]:
+    """Return the canonical text form of a directory ID, as the database returns it.
+
+    Raises ValueError for an invalid UUID, whose requests should bypass the cache.
+    """
+    return str(uuid.UUID(dir_id)) if dir_id is not None else None
+
+
+class ListingCache:
+    """In-process LRU cache with a TTL.
+
+    A load that was in flight while its group was invalidated does not store its
+    result, since it may have read the database before the write committed.
+    """
+    backend = 'memory'
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # (group, variant) -> (expires_at, value)
+        self._groups: Dict[GroupKey, Set[str]] = {}  # group -> cached variants
+        self._loads: Dict[GroupKey, Set[object]] = {}  # group -> tokens of the loads in flight
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    async def get_or_load(self, group: GroupKey, variant: str,
+                          load: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """Return the cached value, or load and cache it. None values are not cached."""
+        if self.max_entries <= 0:
+            return await load()
+        value, stamp = await self._lookup(group, variant)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        try:
+            value = await load()
+        except BaseException:
+            self._release(group, stamp)
+            raise
+        if value is None:
+            self._release(group, stamp)
+        else:
+            await self._store(group, variant, value, stamp)
+        return value
+
+    async def invalidate(self, groups: Iterable[GroupKey]) -> None:
+        """Drop the cached responses of the given directories."""
+        for group in set(groups):
+            self.invalidations += 1
+            self._loads.pop(group, None)
+            for variant in self._groups.pop(group, ()):
+                del self._entries[(group, variant)]
+
+    async def invalidate_user(self, user_token: str) -> None:
+        """Drop every cached response of a user."""
+        await self.invalidate(
+            group for group in {*self._groups, *self._loads} if group[0] == user_token
+        )
+
+    async def close(self) -> None:
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'errors': self.errors,
+        }
+
+    async def _lookup(self, group: GroupKey, variant: str) -> Tuple[Optional[Any], Any]:
+        """Return the cached value, or None and a stamp to pass to _store or _release."""
+        key = (group, variant)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1], None
+            self.expirations += 1
+            self._remove(key)
+        token = object()
+        self._loads.setdefault(group, set()).add(token)
+        return None, token
+
+    def _release(self, group: GroupKey, stamp: Any) -> bool:
+        """Forget a load, returning whether its group was left untouched meanwhile."""
+        tokens = self._loads.get(group)
+        if tokens is None or stamp not in tokens:
+            return False
+        tokens.discard(stamp)
+        if not tokens:
+            del self._loads[group]
+        return True
+
+    async def _store(self, group: GroupKey, variant: str, value: Any, stamp: Any) -> None:
+        if not self._release(group, stamp):
+            return
+        key = (group, variant)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        self._groups.setdefault(group, set()).add(variant)
+        while len(self._entries) > self.max_entries:
+            self.evictions += 1
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key) -> None:
+        group, variant = key
+        del self._entries[key]
+        variants = self._groups[group]
+        variants.discard(variant)
+        if not variants:
+            del self._groups[group]
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot cache a {type(value).__name__}")
+
+
+class RedisListingCache(ListingCache):
+    """Cache kept in a Redis-compatible store, shared by all API processes.
+
+    Each group is a hash of its variants, expiring ttl seconds after it was filled.
+    max_entries only enables the cache, the store's own memory policy handles evictions.
+    Invalidations bump a generation counter of the group (or of the user), and a load
+    only stores its result if the counters did not change while it ran. When the store
+    is unreachable, requests fall back to the database.
+    """
+    backend = 'redis'
+
+    PREFIX = 'vfs:listing'
+
+    def __init__(self, redis_url: str, max_entries: int, ttl: float):
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("CACHE_REDIS_URL requires the redis package (pip install vfs-api[cache])")
+        super().__init__(max_entries, ttl)
+        self._errors = (redis.RedisError, OSError)
+        self._watch_error = redis.WatchError
+        self._redis = redis.asyncio.from_url(redis_url)
+        # Generations outlive the entries they guard, so a counter cannot expire and
+        # restart at the value a load started with
+        self._generation_ttl = max(int(ttl) * 10, 3600)
+
+    def _key(self, kind: str, *parts: Any) -> str:
+        # JSON keeps user tokens containing ':' apart from the other parts
+        return f"{self.PREFIX}:{kind}:{json.dumps(parts)}"
+
+    async def invalidate(self, groups: Iterable[GroupKey]) -> None:
+        groups = set(groups)
+        if not groups:
+            return
+        self.invalidations += len(groups)
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for group in groups:
+                    generation = self._key('gen', *group)
+                    pipe.delete(self._key('group', *group))
+                    pipe.incr(generation)
+                    pipe.expire(generation, self._generation_ttl)
+                await pipe.execute()
+        except self._errors as e:
+            self.errors += 1
+            logger.error("Cache invalidation failed, entries expire after %ss: %s", self.ttl, e)
+
+    async def invalidate_user(self, user_token: str) -> None:
+        self.invalidations += 1
+        generation = self._key('usergen', user_token)
+        # The group keys of a user start with the JSON array opening of its token
+        prefix = self._key('group', user_token)[:-1] + ','
+        pattern = ''.join('\\' + c if c in '*?[]\\' else c for c in prefix) + '*'
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.incr(generation)
+                pipe.expire(generation, self._generation_ttl)
+                await pipe.execute()
+            keys = [key async for key in self._redis.scan_iter(match=pattern, count=1000)]
+            if keys:
+                await self._redis.delete(*keys)
+        except self._errors as e:
+            self.errors += 1
+            logger.error("Cache invalidation failed, entries expire after %ss: %s", self.ttl, e)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        del stats['max_entries'], stats['entries']
+        return stats
+
+    def _generation_keys(self, group: GroupKey) -> Tuple[str, str]:
+        return self._key('gen', *group), self._key('usergen', group[0])
+
+    async def _lookup(self, group: GroupKey, variant: str) -> Tuple[Optional[Any], Any]:
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.hget(self._key('group', *group), variant)
+                pipe.mget(*self._generation_keys(group))
+                value, generations = await pipe.execute()
+        except self._errors as e:
+            self.errors += 1
+            logger.error("Cache lookup failed: %s", e)
+            return None, None
+        return (json.loads(value) if value is not None else None), generations
+
+    def _release(self, group: GroupKey, stamp: Any) -> bool:
+        return stamp is not None
+
+    async def _store(self, group: GroupKey, variant: str, value: Any, stamp: Any) -> None:
+        if stamp is None:
+            return
+        key = self._key('group', *group)
+        generation_keys = self._generation_keys(group)
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(*generation_keys)
+                if await pipe.mget(*generation_keys) != stamp:
+                    return
+                pipe.multi()
+                pipe.hset(key, variant, json.dumps(value, default=_json_default))
+                pipe.expire(key, max(int(self.ttl), 1), nx=True)
+                await pipe.execute()
+        except self._watch_error:
+            pass  # Invalidated meanwhile
+        except self._errors as e:
+            self.errors += 1
+            logger.error("Cache store failed: %s", e)
+
+
+def _create_cache() -> ListingCache:
+    if CACHE_CONFIG['redis_url'] and CACHE_CONFIG['max_entries'] > 0:
+        return RedisListingCache(CACHE_CONFIG['redis_url'], CACHE_CONFIG['max_entries'], CACHE_CONFIG['ttl'])
+    return ListingCache(CACHE_CONFIG['max_entries'], CACHE_CONFIG['ttl'])
+
+# Listing cache, replaced by configure_cache
+listing_cache = _create_cache()
+
+def configure_cache(**overrides: Any) -> None:
+    """Override cache settings on startup. None values are ignored."""
+    global listing_cache
+    CACHE_CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+    listing_cache = _create_cache()
+
+async def cached(user_token: str, dir_id: Optional[str], variant: str,
+                 load: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+    """Return a cached response about a directory (None for the root level), or load it.
+
+    Requests for invalid directory IDs bypass the cache.
+    """
+    try:
+        group = (user_token, canonical_id(dir_id))
+    except ValueError:
+        return await load()
+    return await listing_cache.get_or_load(group, variant, load)
+
+async def invalidate(user_token: str, dir_ids: Iterable[Optional[str]]) -> None:
+    """Drop the cached responses about the given directories (None for the root level)."""
+    await listing_cache.invalidate((user_token, canonical_id(dir_id)) for dir_id in dir_ids)
+
+async def invalidate_user(user_token: str) -> None:
+    """Drop every cached response of a user, after writes whose extent is not known."""
+    await listing_cache.invalidate_user(user_token)
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Return hit, miss, eviction and invalidation counters of this process."""
+    return listing_cache.get_stats()
+
+async def close_cache() -> None:
+    await listing_cache.close()
@@ -1,15 +1,19 @@
 # Database utilities module for PostgreSQL connection management and operations.
-# Provides connection pooling and core database operations.
+# Provides an asyncio connection pool and core database operations.
 
+import logging
 import os
-import time
-from typing import Any, Dict, List, Optional, Tuple
-import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
-from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import RowFactory, dict_row
+from psycopg.types.string import TextBinaryLoader, TextLoader
+from psycopg_pool import AsyncConnectionPool, PoolClosed, PoolTimeout, TooManyRequests
+from contextlib import AsyncExitStack, asynccontextmanager
 from fastapi import HTTPException
 
+logger = logging.getLogger(__name__)
+
 class DatabaseError(Exception):
     """Base class for database-related errors."""
     def __init__(self, message: str, status_code: int = 500):
@@ -32,11 +36,20 @@ class DatabasePermissionError(DatabaseError):
     def __init__(self, message: str):
         super().__init__(message, status_code=403)
 
+class DatabaseUnavailableError(DatabaseError):
+    """Raised when no connection could be acquired from the pool in time."""
+    def __init__(self, message: str):
+        super().__init__(message, status_code=503)
+
 def handle_database_error(e: Exception) -> None:
     """Convert database errors to appropriate DatabaseError types."""
     error_msg = str(e).lower()
 
-    if "already exists" in error_msg or "name conflict" in error_msg:
+    if isinstance(e, (PoolTimeout, TooManyRequests, PoolClosed)):
+        raise DatabaseUnavailableError(f"Database connection unavailable: {e}")
+    elif (isinstance(e, psycopg.errors.UniqueViolation)
+          or "already exists" in error_msg or "name conflict" in error_msg):
+        # Writes leave name conflicts to the unique (user_token, parent_id, name) indexes
         raise DatabaseConflictError("Resource name already exists")
     elif "not found" in error_msg or "access denied" in error_msg:
         raise DatabaseNotFoundError(str(e))
@@ -49,97 +62,288 @@ def handle_database_error(e: Exception) -> None:
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
     'port': os.getenv('DB_PORT', '5432'),
-    'database': os.getenv('DB_NAME', 'prism_vfs'),
+    'dbname': os.getenv('DB_NAME', 'prism_vfs'),
     'user': os.getenv('DB_USER', 'prism_user'),
     'password': os.getenv('DB_PASSWORD', 'prism_password'),
 }
 
-# Connection pool configuration
-MIN_CONNECTIONS = 1
-MAX_CONNECTIONS = 10
-MAX_RETRIES = 3
-RETRY_DELAY = 1  # seconds
+# Connection pool configuration, overridable from the command line (see configure_pool)
+POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+    # Seconds a request waits in the queue for a free connection before failing
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+    # Maximum number of queued requests (0 = unbounded)
+    'max_waiting': int(os.getenv('DB_POOL_MAX_WAITING', '0')),
+    # Seconds after which a connection is closed and replaced
+    'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '3600')),
+    # Seconds an idle connection above min_size is kept open
+    'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '600')),
+}
+CONNECT_TIMEOUT = 30  # seconds
+
+# Connections opened on startup before the API reports ready (see warm_up_pool)
+POOL_WARMUP = int(os.getenv('DB_POOL_WARMUP', '1'))
+
+# Rows fetched per round trip when streaming through a server-side cursor
+STREAM_BATCH_SIZE = int(os.getenv('DB_STREAM_BATCH_SIZE', '1000'))
+
+# Whether connections prepare the queries they run (see Query). Disable behind a pooler
+# that does not keep prepared statements, such as PgBouncer before 1.21 in transaction mode.
+PREPARE_QUERIES = os.getenv('DB_PREPARE_QUERIES', 'true').lower() not in ('0', 'false', 'no')
+
+# Prepared statements kept per connection, room for every registered query with the
+# parameter type variations it is called with (None or a value)
+PREPARED_MAX = 256
 
 PUBLIC_USER_TOKEN = 'public'
 
-# Initialize connection pool
-try:
-    connection_pool = pool.SimpleConnectionPool(
-        MIN_CONNECTIONS,
-        MAX_CONNECTIONS,
-        **DB_CONFIG,
-        cursor_factory=RealDictCursor
+def scalar_row(cursor: psycopg.AsyncCursor) -> Callable[[Sequence[Any]], Any]:
+    """Row factory returning the value of the first column as the row."""
+    def make_row(values: Sequence[Any]) -> Any:
+        return values[0]
+    return make_row
+
+class Query:
+    """A query of the registry in vfs_api.queries.
+
+    A connection prepares the query the first time it runs it and executes the prepared
+    statement from then on, so Postgres parses and plans its text once per connection
+    instead of once per call. Results are transferred in binary format and built by
+    row_factory, scalar_row for queries returning one JSON document per row. JSON
+    values are returned as their text.
+    """
+    def __init__(self, sql: str, row_factory: RowFactory = dict_row):
+        self.sql = sql
+        self.row_factory = row_factory
+
+    async def execute(self, connection: psycopg.AsyncConnection, params: Optional[tuple]) -> psycopg.AsyncCursor:
+        cursor = connection.cursor(row_factory=self.row_factory)
+        return await cursor.execute(self.sql, params, prepare=PREPARE_QUERIES, binary=True)
+
+class JsonbTextBinaryLoader(TextBinaryLoader):
+    """Load binary jsonb as its text, after the format version byte."""
+    def load(self, data):
+        return super().load(bytes(data)[1:])
+
+async def _configure_connection(connection: psycopg.AsyncConnection) -> None:
+    connection.prepared_max = PREPARED_MAX
+    # JSON documents are returned as their text, which the routes send as is (see
+    # vfs_api.responses), instead of being parsed into Python objects
+    connection.adapters.register_loader('json', TextLoader)
+    connection.adapters.register_loader('json', TextBinaryLoader)
+    connection.adapters.register_loader('jsonb', TextLoader)
+    connection.adapters.register_loader('jsonb', JsonbTextBinaryLoader)
+
+def _create_pool() -> AsyncConnectionPool:
+    # Waiting requests are served in FIFO order, and connections are checked
+    # with a round trip before being handed out so dead ones get replaced.
+    return AsyncConnectionPool(
+        make_conninfo(**DB_CONFIG),
+        kwargs={'row_factory': dict_row, 'autocommit': True},
+        configure=_configure_connection,
+        check=AsyncConnectionPool.check_connection,
+        name='vfs',
+        open=False,
+        **POOL_CONFIG,
     )
-except psycopg2.Error as e:
-    raise Exception(f"Failed to initialize connection pool: {e}")
 
-@contextmanager
-def get_connection():
-    """Get a database connection from the pool."""
-    connection = None
-    retry_count = 0
+# Connection pool, created and opened on application startup (see open_pool)
+connection_pool: Optional[AsyncConnectionPool] = None
 
-    while retry_count < MAX_RETRIES:
-        try:
-            connection = connection_pool.getconn()
-            yield connection
-            break
-        except psycopg2.Error as e:
-            retry_count += 1
-            if retry_count == MAX_RETRIES:
-                raise Exception(f"Failed to get database connection after {MAX_RETRIES} attempts: {e}")
-            time.sleep(RETRY_DELAY)
-        finally:
-            if connection:
-                connection_pool.putconn(connection)
-
-@contextmanager
-def get_cursor():
-    """Get a database cursor using a connection from the pool."""
-    with get_connection() as connection:
-        cursor = connection.cursor()
+def configure_pool(warmup: Optional[int] = None, **overrides: Any) -> None:
+    """Override pool settings before the pool is opened. None values are ignored."""
+    global POOL_WARMUP
+    if warmup is not None:
+        POOL_WARMUP = warmup
+    POOL_CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+
+async def open_pool():
+    """Create and open the connection pool.
+
+    Does not wait for the database: the pool opens its connections in the background,
+    and requests wait for one up to the pool timeout. See warm_up_pool.
+    """
+    global connection_pool
+    connection_pool = _create_pool()
+    await connection_pool.open(wait=False)
+
+async def warm_up_pool(connections: Optional[int] = None) -> None:
+    """Wait until the pool has opened POOL_WARMUP connections, or the given number (at least one).
+
+    The connections are checked out together, so that the pool opens as many, and each
+    one is checked with a round trip. Waits for the database as long as it takes.
+    Connections above the pool's min_size are closed again after max_idle.
+    """
+    if connections is None:
+        connections = POOL_WARMUP
+    connections = min(max(connections, 1), POOL_CONFIG['max_size'])
+    while True:
         try:
-            yield cursor
-            connection.commit()
-        except Exception:
-            connection.rollback()
-            raise
-        finally:
-            cursor.close()
-
-async def execute_query(query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
+            async with AsyncExitStack() as stack:
+                for _ in range(connections):
+                    await stack.enter_async_context(connection_pool.connection(timeout=CONNECT_TIMEOUT))
+            return
+        except PoolTimeout as e:
+            logger.error("Database not available yet: %s", e)
+
+async def check_pool(timeout: float) -> bool:
+    """Return whether a connection can be checked out of the pool within timeout seconds."""
+    if connection_pool is None:
+        return False
+    try:
+        async with connection_pool.connection(timeout=timeout):
+            return True
+    except (PoolTimeout, TooManyRequests, PoolClosed, psycopg.Error):
+        return False
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Return current pool usage and cumulative wait statistics."""
+    stats = connection_pool.get_stats() if connection_pool else {}
+    size = stats.get('pool_size', 0)
+    idle = stats.get('pool_available', 0)
+    queued = stats.get('requests_queued', 0)
+    wait_ms = stats.get('requests_wait_ms', 0)
+    return {
+        'min_size': stats.get('pool_min', POOL_CONFIG['min_size']),
+        'max_size': stats.get('pool_max', POOL_CONFIG['max_size']),
+        'warmup': POOL_WARMUP,
+        'size': size,
+        'in_use': size - idle,
+        'idle': idle,
+        'waiting': stats.get('requests_waiting', 0),
+        'requests': stats.get('requests_num', 0),
+        'requests_queued': queued,
+        'wait_ms_total': wait_ms,
+        'wait_ms_avg': round(wait_ms / queued, 2) if queued else 0.0,
+        'timeouts': stats.get('requests_errors', 0),
+        'connections_opened': stats.get('connections_num', 0),
+        'connections_errors': stats.get('connections_errors', 0),
+        'connections_lost': stats.get('connections_lost', 0),
+    }
+
+@asynccontextmanager
+async def get_connection():
+    """Get a database connection from the pool.
+
+    Connections are in autocommit mode, so a single statement is its own
+    transaction and costs one round trip. Use connection.transaction() to group
+    several statements.
+    """
+    if connection_pool is None:
+        raise DatabaseUnavailableError("Database connection pool is not open")
+    async with connection_pool.connection() as connection:
+        yield connection
+
+async def execute_query(query: Query, params: Optional[tuple] = None) -> List[Any]:
     """Execute a single query and return the results."""
-    with get_cursor() as cursor:
-        try:
-            cursor.execute(query, params)
-            if cursor.description:
-                return cursor.fetchall()
-            return []
-        except psycopg2.Error as e:
-            handle_database_error(e)
-
-async def execute_transaction(queries_and_params: List[Tuple[str, Optional[tuple]]]) -> List[List[Dict[str, Any]]]:
-    """Execute multiple queries in a single transaction."""
+    try:
+        async with get_connection() as connection:
+            async with await query.execute(connection, params) as cursor:
+                if cursor.description:
+                    return await cursor.fetchall()
+                return []
+    except psycopg.Error as e:
+        handle_database_error(e)
+
+async def execute_transaction(queries_and_params: List[Tuple[Query, Optional[tuple]]]) -> List[List[Any]]:
+    """Execute multiple queries in a single transaction.
+
+    The queries are pipelined: they are all sent before the first result is read, so
+    the whole transaction costs one round trip plus the commit.
+    """
     results = []
-    with get_connection() as connection:
-        with connection.cursor() as cursor:
-            try:
-                for query, params in queries_and_params:
-                    cursor.execute(query, params)
-                    if cursor.description:
-                        results.append(cursor.fetchall())
-                    else:
-                        results.append([])
-                connection.commit()
-            except psycopg2.Error as e:
-                connection.rollback()
-                handle_database_error(e)
-            except Exception as e:
-                connection.rollback()
-                raise DatabaseError(str(e))
+    try:
+        async with get_connection() as connection, connection.transaction():
+            async with connection.pipeline():
+                cursors = [await query.execute(connection, params) for query, params in queries_and_params]
+            for cursor in cursors:
+                if cursor.description:
+                    results.append(await cursor.fetchall())
+                else:
+                    results.append([])
+    except psycopg.Error as e:
+        handle_database_error(e)
+    except DatabaseError:
+        raise
+    except Exception as e:
+        raise DatabaseError(str(e))
+    return results
+
+async def execute_best_effort(queries_and_params: List[Tuple[Query, Optional[tuple]]]) -> List[Union[List[Any], DatabaseError]]:
+    """Execute multiple queries in a single transaction, each in its own savepoint.
+
+    A failing query is rolled back alone and its DatabaseError is returned in place of
+    its rows, the others are committed. The queries are pipelined with their savepoint
+    commands and synced once, so the batch costs one round trip. Postgres skips what
+    follows an error until the sync, so each failing query costs one more round trip,
+    which rolls it back and sends the queries after it again.
+    """
+    results: List[Union[List[Any], DatabaseError]] = [[] for _ in queries_and_params]
+    pending = list(enumerate(queries_and_params))
+    try:
+        async with get_connection() as connection, connection.transaction(), connection.pipeline() as pipeline:
+            while pending:
+                cursors = []
+                try:
+                    for _, (query, params) in pending:
+                        await connection.execute("SAVEPOINT best_effort", prepare=False)
+                        cursors.append(await query.execute(connection, params))
+                        await connection.execute("RELEASE SAVEPOINT best_effort", prepare=False)
+                    await pipeline.sync()
+                    failed = None
+                except psycopg.Error as e:
+                    # The error can surface while later commands are still being queued, and
+                    # the skipped commands then fail the sync that ends the aborted pipeline
+                    failed = e
+                    try:
+                        await pipeline.sync()
+                    except psycopg.errors.PipelineAborted:
+                        pass
+                # The queries before the failing one got their results, the ones after it were skipped
+                done = 0
+                for (i, _), cursor in zip(pending, cursors):
+                    if cursor.pgresult is None:
+                        break
+                    results[i] = await cursor.fetchall() if cursor.description else []
+                    done += 1
+                if failed is None:
+                    break
+                if done == len(pending):
+                    raise failed
+                try:
+                    handle_database_error(failed)
+                except DatabaseError as error:
+                    results[pending[done][0]] = error
+                await connection.execute("ROLLBACK TO SAVEPOINT best_effort", prepare=False)
+                await connection.execute("RELEASE SAVEPOINT best_effort", prepare=False)
+                pending = pending[done + 1:]
+    except psycopg.Error as e:
+        handle_database_error(e)
     return results
 
-def close_pool():
-    """Close the connection pool."""
+async def stream_query(queries_and_params: List[Tuple[Query, Optional[tuple]]],
+                       batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[List[Any]]:
+    """Execute queries one after the other through server-side cursors and yield their rows in batches.
+
+    Only one batch is held in memory at a time. The connection stays checked out of
+    the pool until the iterator is exhausted or closed. Cursors are declared rather
+    than prepared, their results are still transferred in binary format.
+    """
+    try:
+        async with get_connection() as connection, connection.transaction():
+            for i, (query, params) in enumerate(queries_and_params):
+                async with connection.cursor(name=f"stream_{i}", row_factory=query.row_factory) as cursor:
+                    await cursor.execute(query.sql, params, binary=True)
+                    while batch := await cursor.fetchmany(batch_size):
+                        yield batch
+    except psycopg.Error as e:
+        handle_database_error(e)
+
+async def close_pool():
+    """Close the connection pool, on shutdown once the requests in flight have drained.
+
+    Connections still checked out are closed when they are returned.
+    """
     if connection_pool:
-        connection_pool.closeall()
\ No newline at end of file
+        await connection_pool.close()
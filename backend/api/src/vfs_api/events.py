@@ -0,0 +1,117 @@
+# Wake-ups for the change feed.
+# Writes record their changes in the change_events table and notify the change_events
+# channel with the user token on commit (see change_events_record). One connection per
+# process listens to the channel and wakes up the event streams of that user, which then
+# read the new events from the table. Streams do not hold a pooled connection while waiting.
+
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Set
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+
+from vfs_api.db_utils import CONNECT_TIMEOUT, DB_CONFIG
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'change_events'
+
+# Seconds before listening again after the connection failed
+RECONNECT_DELAY = 1.0
+
+
+class ChangeNotifier:
+    """Wakes up the subscribers of a user when the database notifies a change of theirs.
+
+    The listening connection is opened by the first subscription. Notifications sent while
+    it was not listening are lost, so every subscriber is woken up once it listens (again),
+    to look for changes it may have missed.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.listening = False
+        self.notifications = 0
+        self.reconnects = 0
+
+    @contextmanager
+    def subscribe(self, user_token: str) -> Iterator[asyncio.Event]:
+        """Return an event set whenever the user's changes may have been recorded.
+
+        Subscribers clear it before reading the new changes, so none is missed in between.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+        waiter = asyncio.Event()
+        self._waiters.setdefault(user_token, set()).add(waiter)
+        try:
+            yield waiter
+        finally:
+            waiters = self._waiters[user_token]
+            waiters.discard(waiter)
+            if not waiters:
+                del self._waiters[user_token]
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'listening': self.listening,
+            'streams': sum(len(waiters) for waiters in self._waiters.values()),
+            'notifications': self.notifications,
+            'reconnects': self.reconnects,
+        }
+
+    def _wake(self, user_token: Optional[str] = None) -> None:
+        if user_token is None:
+            groups = list(self._waiters.values())
+        else:
+            groups = [self._waiters.get(user_token, ())]
+        for waiters in groups:
+            for waiter in waiters:
+                waiter.set()
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                connection = await psycopg.AsyncConnection.connect(
+                    make_conninfo(**DB_CONFIG), autocommit=True, connect_timeout=CONNECT_TIMEOUT
+                )
+                async with connection:
+                    await connection.execute(f"LISTEN {CHANNEL}")
+                    self.listening = True
+                    self._wake()
+                    async for notify in connection.notifies():
+                        self.notifications += 1
+                        self._wake(notify.payload)
+            except psycopg.Error as e:
+                logger.error("Change feed listener failed, reconnecting in %ss: %s", RECONNECT_DELAY, e)
+            finally:
+                self.listening = False
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+# Listener of this process
+notifier = ChangeNotifier()
+
+def subscribe(user_token: str):
+    """Subscribe to the change notifications of a user, see ChangeNotifier.subscribe."""
+    return notifier.subscribe(user_token)
+
+def get_events_stats() -> Dict[str, Any]:
+    """Return the listener state, open streams and notifications received by this process."""
+    return notifier.get_stats()
+
+async def close_notifier() -> None:
+    await notifier.close()
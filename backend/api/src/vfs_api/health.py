@@ -0,0 +1,91 @@
+# Liveness and readiness of the API process, and its startup timings.
+# Startup does not wait for the database: the pool is opened without waiting for its
+# connections, so the process is live, answering /health, as soon as it serves requests.
+# It is ready, answering /ready, once the pool has opened its warm-up connections (see
+# db_utils.warm_up_pool) and while the pool reaches the database. Probes do not wait for a
+# connection: under load, they would fail while the database is up.
+# Timings are in seconds since the process imported the package, or since it was forked
+# as a worker.
+
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from vfs_api import STARTED_AT
+from vfs_api.db_utils import check_pool, get_pool_stats, warm_up_pool
+
+# Seconds a readiness probe waits for a connection, when an idle one fails its check
+READY_TIMEOUT = 2.0
+
+STARTUP = {
+    'started_at': STARTED_AT,
+    # Seconds until the application served requests
+    'serving_s': None,
+    # Seconds until the pool was warm
+    'ready_s': None,
+}
+
+_warmup: Optional[asyncio.Task] = None
+
+# Connection attempts of the pool (made, failed) when last probed, and the verdict
+_attempts = (0, 0)
+_reachable = True
+
+def restart_clock() -> None:
+    """Time the startup from now, in a worker forked from the process that imported this module."""
+    STARTUP.update(started_at=time.monotonic(), serving_s=None, ready_s=None)
+
+def _elapsed() -> float:
+    return round(time.monotonic() - STARTUP['started_at'], 3)
+
+async def _warm_up() -> None:
+    await warm_up_pool()
+    STARTUP['ready_s'] = _elapsed()
+
+def start_warmup() -> None:
+    """Record that the application serves requests, and warm up the pool in the background."""
+    global _warmup
+    STARTUP['serving_s'] = _elapsed()
+    _warmup = asyncio.create_task(_warm_up())
+
+async def stop_warmup() -> None:
+    if _warmup and not _warmup.done():
+        _warmup.cancel()
+        try:
+            await _warmup
+        except asyncio.CancelledError:
+            pass
+
+async def _database_reachable() -> bool:
+    """Return whether the pool reaches the database, without queueing behind requests.
+
+    An idle connection is checked out, which checks it with a round trip. With every
+    connection in use, the pool's connection attempts since the previous probe tell: the
+    database is unreachable if they all failed, and the verdict stands if there were none.
+    """
+    global _attempts, _reachable
+    pool = get_pool_stats()
+    if pool['idle']:
+        _reachable = await check_pool(READY_TIMEOUT)
+    else:
+        made = pool['connections_opened'] - _attempts[0]
+        failed = pool['connections_errors'] - _attempts[1]
+        if made:
+            _reachable = failed < made
+    _attempts = (pool['connections_opened'], pool['connections_errors'])
+    return _reachable
+
+async def readiness() -> Tuple[int, Dict[str, Any]]:
+    """Return the status code and body of the readiness probe."""
+    if STARTUP['ready_s'] is None:
+        return 503, {"status": "starting", **get_startup_stats()}
+    if not await _database_reachable():
+        return 503, {"status": "database unavailable", **get_startup_stats()}
+    return 200, {"status": "ready", **get_startup_stats()}
+
+def get_startup_stats() -> Dict[str, Any]:
+    """Return the startup timings of this process."""
+    return {
+        'serving_s': STARTUP['serving_s'],
+        'ready_s': STARTUP['ready_s'],
+    }
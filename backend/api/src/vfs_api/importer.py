@@ -0,0 +1,199 @@
+"""
+Bulk import of path manifests.
+
+A manifest lists one entry per line, either as NDJSON objects:
+
+    {"path": "photos/2024/beach.jpg", "storage_id": "s3://...", "metadata": {"size": 1024}, "tags": ["holiday"]}
+    {"path": "photos/empty", "type": "directory"}
+
+or as CSV rows with the columns path, storage_id, metadata (JSON) and tags (separated by ';'):
+
+    photos/2024/beach.jpg,s3://...,"{""size"": 1024}",holiday
+
+Paths are relative to the directory the manifest is imported into, a trailing '/' marks a
+directory. The entries are loaded into a staging table with COPY, and import_apply creates
+the missing directories, the files and their tags set-wise in the same transaction.
+
+Usage:
+    vfs-import manifest.ndjson --parent_id <uuid> --user_token <token>
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import sys
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import psycopg
+
+from vfs_api.db_utils import DatabaseError, get_connection, handle_database_error, open_pool, close_pool
+
+MANIFEST_FORMATS = ('ndjson', 'csv')
+
+class ManifestError(ValueError):
+    """Raised when a manifest line cannot be parsed."""
+    def __init__(self, line_number: int, message: str):
+        self.message = f"Manifest line {line_number}: {message}"
+        super().__init__(self.message)
+
+# Row of the staging table: (path components, is directory, storage_id, metadata JSON, tags)
+StagingRow = Tuple[List[str], bool, Optional[str], Optional[str], Optional[List[str]]]
+
+def parse_path(path: Any) -> Tuple[List[str], bool]:
+    """Split a manifest path into its components, and whether it names a directory."""
+    if not isinstance(path, str) or not path.strip('/'):
+        raise ValueError("path must be a non-empty string")
+    parts = path.strip('/').split('/')
+    if any(part in ('', '.', '..') for part in parts):
+        raise ValueError(f"invalid path {path!r}")
+    return parts, path.endswith('/')
+
+def parse_ndjson_line(line: str) -> Optional[StagingRow]:
+    entry = json.loads(line)
+    if not isinstance(entry, dict):
+        raise ValueError("entry must be a JSON object")
+    parts, is_dir = parse_path(entry.get('path'))
+    is_dir = is_dir or entry.get('type') == 'directory'
+    metadata = entry.get('metadata')
+    tags = entry.get('tags')
+    if metadata is not None and not isinstance(metadata, dict):
+        raise ValueError("metadata must be an object")
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(tag, str) for tag in tags)):
+        raise ValueError("tags must be a list of strings")
+    return (parts, is_dir, entry.get('storage_id'), json.dumps(metadata) if metadata is not None else None, tags)
+
+def parse_csv_line(line: str) -> Optional[StagingRow]:
+    fields = next(csv.reader([line])) + ['', '', '']
+    path, storage_id, metadata = fields[:3]
+    if path == 'path' and storage_id == 'storage_id':  # Header
+        return None
+    parts, is_dir = parse_path(path)
+    if metadata and not isinstance(json.loads(metadata), dict):
+        raise ValueError("metadata must be an object")
+    tags = [tag for tag in fields[3].split(';') if tag]
+    return (parts, is_dir, storage_id or None, metadata or None, tags or None)
+
+async def parse_manifest(lines: AsyncIterator[str], manifest_format: str) -> AsyncIterator[StagingRow]:
+    """Yield the staging rows of a manifest, skipping blank lines.
+
+    A CSV entry goes on over the next lines while one of its quoted fields is open, so
+    quoted fields may hold newlines. Errors name the first line of the entry.
+    """
+    parse_line = parse_csv_line if manifest_format == 'csv' else parse_ndjson_line
+    line_number = 0
+    entry_lines: List[str] = []
+    quotes = 0
+    async for line in lines:
+        line_number += 1
+        entry_lines.append(line)
+        if manifest_format == 'csv':
+            quotes += line.count('"')
+            if quotes % 2:
+                continue
+        entry = '\n'.join(entry_lines)
+        first_line = line_number - len(entry_lines) + 1
+        entry_lines, quotes = [], 0
+        if not entry.strip():
+            continue
+        try:
+            row = parse_line(entry)
+        except (ValueError, csv.Error) as e:
+            raise ManifestError(first_line, str(e))
+        if row is not None:
+            yield row
+    if entry_lines:
+        raise ManifestError(line_number - len(entry_lines) + 1, "unterminated quoted field")
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a stream of byte chunks into lines, decoded as UTF-8."""
+    buffer = b''
+    line_number = 0
+
+    def decode(line: bytes) -> str:
+        try:
+            return line.decode()
+        except UnicodeDecodeError as e:
+            raise ManifestError(line_number, f"invalid UTF-8 at byte {e.start}")
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line_number += 1
+            yield decode(line)
+    if buffer:
+        line_number += 1
+        yield decode(buffer)
+
+async def import_manifest(lines: AsyncIterator[str], manifest_format: str,
+                          parent_id: Optional[str], user_token: str) -> Dict[str, int]:
+    """Import a manifest into a directory (or the root level) in one transaction.
+
+    Returns the number of directories and files created (directories_created,
+    files_created), and of files skipped because their name was taken (files_skipped).
+    """
+    try:
+        async with get_connection() as connection, connection.transaction():
+            async with connection.cursor() as cursor:
+                await cursor.execute(
+                    """
+                    CREATE TEMP TABLE import_staging (
+                        path TEXT[] NOT NULL,
+                        is_dir BOOLEAN NOT NULL,
+                        storage_id TEXT,
+                        metadata JSONB,
+                        tags TEXT[]
+                    ) ON COMMIT DROP
+                    """
+                )
+                async with cursor.copy(
+                    "COPY import_staging (path, is_dir, storage_id, metadata, tags) FROM STDIN"
+                ) as copy:
+                    async for row in parse_manifest(lines, manifest_format):
+                        await copy.write_row(row)
+                await cursor.execute("SELECT * FROM import_apply(%s, %s)", (parent_id, user_token))
+                return await cursor.fetchone()
+    except psycopg.Error as e:
+        handle_database_error(e)
+
+
+########################
+#  Command line
+########################
+
+async def iter_file_lines(file: Iterable[str]) -> AsyncIterator[str]:
+    for line in file:
+        yield line.rstrip('\r\n')
+
+async def run_import(args) -> Dict[str, int]:
+    await open_pool()
+    try:
+        if args.manifest == '-':
+            return await import_manifest(iter_file_lines(sys.stdin), args.format, args.parent_id, args.user_token)
+        with open(args.manifest, encoding='utf-8') as file:
+            return await import_manifest(iter_file_lines(file), args.format, args.parent_id, args.user_token)
+    finally:
+        await close_pool()
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a path manifest into the VFS database")
+    parser.add_argument("manifest", type=str, help="Manifest file, or - for standard input")
+    parser.add_argument("--format", choices=MANIFEST_FORMATS, default=None,
+                        help="Manifest format (default: from the file extension, else ndjson)")
+    parser.add_argument("--parent_id", type=str, default=None,
+                        help="Directory to import into (default: the root level)")
+    parser.add_argument("--user_token", type=str, default='public',
+                        help="User token owning the imported items")
+    args = parser.parse_args()
+    if args.format is None:
+        args.format = 'csv' if args.manifest.endswith('.csv') else 'ndjson'
+
+    try:
+        result = asyncio.run(run_import(args))
+    except (ManifestError, DatabaseError) as e:
+        sys.exit(f"Import failed: {e}")
+    print(json.dumps(result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+# Registry of the queries run by the routes.
+# Every query is a Query (see db_utils), prepared by each connection on its first execution
+# and returning its results in binary format. Queries whose rows are a single JSON document
+# use scalar_row, so that the rows are the documents themselves.
+# The documents are built in the shape of the routes' response models, to be sent as they are
+# (see vfs_api.responses). Routes needing some of their fields, such as the parent to drop
+# from the cache, get them as columns of their own.
+
+from vfs_api.db_utils import Query, scalar_row
+
+########################
+#  Directories
+########################
+
+# Version of a listing and one page of its items, read from the same snapshot. One extra
+# item is fetched to find out whether there is a next page, whose cursor is the keyset
+# (type, name, id) of the last item of the page, as URL-safe base64 encoded JSON.
+DIRECTORY_LIST_PAGE = Query(
+    """
+    WITH page AS (
+        SELECT p.type, p.id, p.name, p.created_at, p.ordinality
+        FROM directory_list_page(
+            %(parent_id)s, %(user_token)s, %(limit)s + 1, %(after_type)s, %(after_name)s, %(after_id)s
+        ) WITH ORDINALITY p
+    )
+    SELECT
+        v.version,
+        json_build_object(
+            'directories', COALESCE((
+                SELECT json_agg(json_build_object('id', id, 'name', name, 'created_at', created_at) ORDER BY ordinality)
+                FROM page
+                WHERE type = 'directory'
+                    AND ordinality <= %(limit)s
+            ), '[]'),
+            'files', COALESCE((
+                SELECT json_agg(json_build_object('id', id, 'name', name, 'created_at', created_at) ORDER BY ordinality)
+                FROM page
+                WHERE type = 'file'
+                    AND ordinality <= %(limit)s
+            ), '[]'),
+            'next_cursor', (
+                SELECT translate(
+                    encode(convert_to(json_build_array(type, name, id)::text, 'UTF8'), 'base64'),
+                    E'+/\\n', '-_'
+                )
+                FROM page
+                WHERE ordinality = %(limit)s
+                    AND EXISTS (SELECT FROM page WHERE ordinality > %(limit)s)
+            ),
+            'version', v.version
+        ) AS page
+    FROM directory_version(%(parent_id)s, %(user_token)s) v(version)
+    """
+)
+
+DIRECTORY_LISTD_ROWS = Query(
+    "SELECT row_to_json(r)::text FROM directory_listd_rows(%s, %s) r", scalar_row
+)
+
+DIRECTORY_LISTF_ROWS = Query(
+    "SELECT row_to_json(r)::text FROM directory_listf_rows(%s, %s) r", scalar_row
+)
+
+DIRECTORY_TREE = Query(
+    """
+    SELECT json_build_object('items', json_build_object('tree', t.tree), 'truncated', t.truncated)
+    FROM directory_tree(%s, %s, %s, %s) t
+    """,
+    scalar_row
+)
+
+DIRECTORY_DETAILS = Query(
+    """
+    SELECT d.directory_details AS details, (d.directory_details->>'version')::bigint AS version
+    FROM directory_details(%s, %s) d
+    """
+)
+
+DIRECTORY_STATS = Query("SELECT directory_stats FROM directory_stats(%s, %s)", scalar_row)
+
+DIRECTORY_CREATE = Query(
+    """
+    SELECT c.directory_details AS details, c.directory_details->>'parent_id' AS parent_id
+    FROM directory_create(%s, %s, %s) c
+    """
+)
+
+DIRECTORY_UPDATE = Query(
+    """
+    SELECT u.directory_details AS details, u.directory_details->>'parent_id' AS parent_id
+    FROM directory_update(%s, %s, %s, %s) u
+    """
+)
+
+# A statement reads the tables as of its start, so previous_parent_id is the parent from
+# before the update
+DIRECTORY_UPDATE_FROM_PARENT = Query(
+    """
+    WITH previous AS (SELECT parent_id FROM directories WHERE id = %s AND user_token = %s)
+    SELECT
+        u.directory_details AS details,
+        u.directory_details->>'id' AS id,
+        u.directory_details->>'parent_id' AS parent_id,
+        (SELECT parent_id::text FROM previous) AS previous_parent_id
+    FROM directory_update(%s, %s, %s, %s) u
+    """
+)
+
+DIRECTORY_COPY = Query(
+    """
+    SELECT c.directory_details AS details, c.directory_details->>'parent_id' AS parent_id
+    FROM directory_copy(%s, %s, %s) c
+    """
+)
+
+DIRECTORY_DELETE = Query("SELECT directory_delete(%s, %s, %s)")
+
+# The parent and the deleted subtree, read as of before the delete
+DIRECTORY_DELETE_SUBTREE = Query(
+    """
+    WITH previous AS (
+        SELECT
+            d.parent_id::text AS parent_id,
+            ARRAY(SELECT s.id::text FROM directories s WHERE s.path @> ARRAY[d.id]) AS subtree
+        FROM directories d
+        WHERE d.id = %s
+            AND d.user_token = %s
+    )
+    SELECT previous.*
+    FROM directory_delete(%s, %s, %s)
+    LEFT JOIN previous ON true
+    """
+)
+
+########################
+#  Files
+########################
+
+FILE_DETAILS = Query(
+    """
+    SELECT d.file_details AS details, (d.file_details->>'version')::bigint AS version
+    FROM file_details(%s, %s) d
+    """
+)
+
+FILE_CREATE = Query(
+    """
+    SELECT c.file_details AS details, c.file_details->>'parent_id' AS parent_id
+    FROM file_create(%s, %s, %s, %s, %s::jsonb) c
+    """
+)
+
+FILE_UPDATE = Query(
+    """
+    SELECT u.file_details AS details, u.file_details->>'parent_id' AS parent_id
+    FROM file_update(%s, %s, %s, %s::jsonb, %s, %s) u
+    """
+)
+
+# previous_parent_id is read as of the start of the statement, before the update
+FILE_UPDATE_FROM_PARENT = Query(
+    """
+    WITH previous AS (SELECT parent_id FROM files WHERE id = %s AND user_token = %s)
+    SELECT
+        u.file_details AS details,
+        u.file_details->>'parent_id' AS parent_id,
+        (SELECT parent_id::text FROM previous) AS previous_parent_id
+    FROM file_update(%s, %s, %s, %s::jsonb, %s, %s) u
+    """
+)
+
+FILE_COPY = Query(
+    """
+    SELECT c.file_details AS details, c.file_details->>'parent_id' AS parent_id
+    FROM file_copy(%s, %s, %s) c
+    """
+)
+
+FILE_DELETE = Query("SELECT file_delete(%s, %s)")
+
+# The parent, read as of before the delete
+FILE_DELETE_PARENT = Query(
+    """
+    WITH previous AS (SELECT parent_id, true AS found FROM files WHERE id = %s AND user_token = %s)
+    SELECT previous.parent_id::text AS parent_id, previous.found
+    FROM file_delete(%s, %s)
+    LEFT JOIN previous ON true
+    """
+)
+
+########################
+#  Tags
+########################
+
+FILE_TAGS_ADD = Query("SELECT tags FROM file_tags_add(%s, %s, %s)", scalar_row)
+
+FILE_TAGS_REMOVE = Query("SELECT tags FROM file_tags_remove(%s, %s, %s)", scalar_row)
+
+FILE_TAGS_SET = Query("SELECT tags FROM file_tags_set(%s, %s, %s)", scalar_row)
+
+TAGS_LIST = Query(
+    """
+    SELECT json_build_object(
+        'names', COALESCE(json_agg(t.name ORDER BY t.ordinality), '[]'),
+        'ids', COALESCE(json_agg(t.id ORDER BY t.ordinality), '[]')
+    )
+    FROM tags_list(%s) WITH ORDINALITY t
+    """,
+    scalar_row
+)
+
+########################
+#  Search
+########################
+
+ITEM_SEARCH = Query(
+    """
+    SELECT json_build_object('directories', s.directories, 'files', s.files)
+    FROM item_search(%s, %s, %s, %s, %s::jsonb, %s) s
+    """,
+    scalar_row
+)
+
+DIRECTORY_SEARCH_ROWS = Query(
+    "SELECT row_to_json(r)::text FROM directory_search_rows(%s, %s, %s) r", scalar_row
+)
+
+FILE_SEARCH_ROWS = Query(
+    "SELECT row_to_json(r)::text FROM file_search_rows(%s, %s, %s, %s::jsonb, %s) r", scalar_row
+)
+
+ITEM_FULLTEXT_SEARCH = Query(
+    """
+    SELECT json_build_object('directories', s.directories, 'files', s.files)
+    FROM item_fulltext_search(%s, %s, %s, %s, %s::jsonb, %s, %s, %s) s
+    """,
+    scalar_row
+)
+
+DIRECTORY_FULLTEXT_ROWS = Query(
+    "SELECT row_to_json(r)::text FROM directory_fulltext_rows(%s, %s, %s, %s, %s) r", scalar_row
+)
+
+FILE_FULLTEXT_ROWS = Query(
+    "SELECT row_to_json(r)::text FROM file_fulltext_rows(%s, %s, %s, %s::jsonb, %s, %s, %s) r",
+    scalar_row
+)
+
+########################
+#  Sync and change feed
+########################
+
+SYNC_CHANGES = Query(
+    """
+    SELECT
+        json_build_object('next_cursor', s.next_cursor, 'has_more', s.has_more, 'changes', s.changes) AS body,
+        (SELECT seq FROM change_events_pruned WHERE user_token = %s) AS pruned_seq
+    FROM sync_changes(%s, %s, %s, %s) s
+    """
+)
+
+# Where a change feed starts: the last event, the pruned events and the streamed subtree
+CHANGE_EVENTS_START = Query(
+    """
+    SELECT
+        (SELECT COALESCE(max(seq), 0) FROM change_events WHERE user_token = %s) AS last_seq,
+        (SELECT seq FROM change_events_pruned WHERE user_token = %s) AS pruned_seq,
+        (SELECT path FROM directories WHERE id = %s AND user_token = %s) AS root_path
+    """
+)
+
+CHANGE_EVENTS_LIST = Query(
+    """
+    SELECT e.seq, e.op, e.id::text, row_to_json(e)::text AS json
+    FROM change_events_list(%s, %s, %s, %s) e
+    """
+)
@@ -0,0 +1,44 @@
+# JSON responses built by the database.
+# The database functions and the registered queries (see vfs_api.queries) build the JSON
+# documents in the exact shape of the routes' response models, and connections return
+# them as their text. Routes send that text as the response body, as is: it is neither
+# parsed, nor validated against the response model, nor serialized again. With
+# validate_responses set, a debugging aid, the text is parsed and returned to FastAPI
+# instead, which validates it against the response model and serializes it.
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+
+# Response configuration, overridable from the command line (see configure_responses)
+RESPONSE_CONFIG = {
+    # Validate the database's JSON against the response models
+    'validate': os.getenv('API_VALIDATE_RESPONSES', 'false').lower() in ('1', 'true', 'yes'),
+}
+
+def configure_responses(validate: Optional[bool] = None) -> None:
+    """Override response settings. None values are ignored."""
+    if validate is not None:
+        RESPONSE_CONFIG['validate'] = validate
+
+
+class JSONTextResponse(Response):
+    """Response whose body is JSON text sent as is."""
+    media_type = "application/json"
+
+
+def json_response(text: str, headers: Optional[Dict[str, str]] = None) -> Any:
+    """Return a JSON document's text as the response, or parse it to be validated.
+
+    The headers are those of the passthrough response, routes set them on their
+    Response parameter for validated responses.
+    """
+    if RESPONSE_CONFIG['validate']:
+        return json.loads(text)
+    return JSONTextResponse(text, headers=headers)
+
+def json_value(value: Any) -> str:
+    """Return a Python value as JSON text, to be combined with documents from the database."""
+    return json.dumps(value, separators=(",", ":"))
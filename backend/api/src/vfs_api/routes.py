@@ -1,47 +1,155 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Literal, Optional
+import asyncio
+import base64
+import binascii
 import uuid
 import json
-from vfs_api.db_utils import execute_query, DatabaseError, DatabaseNotFoundError
+from vfs_api.db_utils import execute_query, execute_transaction, execute_best_effort, stream_query, DatabaseError, DatabaseNotFoundError
+from vfs_api.importer import ManifestError, import_manifest, iter_lines
+from vfs_api.responses import json_response, json_value
+import vfs_api.cache as cache
+import vfs_api.events as events
+import vfs_api.queries as queries
 import vfs_api.schemas as schemas
 
 router = APIRouter()
 
-########################
-#  Directory Routes
-########################
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Matches returned per type by a full-text search without an explicit limit
+SEARCH_DEFAULT_LIMIT = 100
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    return accept is not None and NDJSON_MEDIA_TYPE in accept
+
+async def ndjson_response(batches: AsyncIterator[list]) -> StreamingResponse:
+    """Stream row batches as newline-delimited JSON, one object per row.
+
+    Each row is its JSON text, built by Postgres with row_to_json() so the API
+    only concatenates strings. The first batch is fetched before the response
+    starts, so that query errors still produce a regular error status instead of
+    a truncated 200.
+    """
+    try:
+        first = await anext(batches, [])
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+    async def body():
+        batch = first
+        while batch:
+            yield "".join(row + "\n" for row in batch)
+            batch = await anext(batches, [])
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
+
+
+# Conditional GETs: listings and details carry their version as a strong ETag, and a request
+# whose If-None-Match still matches it gets an empty 304 instead of the body. no-cache makes
+# browsers revalidate their copy this way instead of reusing it unchecked.
+CACHE_CONTROL = "private, no-cache"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+def conditional_response(body: str, version: Optional[int], if_none_match: Optional[str], response: Response):
+    """Return the JSON body with its version as ETag, or a 304 if the client has that version."""
+    if version is None:
+        return json_response(body)
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return json_response(body, headers)
+
+
+# Listing cursors are opaque to clients: the keyset (type, name, id) of the last
+# item of a page, as URL-safe base64 encoded JSON, encoded by DIRECTORY_LIST_PAGE.
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        item_type, name, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if item_type not in ('directory', 'file') or not isinstance(name, str):
+            raise ValueError(item_type)
+        return item_type, name, str(uuid.UUID(item_id))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
 # GET /directories - List directories and files in the specified parent directory.
 @router.get("/directories", response_model=schemas.DirectoryListResponse)
 async def list_directories(
+    response: Response,
     parent_id: Optional[str] = Query(default=None, description="Parent directory ID"),
-    user_token: str = Query(default='public', description="User token for authentication")
+    limit: int = Query(default=1000, ge=1, le=10000, description="Maximum number of items to return"),
+    after: Optional[str] = Query(default=None, description="Cursor returned as next_cursor by the previous page"),
+    user_token: str = Query(default='public', description="User token for authentication"),
+    accept: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None)
 ):
-    """List directories and files in the specified parent directory."""
-    try:
-        result = await execute_query(
-            "SELECT * FROM directory_list(%s, %s)",
-            (parent_id, user_token)
-        )
-        return result[0] if result else {"directories": [], "files": []}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """List one page of directories and files in the specified parent directory.
+
+    Directories come before files, each ordered by name. When more items remain,
+    next_cursor is set and can be passed as `after` to get the next page.
+
+    With `Accept: application/x-ndjson` the whole directory is streamed instead,
+    one item per line, and `limit`/`after` are ignored. Pages are cached, streams are not.
+
+    Pages carry the version of the listing as their ETag, with `If-None-Match` an unchanged
+    page is answered with 304 Not Modified.
+    """
+    if wants_ndjson(accept):
+        return await ndjson_response(stream_query([
+            (queries.DIRECTORY_LISTD_ROWS, (parent_id, user_token)),
+            (queries.DIRECTORY_LISTF_ROWS, (parent_id, user_token)),
+        ]))
+
+    after_type, after_name, after_id = decode_cursor(after) if after else (None, None, None)
+
+    async def load_page():
+        try:
+            # The version is read in the same statement, so from the same snapshot as the items
+            rows = await execute_query(queries.DIRECTORY_LIST_PAGE, {
+                "parent_id": parent_id, "user_token": user_token, "limit": limit,
+                "after_type": after_type, "after_name": after_name, "after_id": after_id,
+            })
+        except DatabaseError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.message)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return rows[0]
+
+    page = await cache.cached(user_token, parent_id, f"list:{limit}:{after or ''}", load_page)
+    return conditional_response(page['page'], page['version'], if_none_match, response)
 
 
 # GET /directories/tree - Get the directory tree structure.
 @router.get("/directories/tree", response_model=schemas.DirectoryTreeResponse)
 async def get_directory_tree(
     parent_id: Optional[str] = Query(default=None, description="Parent directory ID"),
-    level: int = 100,
+    level: int = Query(default=3, ge=1, le=100, description="Number of levels to load"),
+    max_nodes: int = Query(default=1000, ge=1, le=10000, description="Maximum number of items in the tree"),
     user_token: str = Query(default='public', description="User token for authentication")
 ):
-    """Get the directory tree structure."""
+    """Get the directory tree structure.
+
+    Directories whose children were not loaded, because of `level` or `max_nodes`, have
+    `children: null`, and `has_children` tells whether expanding them is worth a request.
+    `truncated` is set when `max_nodes` left out children within `level`.
+    """
     try:
         result = await execute_query(
-            "SELECT * FROM directory_tree(%s, %s, %s)",
-            (parent_id, user_token, level)
+            queries.DIRECTORY_TREE,
+            (parent_id, user_token, level, max_nodes)
         )
-        return {"items": result[0] if result else []}
+        return json_response(result[0])
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -49,20 +157,45 @@ async def get_directory_tree(
 # GET /directories/{dir_id} - Get directory details.
 @router.get("/directories/{dir_id}", response_model=schemas.DirectoryDetails)
 async def get_directory(
+    dir_id: str,
+    response: Response,
+    user_token: str = Query(default='public', description="User token for authentication"),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Get directory details, or 304 Not Modified if `If-None-Match` has their ETag."""
+    async def load_details():
+        result = await execute_query(queries.DIRECTORY_DETAILS, (dir_id, user_token))
+        return result[0] if result and result[0]['details'] is not None else None
+
+    try:
+        details = await cache.cached(user_token, dir_id, 'details', load_details)
+        if details is None:
+            raise HTTPException(status_code=404, detail="Directory not found")
+        return conditional_response(details['details'], details['version'], if_none_match, response)
+    except HTTPException:
+        raise
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# GET /directories/{dir_id}/stats - Get recursive directory totals.
+@router.get("/directories/{dir_id}/stats", response_model=schemas.DirectoryStats)
+async def get_directory_stats(
     dir_id: str,
     user_token: str = Query(default='public', description="User token for authentication")
 ):
-    """Get directory details."""
+    """Get the number of files and directories below a directory at any depth, and the total size of the files."""
     try:
-        result = await execute_query(
-            "SELECT * FROM directory_details(%s, %s)",
-            (dir_id, user_token)
-        )
+        result = await execute_query(queries.DIRECTORY_STATS, (dir_id, user_token))
         if not result or not result[0]:
             raise HTTPException(status_code=404, detail="Directory not found")
-        return result[0]['directory_details']
+        return json_response(result[0])
     except HTTPException:
         raise
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -76,10 +209,11 @@ async def create_directory(
     """Create a new directory."""
     try:
         result = await execute_query(
-            "SELECT * FROM directory_create(%s, %s, %s)",
+            queries.DIRECTORY_CREATE,
             (request.name, request.parent_id, user_token)
         )
-        return result[0]['directory_details']
+        await cache.invalidate(user_token, [result[0]['parent_id']])
+        return json_response(result[0]['details'])
     except DatabaseError as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
@@ -94,12 +228,14 @@ async def update_directory(
     """Update directory properties."""
     try:
         result = await execute_query(
-            "SELECT * FROM directory_update(%s, %s, %s, %s)",
-            (dir_id, request.updates.name, request.updates.parent_id, user_token)
+            queries.DIRECTORY_UPDATE_FROM_PARENT,
+            (dir_id, user_token, dir_id, request.updates.name, request.updates.parent_id, user_token)
         )
-        if not result or not result[0]:
+        if not result or not result[0]['details']:
             raise DatabaseNotFoundError("Directory not found")
-        return result[0]['directory_details']
+        row = result[0]
+        await cache.invalidate(user_token, [row['id'], row['parent_id'], row['previous_parent_id']])
+        return json_response(row['details'])
     except DatabaseError as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
@@ -114,10 +250,13 @@ async def copy_directory(
     """Copy a directory to a new location."""
     try:
         result = await execute_query(
-            "SELECT * FROM directory_copy(%s, %s, %s)",
+            queries.DIRECTORY_COPY,
             (dir_id, request.destination_parent_id, user_token)
         )
-        return result[0]['directory_details']
+        await cache.invalidate(user_token, [result[0]['parent_id']])
+        return json_response(result[0]['details'])
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -131,11 +270,16 @@ async def delete_directory(
 ):
     """Delete a directory."""
     try:
-        await execute_query(
-            "SELECT directory_delete(%s, %s, %s)",
-            (dir_id, request.recursive, user_token)
+        result = await execute_query(
+            queries.DIRECTORY_DELETE_SUBTREE,
+            (dir_id, user_token, dir_id, request.recursive, user_token)
         )
+        for row in result:
+            if row['subtree'] is not None:
+                await cache.invalidate(user_token, [row['parent_id'], *row['subtree']])
         return {"status": "success"}
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -148,19 +292,20 @@ async def delete_directory(
 @router.get("/files/{file_id}", response_model=schemas.FileDetails)
 async def get_file(
     file_id: str,
-    user_token: str = Query(default='public', description="User token for authentication")
+    response: Response,
+    user_token: str = Query(default='public', description="User token for authentication"),
+    if_none_match: Optional[str] = Header(default=None)
 ):
-    """Get file details."""
+    """Get file details, or 304 Not Modified if `If-None-Match` has their ETag."""
     try:
-        result = await execute_query(
-            "SELECT * FROM file_details(%s, %s)",
-            (file_id, user_token)
-        )
-        if not result or not result[0]:
+        result = await execute_query(queries.FILE_DETAILS, (file_id, user_token))
+        if not result or result[0]['details'] is None:
             raise HTTPException(status_code=404, detail="File not found")
-        return result[0]['file_details']
+        return conditional_response(result[0]['details'], result[0]['version'], if_none_match, response)
     except HTTPException:
         raise
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -177,14 +322,17 @@ async def create_file(
     try:
         # Create file entry with uploading status
         result = await execute_query(
-            "SELECT * FROM file_create(%s, %s, %s, %s, %s::jsonb)",
+            queries.FILE_CREATE,
             (request.filename, request.parent_id, user_token, storage_id, json.dumps({}))
         )
 
-        file_details = result[0]['file_details'] if result and result[0] else None
-
-        return file_details
+        if not result or result[0]['details'] is None:
+            return None
+        await cache.invalidate(user_token, [result[0]['parent_id']])
+        return json_response(result[0]['details'])
 
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -196,36 +344,23 @@ async def update_file(
     request: schemas.FileUpdateRequest,
     user_token: str = Query(default='public', description="User token for authentication")
 ):
-    """Update file properties."""
+    """Update file properties and tags in one round trip."""
     try:
-        # First update file properties
-        result = await execute_query(
-            "SELECT * FROM file_update(%s, %s, %s, %s::jsonb, %s)",
-            (file_id, request.updates.name, request.updates.parent_id, json.dumps(request.updates.metadata), user_token)
-        )
-
-        # If tags are provided, update them
-        if request.updates.tags is not None:
-            await execute_query(
-                "SELECT * FROM file_tags_set(%s, %s, %s)",
-                (file_id, request.updates.tags, user_token)
-            )
-
-        # Get updated file details
+        metadata = json.dumps(request.updates.metadata) if request.updates.metadata is not None else None
         result = await execute_query(
-            "SELECT * FROM file_details(%s, %s)",
-            (file_id, user_token)
+            queries.FILE_UPDATE_FROM_PARENT,
+            (file_id, user_token,
+             file_id, request.updates.name, request.updates.parent_id, metadata, user_token, request.updates.tags)
         )
-
-        if not result or not result[0]:
-            raise HTTPException(status_code=404, detail="File not found")
-        return result[0]['file_details']
-    except HTTPException:
-        raise
-    except Exception as e:
-        if "name conflict" in str(e).lower():
-            raise HTTPException(status_code=409, detail="File name already exists")
-        raise HTTPException(status_code=500, detail=str(e))
+        if not result or result[0]['details'] is None:
+            raise DatabaseNotFoundError("File not found")
+        row = result[0]
+        # Listings show names only, metadata and tags are not cached
+        if request.updates.name is not None or request.updates.parent_id is not None:
+            await cache.invalidate(user_token, [row['parent_id'], row['previous_parent_id']])
+        return json_response(row['details'])
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
 
 
 # DELETE /files/{file_id} - Delete a file.
@@ -237,11 +372,15 @@ async def delete_file(
     """Delete a file."""
     try:
         # Finally delete the file from VFS
-        await execute_query(
-            "SELECT file_delete(%s, %s)",
-            (file_id, user_token)
+        result = await execute_query(
+            queries.FILE_DELETE_PARENT,
+            (file_id, user_token, file_id, user_token)
         )
+        if result and result[0]['found']:
+            await cache.invalidate(user_token, [result[0]['parent_id']])
         return {"status": "success"}
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -256,10 +395,13 @@ async def copy_file(
     """Copy a file to a new location."""
     try:
         result = await execute_query(
-            "SELECT * FROM file_copy(%s, %s, %s)",
+            queries.FILE_COPY,
             (file_id, request.destination_parent_id, user_token)
         )
-        return result[0]['file_details']
+        await cache.invalidate(user_token, [result[0]['parent_id']])
+        return json_response(result[0]['details'])
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -278,10 +420,12 @@ async def add_tags(
     """Add tags to a file."""
     try:
         result = await execute_query(
-            "SELECT * FROM file_tags_add(%s, %s, %s)",
+            queries.FILE_TAGS_ADD,
             (file_id, request.tags, user_token)
         )
-        return result[0]['tags'] if result else {}
+        return json_response(result[0]) if result else {}
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -296,10 +440,12 @@ async def remove_tags(
     """Remove tags from a file."""
     try:
         result = await execute_query(
-            "SELECT * FROM file_tags_remove(%s, %s, %s)",
+            queries.FILE_TAGS_REMOVE,
             (file_id, request.tags, user_token)
         )
-        return result[0]['tags'] if result else {}
+        return json_response(result[0]) if result else {}
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -314,10 +460,12 @@ async def update_tags(
     """Replace all tags of a file."""
     try:
         result = await execute_query(
-            "SELECT * FROM file_tags_set(%s, %s, %s)",
+            queries.FILE_TAGS_SET,
             (file_id, request.tags, user_token)
         )
-        return result[0]['tags'] if result else {}
+        return json_response(result[0]) if result else {}
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -333,16 +481,10 @@ async def list_tags(
 ):
     """List all tags for the user."""
     try:
-        result = await execute_query(
-            "SELECT * FROM tags_list(%s)",
-            (user_token,)
-        )
-        # Transform the result into FileTags format
-        if result:
-            names = [row['name'] for row in result]
-            ids = [row['id'] for row in result]
-            return schemas.FileTags(names=names, ids=ids)
-        return schemas.FileTags(names=[], ids=[])
+        result = await execute_query(queries.TAGS_LIST, (user_token,))
+        return json_response(result[0])
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -355,22 +497,315 @@ async def list_tags(
 @router.post("/search", response_model=schemas.ItemSearchResponse)
 async def search_items(
     request: schemas.SearchRequest,
-    user_token: str = Query(default='public', description="User token for authentication")
+    user_token: str = Query(default='public', description="User token for authentication"),
+    accept: Optional[str] = Header(default=None)
 ):
-    """Search for files and directories."""
+    """Search for files and directories.
+
+    With `mode: "fulltext"` the items are matched by the words of their name (and metadata
+    for files) and returned most relevant first, `limit` (default 100) per type, after
+    skipping `offset`.
+
+    With `Accept: application/x-ndjson` the matches are streamed, one item per line,
+    directories first.
+    """
+    # Without a filter, pass SQL NULL rather than a JSON null, which no metadata contains
+    metadata = json.dumps(request.metadata) if request.metadata is not None else None
+
+    if request.mode == 'fulltext':
+        return await fulltext_search(request, metadata, user_token, wants_ndjson(accept))
+    if request.limit is not None or request.offset is not None:
+        raise HTTPException(status_code=400, detail="limit and offset require mode 'fulltext'")
+
+    if wants_ndjson(accept):
+        streams = []
+        if request.type in ('all', 'directory'):
+            streams.append((
+                queries.DIRECTORY_SEARCH_ROWS,
+                (request.query, request.parent_id, user_token)
+            ))
+        if request.type in ('all', 'file'):
+            streams.append((
+                queries.FILE_SEARCH_ROWS,
+                (request.query, request.parent_id, request.tags, metadata, user_token)
+            ))
+        return await ndjson_response(stream_query(streams))
+
     try:
         result = await execute_query(
-            "SELECT * FROM item_search(%s, %s, %s, %s, %s::jsonb, %s)",
+            queries.ITEM_SEARCH,
             (
                 request.query,
                 request.type,
                 request.parent_id,
                 request.tags,
-                json.dumps(request.metadata),
+                metadata,
                 user_token
             )
         )
-        return result[0] if result else {"directories": [], "files": []}
+        return json_response(result[0]) if result else {"directories": [], "files": []}
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def fulltext_search(request: schemas.SearchRequest, metadata: Optional[str], user_token: str, ndjson: bool):
+    """Run a ranked full-text search, returning one page of matches per type."""
+    if not request.query:
+        raise HTTPException(status_code=400, detail="A query is required for full-text search")
+    limit = request.limit or SEARCH_DEFAULT_LIMIT
+    offset = request.offset or 0
+
+    if ndjson:
+        streams = []
+        if request.type in ('all', 'directory'):
+            streams.append((
+                queries.DIRECTORY_FULLTEXT_ROWS,
+                (request.query, request.parent_id, user_token, limit, offset)
+            ))
+        if request.type in ('all', 'file'):
+            streams.append((
+                queries.FILE_FULLTEXT_ROWS,
+                (request.query, request.parent_id, request.tags, metadata, user_token, limit, offset)
+            ))
+        return await ndjson_response(stream_query(streams))
+
+    try:
+        result = await execute_query(
+            queries.ITEM_FULLTEXT_SEARCH,
+            (
+                request.query,
+                request.type,
+                request.parent_id,
+                request.tags,
+                metadata,
+                user_token,
+                limit,
+                offset
+            )
+        )
+        return json_response(result[0]) if result else {"directories": [], "files": []}
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+########################
+#  Batch Routes
+########################
+
+def batch_query(operation, user_token: str) -> tuple:
+    """Return the query, parameters and whether the query returns details, of one batch operation."""
+    if operation.op == 'create_directory':
+        return (queries.DIRECTORY_CREATE,
+                (operation.name, operation.parent_id, user_token), True)
+    if operation.op == 'update_directory':
+        return (queries.DIRECTORY_UPDATE,
+                (operation.id, operation.name, operation.parent_id, user_token), True)
+    if operation.op == 'delete_directory':
+        return (queries.DIRECTORY_DELETE,
+                (operation.id, operation.recursive, user_token), False)
+    if operation.op == 'copy_directory':
+        return (queries.DIRECTORY_COPY,
+                (operation.id, operation.destination_parent_id, user_token), True)
+    if operation.op == 'create_file':
+        return (queries.FILE_CREATE,
+                (operation.filename, operation.parent_id, user_token, str(uuid.uuid4()), json.dumps({})), True)
+    if operation.op == 'update_file':
+        metadata = json.dumps(operation.metadata) if operation.metadata is not None else None
+        return (queries.FILE_UPDATE,
+                (operation.id, operation.name, operation.parent_id, metadata, user_token, operation.tags), True)
+    if operation.op == 'delete_file':
+        return (queries.FILE_DELETE,
+                (operation.id, user_token), False)
+    return (queries.FILE_COPY,
+            (operation.id, operation.destination_parent_id, user_token), True)
+
+def batch_result(rows, returns_details: bool) -> str:
+    """Return the JSON text of the result of one batch operation, embedding its details as they are."""
+    if not returns_details:
+        return json_value({"status_code": 200, "result": {"status": "success"}, "detail": None})
+    if not rows or rows[0]['details'] is None:
+        return json_value({"status_code": 404, "result": None, "detail": "Not found"})
+    return '{"status_code":200,"result":' + rows[0]['details'] + ',"detail":null}'
+
+
+# POST /batch - Run several operations in one transaction.
+@router.post("/batch", response_model=schemas.BatchResponse)
+async def run_batch(
+    request: schemas.BatchRequest,
+    user_token: str = Query(default='public', description="User token for authentication")
+):
+    """Run several create, update, delete and copy operations in one transaction and round trip.
+
+    In `atomic` mode either every operation is applied or, if one fails, none is and the
+    error of the failing operation is returned. In `best_effort` mode each operation is
+    applied on its own, and failures are reported in its result.
+    """
+    operations = [batch_query(operation, user_token) for operation in request.operations]
+    try:
+        if request.mode == 'atomic':
+            rows = await execute_transaction([(query, params) for query, params, _ in operations])
+        else:
+            rows = await execute_best_effort([(query, params) for query, params, _ in operations])
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    # The directories a batch changed are not all known here (the old parents of moves)
+    await cache.invalidate_user(user_token)
+
+    results = []
+    for result, (_, _, returns_details) in zip(rows, operations):
+        if isinstance(result, DatabaseError):
+            results.append(json_value({"status_code": result.status_code, "result": None, "detail": result.message}))
+        else:
+            results.append(batch_result(result, returns_details))
+    return json_response('{"results":[' + ",".join(results) + ']}')
+
+
+########################
+#  Import Routes
+########################
+
+# POST /import - Import a path manifest.
+@router.post("/import", response_model=schemas.ImportResponse)
+async def import_items(
+    request: Request,
+    parent_id: Optional[str] = Query(default=None, description="Directory to import into"),
+    manifest_format: Literal['ndjson', 'csv'] = Query(default='ndjson', alias='format', description="Manifest format"),
+    user_token: str = Query(default='public', description="User token for authentication")
+):
+    """Import the directories, files and tags of a path manifest sent as the request body.
+
+    The body is streamed into a staging table with COPY, and everything is created set-wise
+    in one transaction. Files whose name is already taken are skipped.
+    """
+    try:
+        result = await import_manifest(iter_lines(request.stream()), manifest_format, parent_id, user_token)
+        # Any directory below parent_id may have been added to
+        await cache.invalidate_user(user_token)
+        return result
+    except ManifestError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+
+########################
+#  Sync Routes
+########################
+
+# GET /sync - List the changes since a cursor.
+@router.get("/sync", response_model=schemas.SyncResponse)
+async def sync_changes(
+    since: Optional[int] = Query(default=None, ge=0, description="next_cursor returned by the previous call"),
+    parent_id: Optional[str] = Query(default=None, description="Root directory of the synced subtree"),
+    limit: int = Query(default=1000, ge=1, le=10000, description="Maximum number of change events covered"),
+    user_token: str = Query(default='public', description="User token for authentication")
+):
+    """List the items created, updated, moved or deleted since a cursor, once each in their current state.
+
+    Without `since`, only the current cursor is returned: take it before loading the tree,
+    then pass it as `since` to get the changes made from then on. While `has_more` is set,
+    more changes remain after `next_cursor`. Deleted items, and items moved out of the subtree
+    of `parent_id`, are returned as tombstones with their `op`, `type` and `id` only.
+
+    Cursors are positions of the change feed, the ids of `GET /events`. A cursor from before
+    pruned events is rejected with 410 Gone, the tree must then be loaded again.
+    """
+    try:
+        result = await execute_query(
+            queries.SYNC_CHANGES,
+            (user_token, parent_id, user_token, since, limit)
+        )
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    row = result[0]
+    if since is not None and row['pruned_seq'] is not None and since < row['pruned_seq']:
+        raise HTTPException(status_code=410, detail="Cursor expired, load the tree again")
+    return json_response(row['body'])
+
+
+########################
+#  Change Feed Routes
+########################
+
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+# Seconds between keepalive comments on an idle stream, after each of which the stream also
+# looks for changes, in case their notification was lost
+EVENTS_KEEPALIVE = 15
+
+# Events read per query
+EVENTS_BATCH_SIZE = 1000
+
+# GET /events - Stream changes as server-sent events.
+@router.get("/events")
+async def stream_events(
+    parent_id: Optional[str] = Query(default=None, description="Only stream the changes within this directory"),
+    after: Optional[int] = Query(default=None, ge=0, description="Sequence number of the last event received"),
+    user_token: str = Query(default='public', description="User token for authentication"),
+    last_event_id: Optional[str] = Header(default=None)
+):
+    """Stream the creates, updates, moves and deletes of the user's items as server-sent events.
+
+    Each event's id is its sequence number. A client resumes after the last event it received
+    with `after` or the `Last-Event-ID` header, which EventSource sends when reconnecting, and
+    otherwise gets the changes made from now on. A `reset` event tells it that events it
+    missed were pruned, and that it should reload its state before applying the next ones.
+
+    With `parent_id`, only the changes within that directory's subtree are streamed, and the
+    stream ends after the directory is deleted.
+    """
+    if last_event_id is not None:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    try:
+        start = (await execute_query(
+            queries.CHANGE_EVENTS_START,
+            (user_token, user_token, parent_id, user_token)
+        ))[0]
+    except DatabaseError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    root_path = start['root_path']
+    if parent_id is not None and root_path is None:
+        raise HTTPException(status_code=404, detail="Directory not found or access denied")
+    root_ids = {str(dir_id) for dir_id in root_path or ()}
+    reset = after is not None and start['pruned_seq'] is not None and after < start['pruned_seq']
+
+    async def body():
+        position = start['last_seq'] if after is None or reset else after
+        if reset:
+            yield f"id: {position}\nevent: reset\ndata: {json.dumps({'seq': position})}\n\n"
+        with events.subscribe(user_token) as changed:
+            while True:
+                # Cleared before reading, so a change committed meanwhile wakes up the next wait
+                changed.clear()
+                try:
+                    rows = await execute_query(
+                        queries.CHANGE_EVENTS_LIST,
+                        (user_token, position, root_path, EVENTS_BATCH_SIZE)
+                    )
+                except DatabaseError:
+                    return  # The client reconnects and resumes
+                if rows:
+                    position = rows[-1]['seq']
+                    yield "".join(f"id: {row['seq']}\ndata: {row['json']}\n\n" for row in rows)
+                    if any(row['op'] == 'deleted' and row['id'] in root_ids for row in rows):
+                        return
+                    if len(rows) == EVENTS_BATCH_SIZE:
+                        continue
+                try:
+                    await asyncio.wait_for(changed.wait(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        body(),
+        media_type=EVENT_STREAM_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
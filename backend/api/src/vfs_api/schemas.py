@@ -1,5 +1,5 @@
-from typing import Optional, List, Dict, Any, Literal
-from pydantic import BaseModel
+from typing import Optional, List, Dict, Any, Literal, Union, Annotated
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 class DirectoryChildCounts(BaseModel):
@@ -14,6 +14,7 @@ class DirectoryDetails(BaseModel):
     updated_at: datetime
     parent_id: Optional[str] = None  # UUID, optional for root directory
     child_counts: DirectoryChildCounts
+    version: int  # Changes with the details and the listing, sent as the ETag
 
 class FileTags(BaseModel):
     names: Optional[List[str|None]] = []
@@ -28,6 +29,7 @@ class FileDetails(BaseModel):
     storage_id: str
     metadata: Optional[Dict[str, Any]] = {}  # Default empty dict if no metadata
     tags: FileTags
+    version: int  # Changes with the details, sent as the ETag
 
 class ShortDetails(BaseModel):
     id: str  # UUID
@@ -41,13 +43,19 @@ class SearchRequest(BaseModel):
     parent_id: Optional[str] = None
     tags: Optional[List[str]] = None
     metadata: Optional[Dict[str, Any]] = None
+    # 'substring' matches query anywhere in names, 'fulltext' ranks items by the words of their
+    # name and metadata and returns them most relevant first, limit/offset at a time per type
+    mode: Optional[Literal['substring', 'fulltext']] = "substring"
+    limit: Optional[int] = Field(default=None, ge=1, le=10000)
+    offset: Optional[int] = Field(default=None, ge=0)
 
 class TreeItem(BaseModel):
     id: str  # UUID
     name: str
     created_at: datetime
     type: Literal['file', 'directory']
-    children: Optional[List['TreeItem']] = None
+    has_children: Optional[bool] = None  # Directories only
+    children: Optional[List['TreeItem']] = None  # None when not loaded
 
 # This is needed for the recursive type reference in TreeItem
 TreeItem.model_rebuild()
@@ -62,14 +70,24 @@ TreeItem.model_rebuild()
 class DirectoryListResponse(BaseModel):
     directories: List[ShortDetails]
     files: List[ShortDetails]
+    next_cursor: Optional[str] = None  # Pass as `after` to get the next page
+    version: Optional[int] = None  # Changes with the listing, sent as the ETag. None for unknown directories
 
 # GET /directories/tree - Get the directory tree structure.
 
 class DirectoryTreeResponse(BaseModel):
     items: Dict[Literal['tree'], List[TreeItem]]
+    truncated: bool = False  # Children were left out to stay within max_nodes
 
 # GET /directories/{dir_id} - Get directory details.
 
+# GET /directories/{dir_id}/stats - Get recursive directory totals.
+class DirectoryStats(BaseModel):
+    id: str  # UUID
+    files: int  # Files in the subtree
+    directories: int  # Directories in the subtree, excluding this one
+    size: float  # Sum of the files' metadata.size
+
 # POST /directories - Create a new directory.
 class DirectoryCreateRequest(BaseModel):
     name: str
@@ -165,6 +183,7 @@ class ItemSearchResultFile(BaseModel):
     storage_id: str
     metadata: Dict[str, Any] = {}
     type: Literal['file']
+    rank: Optional[float] = None  # Full-text search only
 
 class ItemSearchResultDirectory(BaseModel):
     id: str  # UUID
@@ -173,9 +192,121 @@ class ItemSearchResultDirectory(BaseModel):
     created_at: datetime
     updated_at: datetime
     type: Literal['directory']
+    rank: Optional[float] = None  # Full-text search only
 
 class ItemSearchResponse(BaseModel):
     directories: List[ItemSearchResultDirectory]
     files: List[ItemSearchResultFile]
 
 
+
+
+########################
+#  Batch Routes
+########################
+
+# POST /batch - Run several operations in one transaction.
+
+class BatchCreateDirectory(BaseModel):
+    op: Literal['create_directory']
+    name: str
+    parent_id: Optional[str] = None
+
+class BatchUpdateDirectory(BaseModel):
+    op: Literal['update_directory']
+    id: str  # UUID
+    name: Optional[str] = None
+    parent_id: Optional[str] = None
+
+class BatchDeleteDirectory(BaseModel):
+    op: Literal['delete_directory']
+    id: str  # UUID
+    recursive: bool = False
+
+class BatchCopyDirectory(BaseModel):
+    op: Literal['copy_directory']
+    id: str  # UUID
+    destination_parent_id: Optional[str] = None
+
+class BatchCreateFile(BaseModel):
+    op: Literal['create_file']
+    filename: str
+    parent_id: Optional[str] = None
+
+class BatchUpdateFile(BaseModel):
+    op: Literal['update_file']
+    id: str  # UUID
+    name: Optional[str] = None
+    parent_id: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+    tags: Optional[List[str]] = None
+
+class BatchDeleteFile(BaseModel):
+    op: Literal['delete_file']
+    id: str  # UUID
+
+class BatchCopyFile(BaseModel):
+    op: Literal['copy_file']
+    id: str  # UUID
+    destination_parent_id: Optional[str] = None
+
+BatchOperation = Annotated[
+    Union[
+        BatchCreateDirectory,
+        BatchUpdateDirectory,
+        BatchDeleteDirectory,
+        BatchCopyDirectory,
+        BatchCreateFile,
+        BatchUpdateFile,
+        BatchDeleteFile,
+        BatchCopyFile,
+    ],
+    Field(discriminator='op')
+]
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(min_length=1, max_length=10000)
+    # 'atomic' applies all operations or none, 'best_effort' commits the ones that succeed
+    mode: Literal['atomic', 'best_effort'] = "atomic"
+
+class BatchResult(BaseModel):
+    status_code: int  # HTTP status the operation would have had on its own route
+    result: Optional[Dict[str, Any]] = None  # Directory or file details, or {"status": "success"} for deletes
+    detail: Optional[str] = None  # Error message of a failed operation
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]  # In the order of the operations
+
+
+########################
+#  Import Routes
+########################
+
+# POST /import - Import a path manifest.
+
+class ImportResponse(BaseModel):
+    directories_created: int
+    files_created: int
+    files_skipped: int  # Name already taken
+
+
+########################
+#  Sync Routes
+########################
+
+# GET /sync - Changes since a cursor.
+
+class SyncChange(BaseModel):
+    op: Literal['created', 'updated', 'moved', 'deleted']
+    type: Literal['directory', 'file']
+    id: str  # UUID
+    name: Optional[str] = None  # Not in tombstones
+    parent_id: Optional[str] = None  # UUID, None at the root level and in tombstones
+    version: Optional[int] = None  # Not in tombstones
+    storage_id: Optional[str] = None  # Files only
+    metadata: Optional[Dict[str, Any]] = None  # Files only
+
+class SyncResponse(BaseModel):
+    next_cursor: int  # Pass as since to the next call
+    has_more: bool  # Whether more changes remain after next_cursor
+    changes: List[SyncChange]  # Tombstones first, then directories top-down, then files
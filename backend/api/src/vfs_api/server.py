@@ -0,0 +1,165 @@
+# Multi-process serving.
+# With several workers, the supervisor process binds the listening socket and forks the
+# workers, which all accept connections from that socket. Each worker runs its own event
+# loop, with its own connection pool and change listener, opened by the application's
+# lifespan once the worker has started. The supervisor restarts workers that die, and
+# on SIGTERM or SIGINT forwards SIGTERM to the workers, which stop accepting connections,
+# finish the requests in flight within shutdown_timeout and close their pool.
+
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+import uvicorn
+from fastapi import FastAPI
+
+from vfs_api.health import restart_clock
+
+logger = logging.getLogger(__name__)
+
+# Server configuration, overridable from the command line (see configure_server)
+SERVER_CONFIG = {
+    # Worker processes (0 = one per CPU core)
+    'workers': int(os.getenv('API_WORKERS', '1')),
+    # Build the application once in the supervisor, before forking the workers
+    'preload': os.getenv('API_PRELOAD', 'false').lower() in ('1', 'true', 'yes'),
+    # Database connections shared by all workers, which sets each worker's pool size
+    'connection_budget': int(os.getenv('DB_CONNECTION_BUDGET', '0')) or None,
+    # Seconds requests in flight are given to finish on shutdown, streams included
+    'shutdown_timeout': float(os.getenv('API_SHUTDOWN_TIMEOUT', '30')),
+}
+
+# Exit code of a worker whose application failed to start, as with uvicorn
+STARTUP_FAILURE = 3
+
+# Seconds before a worker that died is replaced
+RESTART_DELAY = 1.0
+
+def configure_server(**overrides: Any) -> None:
+    """Override server settings before serving. None values are ignored."""
+    SERVER_CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+    if SERVER_CONFIG['workers'] == 0:
+        SERVER_CONFIG['workers'] = os.cpu_count() or 1
+
+def worker_pool_size(connection_budget: int, workers: int) -> int:
+    """Return the pool size of each worker, so that all workers stay within the budget.
+
+    Each worker also keeps one connection of its own, listening for change events.
+    """
+    size = connection_budget // workers - 1
+    if size < 1:
+        raise ValueError(f"A budget of {connection_budget} connections is too small for "
+                         f"{workers} workers, which need 2 connections each")
+    return size
+
+
+class Supervisor:
+    """Forks the workers serving the socket and keeps them running until stopped."""
+
+    def __init__(self, load_app: Callable[[], FastAPI], sock: socket.socket, workers: int,
+                 log_level: str, shutdown_timeout: float):
+        self.load_app = load_app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.shutdown_timeout = shutdown_timeout
+        self.pids: Set[int] = set()
+        self.stopping = False
+        self.failed = False
+
+    def run(self) -> int:
+        """Serve until stopped, and return the exit code of the supervisor."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self._spawn()
+        while self.pids:
+            pid, status = os.wait()
+            self.pids.discard(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                continue
+            if code == STARTUP_FAILURE:
+                logger.error("Worker %s failed to start, stopping", pid)
+                self.failed = True
+                self.stop()
+                continue
+            logger.error("Worker %s exited with code %s, restarting it", pid, code)
+            time.sleep(RESTART_DELAY)
+            if not self.stopping:
+                self._spawn()
+        return 1 if self.failed else 0
+
+    def stop(self, signum: Optional[int] = None, frame: Any = None) -> None:
+        """Ask every worker to finish its requests and exit."""
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            return
+        # The worker: uvicorn installs its own signal handlers, and the worker never
+        # returns to the supervisor's code
+        code = 1
+        try:
+            restart_clock()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            server = uvicorn.Server(uvicorn.Config(
+                self.load_app(),
+                log_level=self.log_level,
+                timeout_graceful_shutdown=self.shutdown_timeout,
+            ))
+            server.run(sockets=[self.sock])
+            code = 0 if server.started else STARTUP_FAILURE
+        except BaseException:
+            logger.exception("Worker %s failed", os.getpid())
+        finally:
+            os._exit(code)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+def serve(create_app: Callable[[], FastAPI], host: str, port: int, log_level: str) -> int:
+    """Serve the application with SERVER_CONFIG's workers, and return the exit code.
+
+    A single worker serves from this process. Otherwise the application is built by each
+    worker after it is forked, or once before forking with preload, which shares its
+    memory between the workers and stops on configuration errors before any worker starts.
+    """
+    workers = SERVER_CONFIG['workers']
+    if workers == 1:
+        uvicorn.run(create_app(), host=host, port=port, log_level=log_level,
+                    timeout_graceful_shutdown=SERVER_CONFIG['shutdown_timeout'])
+        return 0
+    if SERVER_CONFIG['preload']:
+        app = create_app()
+
+        def load_app() -> FastAPI:
+            return app
+    else:
+        load_app = create_app
+    with bind_socket(host, port) as sock:
+        return Supervisor(load_app, sock, workers, log_level, SERVER_CONFIG['shutdown_timeout']).run()
+
+def get_server_stats() -> Dict[str, Any]:
+    """Return the serving mode and the process answering."""
+    return {
+        'workers': SERVER_CONFIG['workers'],
+        'pid': os.getpid(),
+    }
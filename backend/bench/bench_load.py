@@ -0,0 +1,304 @@
+"""
+Concurrent mixed-load benchmark for the VFS API.
+
+Runs a fixed number of concurrent clients against a running API for a given
+duration. Each client picks an operation by weight, and the script reports
+per-operation latency percentiles (p50/p99) plus overall throughput.
+
+With --rate the load is open-loop instead: requests are started at a fixed
+arrival rate regardless of how fast earlier ones complete, which shows how
+slow requests delay unrelated fast ones (e.g. a blocked event loop).
+
+Requires the benchmark data set (see load_bench_data.sql).
+
+Usage:
+    python bench/bench_load.py --concurrency 32 --duration 20
+    python bench/bench_load.py --scenario read --json results.json
+    python bench/bench_load.py --rate 50 --duration 30
+    python bench/bench_load.py --scenario update
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+API_HOST = os.getenv("API_HOST", "localhost")
+API_PORT = os.getenv("API_PORT", "8000")
+API_URL = f"http://{API_HOST}:{API_PORT}"
+
+BENCH_USER = "bench"
+
+
+########################
+#  Operations
+########################
+
+async def op_list_root(client, ctx):
+    return await client.get("/directories", params={"user_token": BENCH_USER})
+
+
+async def op_list_directory(client, ctx):
+    return await client.get(
+        "/directories",
+        params={"parent_id": random.choice(ctx["dir_ids"]), "user_token": BENCH_USER},
+    )
+
+
+async def op_get_directory(client, ctx):
+    return await client.get(
+        f"/directories/{random.choice(ctx['dir_ids'])}",
+        params={"user_token": BENCH_USER},
+    )
+
+
+async def op_search(client, ctx):
+    return await client.post(
+        "/search",
+        params={"user_token": BENCH_USER},
+        json={"query": f"_{random.randint(1, 500):03d}.", "type": "file"},
+    )
+
+
+async def op_search_tags(client, ctx):
+    # Common and rare tag combinations of the bench data set ("review" is the rarest)
+    return await client.post(
+        "/search",
+        params={"user_token": BENCH_USER},
+        json={"type": "file", "tags": random.choice([["cold"], ["hot", "archived"], ["cold", "review"]])},
+    )
+
+
+async def op_update_file(client, ctx):
+    # Metadata and tags in one PATCH, on files of the copy source tree
+    return await client.patch(
+        f"/files/{random.choice(ctx['file_ids'])}",
+        params={"user_token": BENCH_USER},
+        json={"updates": {
+            "metadata": {"revision": random.randint(1, 1000)},
+            "tags": random.choice([["hot"], ["cold", "archived"], ["hot", "review"]]),
+        }},
+    )
+
+
+async def op_create_delete_directory(client, ctx):
+    response = await client.post(
+        "/directories",
+        params={"user_token": BENCH_USER},
+        json={"name": f"bench_tmp_{uuid.uuid4().hex[:8]}", "parent_id": ctx["root_id"]},
+    )
+    if response.status_code == 200:
+        await client.request(
+            "DELETE",
+            f"/directories/{response.json()['id']}",
+            params={"user_token": BENCH_USER},
+            json={"recursive": True},
+        )
+    return response
+
+
+async def op_copy_directory(client, ctx):
+    # Every copy gets its own destination so concurrent copies never conflict
+    destination = await client.post(
+        "/directories",
+        params={"user_token": BENCH_USER},
+        json={"name": f"bench_tmp_{uuid.uuid4().hex[:8]}", "parent_id": ctx["root_id"]},
+    )
+    response = await client.post(
+        f"/directories/{ctx['copy_src_id']}/copy",
+        params={"user_token": BENCH_USER},
+        json={"destination_parent_id": destination.json()["id"]},
+    )
+    await client.request(
+        "DELETE",
+        f"/directories/{destination.json()['id']}",
+        params={"user_token": BENCH_USER},
+        json={"recursive": True},
+    )
+    return response
+
+
+# Operation weights per scenario
+SCENARIOS = {
+    "mixed": {
+        op_list_root: 30,
+        op_list_directory: 20,
+        op_get_directory: 30,
+        op_search: 10,
+        op_create_delete_directory: 8,
+        op_copy_directory: 2,
+    },
+    "read": {
+        op_list_root: 40,
+        op_list_directory: 20,
+        op_get_directory: 40,
+    },
+    "search": {
+        op_search: 50,
+        op_search_tags: 50,
+    },
+    "write": {
+        op_create_delete_directory: 90,
+        op_copy_directory: 10,
+    },
+    "update": {
+        op_update_file: 100,
+    },
+}
+
+
+########################
+#  Runner
+########################
+
+async def prepare_context(client):
+    """Resolve the directory IDs used by the operations."""
+    root = (await client.get("/directories", params={"user_token": BENCH_USER})).json()
+    root_ids = {d["name"]: d["id"] for d in root["directories"]}
+    if "bench_root" not in root_ids:
+        raise SystemExit("Benchmark data not found, load bench/load_bench_data.sql first")
+
+    children = (await client.get(
+        "/directories",
+        params={"parent_id": root_ids["bench_root"], "user_token": BENCH_USER},
+    )).json()
+    child_ids = {d["name"]: d["id"] for d in children["directories"]}
+
+    copy_children = (await client.get(
+        "/directories",
+        params={"parent_id": child_ids["copy_src"], "user_token": BENCH_USER},
+    )).json()
+    sub_files = (await client.get(
+        "/directories",
+        params={"parent_id": copy_children["directories"][0]["id"], "user_token": BENCH_USER},
+    )).json()
+
+    return {
+        "root_id": root_ids["bench_root"],
+        "copy_src_id": child_ids["copy_src"],
+        "dir_ids": [v for k, v in child_ids.items() if k.startswith("dir_")],
+        "file_ids": [f["id"] for f in sub_files["files"]],
+    }
+
+
+async def timed(op, client, ctx, samples):
+    start = time.perf_counter()
+    try:
+        response = await op(client, ctx)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    samples.append((op.__name__[3:], time.perf_counter() - start, ok))
+
+
+async def worker(client, ctx, ops, weights, deadline, samples):
+    while time.perf_counter() < deadline:
+        await timed(random.choices(ops, weights)[0], client, ctx, samples)
+
+
+async def open_loop(client, ctx, ops, weights, deadline, samples, rate):
+    tasks = []
+    next_start = time.perf_counter()
+    while next_start < deadline:
+        await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+        op = random.choices(ops, weights)[0]
+        tasks.append(asyncio.create_task(timed(op, client, ctx, samples)))
+        next_start += random.expovariate(rate)
+    await asyncio.gather(*tasks)
+
+
+def percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def summarize(samples, elapsed):
+    by_op = {}
+    for name, latency, ok in samples:
+        by_op.setdefault(name, []).append((latency, ok))
+    by_op["ALL"] = [(latency, ok) for _, latency, ok in samples]
+
+    summary = {}
+    for name, values in by_op.items():
+        latencies = sorted(v[0] * 1000 for v in values)
+        summary[name] = {
+            "count": len(values),
+            "errors": sum(1 for v in values if not v[1]),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(latencies[-1], 2),
+        }
+    summary["ALL"]["rps"] = round(len(samples) / elapsed, 1)
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'operation':<26}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, row in summary.items():
+        print(
+            f"{name:<26}{row['count']:>8}{row['errors']:>8}"
+            f"{row['p50_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}"
+        )
+    print(f"throughput: {summary['ALL']['rps']} req/s")
+
+
+async def run(args):
+    weights_by_op = SCENARIOS[args.scenario]
+    ops, weights = list(weights_by_op), list(weights_by_op.values())
+    limits = httpx.Limits(max_connections=None if args.rate else args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120) as client:
+        ctx = await prepare_context(client)
+        samples = []
+        start = time.perf_counter()
+        deadline = start + args.duration
+        if args.rate:
+            await open_loop(client, ctx, ops, weights, deadline, samples, args.rate)
+        else:
+            await asyncio.gather(*(
+                worker(client, ctx, ops, weights, deadline, samples)
+                for _ in range(args.concurrency)
+            ))
+        elapsed = time.perf_counter() - start
+
+    return summarize(samples, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, default=API_URL)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="Duration in seconds")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Open-loop arrival rate in requests/second (default: closed-loop)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    summary = asyncio.run(run(args))
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "scenario": args.scenario,
+                "concurrency": args.concurrency,
+                "rate": args.rate,
+                "results": summary,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
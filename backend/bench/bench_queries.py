@@ -0,0 +1,191 @@
+"""
+Query execution micro-benchmark: text SQL per call against prepared queries.
+
+Runs the same read queries two ways on a single connection:
+
+  - text: the SQL text is sent with every call, parsed and planned again by
+    Postgres, results come back as text and each row is built into a dict
+  - prepared: as the API's query registry runs them (vfs_api.queries), prepared
+    once, results in binary format, and single JSON documents fetched as the
+    rows themselves
+
+and reports per query the latency percentiles (p50/p99) and the client CPU time
+per call of both, and the CPU and time saved per call by the prepared queries.
+Latencies include the server's parsing and planning, the client CPU does not.
+
+Runs in a throwaway user of its own, no benchmark data set is needed.
+
+Usage:
+    python bench/bench_queries.py --iterations 5000
+    python bench/bench_queries.py --json results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import uuid
+
+import psycopg
+from psycopg.rows import dict_row
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The benchmark times the database calls, so it connects to the database directly
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'dbname': os.getenv('DB_NAME', 'prism_vfs'),
+    'user': os.getenv('DB_USER', 'prism_user'),
+    'password': os.getenv('DB_PASSWORD', 'prism_password'),
+}
+
+# Directories and files of the benchmark user's directory
+DIRECTORIES = 20
+FILES = 200
+
+
+def scalar_row(cursor):
+    def make_row(values):
+        return values[0]
+    return make_row
+
+
+########################
+#  Data set
+########################
+
+def create_data(cursor, user_token):
+    cursor.execute("SELECT * FROM directory_create(%s, NULL, %s)", ("bench_queries", user_token))
+    root_id = cursor.fetchone()["directory_details"]["id"]
+    cursor.execute(
+        """
+        INSERT INTO directories (name, parent_id, user_token)
+        SELECT 'dir_' || g, %(root)s, %(u)s FROM generate_series(1, %(dirs)s) g
+        """,
+        {"root": root_id, "u": user_token, "dirs": DIRECTORIES},
+    )
+    cursor.execute(
+        """
+        INSERT INTO files (name, parent_id, user_token, storage_id, metadata)
+        SELECT 'file_' || g || '.txt', %(root)s, %(u)s, 'store_' || g, jsonb_build_object('size', g)
+        FROM generate_series(1, %(files)s) g
+        RETURNING id
+        """,
+        {"root": root_id, "u": user_token, "files": FILES},
+    )
+    file_id = cursor.fetchone()["id"]
+    cursor.execute("SELECT * FROM file_tags_set(%s, %s, %s)", (file_id, ["bench", "queries"], user_token))
+    return root_id, file_id
+
+
+# (name, SQL, parameters, whether the prepared query fetches a single JSON document per row),
+# the SQL as the routes send it
+def cases(user_token, root_id, file_id):
+    return [
+        ("directory_details", "SELECT directory_details FROM directory_details(%s, %s)",
+         (root_id, user_token), True),
+        ("file_details", "SELECT file_details FROM file_details(%s, %s)",
+         (file_id, user_token), True),
+        ("list_page",
+         """
+         SELECT v.version, p.type, p.id::text, p.name, p.created_at
+         FROM directory_version(%s, %s) v(version)
+         LEFT JOIN directory_list_page(%s, %s, %s, %s, %s, %s) WITH ORDINALITY p ON true
+         ORDER BY p.ordinality
+         """,
+         (root_id, user_token, root_id, user_token, 101, None, None, None), False),
+        ("search", "SELECT directories, files FROM item_search(%s, %s, %s, %s, %s::jsonb, %s)",
+         ("file_1", "all", root_id, None, None, user_token), False),
+        ("tags_list", "SELECT id, name FROM tags_list(%s)",
+         (user_token,), False),
+    ]
+
+
+########################
+#  Runner
+########################
+
+def time_calls(connection, sql, params, iterations, prepared, scalar):
+    """Return the latencies and client CPU times of the calls, in seconds."""
+    row_factory = scalar_row if prepared and scalar else dict_row
+    latencies, cpu = [], []
+    for _ in range(iterations):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        cursor = connection.cursor(row_factory=row_factory)
+        if prepared:
+            cursor.execute(sql, params, prepare=True, binary=True)
+        else:
+            cursor.execute(sql, params, prepare=False)
+        cursor.fetchall()
+        cpu.append(time.process_time() - start_cpu)
+        latencies.append(time.perf_counter() - start)
+    return latencies, cpu
+
+
+def percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def summarize(latencies, cpu):
+    latencies = sorted(v * 1000 for v in latencies)
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "cpu_us": round(statistics.fmean(cpu) * 1e6, 1),
+    }
+
+
+def print_summary(summary):
+    print(f"{'query':<20}{'mode':>10}{'p50 ms':>10}{'p99 ms':>10}{'cpu us':>10}")
+    for name, modes in summary.items():
+        for mode in ("text", "prepared"):
+            row = modes[mode]
+            print(f"{name:<20}{mode:>10}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['cpu_us']:>10}")
+        print(f"{'':<20}{'saved':>10}{modes['saved_p50_ms']:>10}{'':>10}{modes['saved_cpu_us']:>10}")
+
+
+def run(args):
+    user_token = f"bench_queries_{uuid.uuid4().hex[:8]}"
+    summary = {}
+    with psycopg.connect(**DB_CONFIG, autocommit=True, row_factory=dict_row) as connection:
+        cursor = connection.cursor()
+        try:
+            root_id, file_id = create_data(cursor, user_token)
+            for name, sql, params, scalar in cases(user_token, root_id, file_id):
+                modes = {}
+                for mode in ("text", "prepared"):
+                    prepared = mode == "prepared"
+                    time_calls(connection, sql, params, args.warmup, prepared, scalar)
+                    modes[mode] = summarize(*time_calls(connection, sql, params, args.iterations, prepared, scalar))
+                modes["saved_p50_ms"] = round(modes["text"]["p50_ms"] - modes["prepared"]["p50_ms"], 3)
+                modes["saved_cpu_us"] = round(modes["text"]["cpu_us"] - modes["prepared"]["cpu_us"], 1)
+                summary[name] = modes
+        finally:
+            cursor.execute("DELETE FROM directories WHERE user_token = %s", (user_token,))
+            for table in ("tags", "root_versions", "change_events"):
+                cursor.execute(f"DELETE FROM {table} WHERE user_token = %s", (user_token,))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100, help="Calls made before timing")
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    summary = run(args)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"iterations": args.iterations, "results": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
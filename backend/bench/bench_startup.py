@@ -0,0 +1,124 @@
+"""
+API startup benchmark.
+
+Starts the API several times and reports how long each start takes, from
+launching the process until:
+
+  - live: GET /health answers, which does not wait for the database
+  - ready: GET /ready answers 200, once the pool has opened its warm-up
+    connections (--db_pool_warmup)
+
+as the median, min and max over the runs, in milliseconds, next to the
+timings the API reports itself at /stats (from the import of the package).
+With --db_host pointing to an unreachable host, the API still goes live and
+only readiness waits.
+
+The API is started by the benchmark itself, against the database of the
+environment (.env). No data set is needed.
+
+Usage:
+    python bench/bench_startup.py --runs 10
+    python bench/bench_startup.py --runs 5 --db_pool_warmup 10 --json results.json
+"""
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds a start is given to become ready
+STARTUP_TIMEOUT = 60
+
+# Seconds between two probes
+POLL_INTERVAL = 0.005
+
+
+def wait_for(url, deadline):
+    """Return the time at which url answered 200, or None at the deadline."""
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(POLL_INTERVAL)
+    return None
+
+
+def start_once(args):
+    """Start the API, and return the times to live and ready, and its own timings."""
+    url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ)
+    if args.db_host:
+        env["DB_HOST"] = args.db_host
+    start = time.perf_counter()
+    process = subprocess.Popen([
+        sys.executable, "-m", "vfs_api",
+        "--host", "127.0.0.1",
+        "--port", str(args.port),
+        "--db_pool_warmup", str(args.db_pool_warmup),
+    ], env=env)
+    try:
+        deadline = start + STARTUP_TIMEOUT
+        live = wait_for(f"{url}/health", deadline)
+        ready = wait_for(f"{url}/ready", deadline) if live else None
+        reported = httpx.get(f"{url}/stats", timeout=5).json()["startup"] if live else {}
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+    return {
+        "live_ms": (live - start) * 1000 if live else None,
+        "ready_ms": (ready - start) * 1000 if ready else None,
+        "serving_ms": reported["serving_s"] * 1000 if reported.get("serving_s") is not None else None,
+        "warm_ms": reported["ready_s"] * 1000 if reported.get("ready_s") is not None else None,
+    }
+
+
+def summarize(runs):
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = {
+            "runs": len(values),
+            "median": round(statistics.median(values), 1) if values else None,
+            "min": round(min(values), 1) if values else None,
+            "max": round(max(values), 1) if values else None,
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'measure':<14}{'runs':>6}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for name, row in summary.items():
+        print(f"{name:<14}{row['runs']:>6}{str(row['median']):>12}{str(row['min']):>10}{str(row['max']):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766, help="Port the benchmark starts the API on")
+    parser.add_argument("--db_pool_warmup", type=int, default=1, help="Connections opened before ready")
+    parser.add_argument("--db_host", type=str, default=None,
+                        help="Database host for the API (default: DB_HOST), e.g. an unreachable one")
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    summary = summarize([start_once(args) for _ in range(args.runs)])
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "db_pool_warmup": args.db_pool_warmup, "results": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Multi-tenant benchmark with skewed tenant sizes.
+
+Creates tenants whose sizes follow a Zipf distribution (a few very large tenants,
+many small ones), then times the same queries and writes for the largest,
+median and smallest tenants, directly against the database. With the tables
+partitioned by user_token, the small tenants' latencies should not depend on
+the size of the large ones. Also reports how the rows spread over the
+partitions.
+
+Runs in throwaway users of its own, removed when it ends.
+
+Usage:
+    python bench/bench_tenants.py --tenants 50 --items 500000 --skew 1.2
+    python bench/bench_tenants.py --iterations 500 --json results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import uuid
+
+import psycopg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The benchmark times the database functions, so it connects to the database directly
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'dbname': os.getenv('DB_NAME', 'prism_vfs'),
+    'user': os.getenv('DB_USER', 'prism_user'),
+    'password': os.getenv('DB_PASSWORD', 'prism_password'),
+}
+
+# Files per directory of the generated trees
+FILES_PER_DIRECTORY = 100
+
+
+########################
+#  Data set
+########################
+
+def tenant_sizes(tenants, items, skew):
+    """Split items over tenants by a Zipf distribution, at least one file each."""
+    weights = [1 / rank ** skew for rank in range(1, tenants + 1)]
+    total = sum(weights)
+    return [max(1, round(items * w / total)) for w in weights]
+
+
+def create_tenant(cursor, user_token, files):
+    directories = -(-files // FILES_PER_DIRECTORY)
+    cursor.execute(
+        """
+        INSERT INTO directories (name, user_token)
+        SELECT 'dir_' || g, %(u)s FROM generate_series(1, %(n)s) g
+        """,
+        {"u": user_token, "n": directories},
+    )
+    cursor.execute(
+        """
+        INSERT INTO files (name, parent_id, user_token, storage_id, metadata)
+        SELECT 'file_' || g || '.txt', d.id, %(u)s, 'store_' || g, jsonb_build_object('size', g)
+        FROM generate_series(1, %(n)s) g
+        JOIN directories d ON d.user_token = %(u)s AND d.name = 'dir_' || (g %% %(dirs)s + 1)
+        """,
+        {"u": user_token, "n": files, "dirs": directories},
+    )
+
+
+def partition_rows(cursor):
+    """Rows of each partition of the files table."""
+    cursor.execute(
+        """
+        SELECT c.relname, c.reltuples::BIGINT
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'files'::regclass
+        ORDER BY c.relname
+        """
+    )
+    return dict(cursor.fetchall())
+
+
+########################
+#  Operations
+########################
+
+def run_operations(cursor, user_token, samples):
+    def call(name, query, params):
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        samples.setdefault(name, []).append(time.perf_counter() - start)
+        return row
+
+    call("list_root", "SELECT count(*) FROM directory_list_page(NULL, %s, 100)", (user_token,))
+    directory = call(
+        "directory_details", "SELECT * FROM directory_details("
+        "(SELECT id FROM directories WHERE user_token = %s AND name = 'dir_1'), %s)",
+        (user_token, user_token),
+    )[0]
+    call(
+        "list_directory", "SELECT count(*) FROM directory_list_page(%s, %s, 100)",
+        (directory["id"], user_token),
+    )
+    call(
+        "search",
+        "SELECT count(*) FROM (SELECT * FROM file_search_rows('file_1', NULL, NULL, NULL, %s) LIMIT 100) s",
+        (user_token,),
+    )
+    file = call(
+        "file_create", "SELECT * FROM file_create(%s, %s, %s, %s)",
+        (f"bench_{uuid.uuid4().hex[:8]}.txt", directory["id"], user_token, "store"),
+    )[0]
+    call("file_delete", "SELECT file_delete(%s, %s)", (file["id"], user_token))
+
+
+########################
+#  Runner
+########################
+
+def percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def summarize(samples):
+    summary = {}
+    for name, values in samples.items():
+        latencies = sorted(v * 1000 for v in values)
+        summary[name] = {
+            "count": len(values),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+        }
+    return summary
+
+
+def print_summary(results):
+    print(f"{'tenant':<10}{'files':>10}{'operation':>20}{'p50 ms':>10}{'p99 ms':>10}")
+    for tenant, result in results["tenants"].items():
+        for name, row in result["operations"].items():
+            print(f"{tenant:<10}{result['files']:>10}{name:>20}{row['p50_ms']:>10}{row['p99_ms']:>10}")
+    rows = results["partition_rows"]
+    if rows:
+        print(f"files partitions: {len(rows)}, rows min {min(rows.values())} / max {max(rows.values())}")
+
+
+def run(args):
+    prefix = f"bench_tenants_{uuid.uuid4().hex[:8]}"
+    sizes = tenant_sizes(args.tenants, args.items, args.skew)
+    users = [f"{prefix}_{rank}" for rank in range(len(sizes))]
+    # Largest, median and smallest tenant
+    measured = {"largest": 0, "median": len(sizes) // 2, "smallest": len(sizes) - 1}
+
+    with psycopg.connect(**DB_CONFIG, autocommit=True) as connection:
+        cursor = connection.cursor()
+        try:
+            for user_token, files in zip(users, sizes):
+                create_tenant(cursor, user_token, files)
+            cursor.execute("ANALYZE directories")
+            cursor.execute("ANALYZE files")
+
+            results = {"tenants": {}, "partition_rows": partition_rows(cursor)}
+            for tenant, rank in measured.items():
+                samples = {}
+                for _ in range(args.warmup):
+                    run_operations(cursor, users[rank], {})
+                for _ in range(args.iterations):
+                    run_operations(cursor, users[rank], samples)
+                results["tenants"][tenant] = {"files": sizes[rank], "operations": summarize(samples)}
+        finally:
+            for user_token in users:
+                cursor.execute("DELETE FROM directories WHERE user_token = %s", (user_token,))
+                for table in ("root_versions", "change_events"):
+                    cursor.execute(f"DELETE FROM {table} WHERE user_token = %s", (user_token,))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--items", type=int, default=500000, help="Files over all tenants")
+    parser.add_argument("--skew", type=float, default=1.2, help="Zipf exponent of the tenant sizes")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20, help="Iterations run before timing")
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_summary(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "tenants": args.tenants,
+                "items": args.items,
+                "skew": args.skew,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Multi-process scaling benchmark for the VFS API.
+
+Starts the API with 1, 2, 4, ... workers up to the number of CPU cores, runs the
+same closed-loop read load against each, and reports the throughput, latency
+percentiles (p50/p99), and the speedup and scaling efficiency relative to a
+single worker (efficiency = speedup / workers, 1.0 being linear scaling).
+
+The workers share one connection budget (--db_connection_budget), and the
+listing cache is disabled in every run, since workers only share it through
+Redis. The load comes from several client processes, so that the client is not
+the bottleneck. The database and the clients compete with the workers for the
+cores of this machine: for a clean measurement, run the database elsewhere and
+keep --workers below the cores left for the API.
+
+The API is started by the benchmark itself, against the database of the
+environment (.env), in a throwaway user of its own: no benchmark data set is
+needed.
+
+Usage:
+    python bench/bench_workers.py --duration 15
+    python bench/bench_workers.py --workers 1 2 4 8 --clients 8 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+import psycopg
+from psycopg.rows import dict_row
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The data set is created and removed directly in the database
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'dbname': os.getenv('DB_NAME', 'prism_vfs'),
+    'user': os.getenv('DB_USER', 'prism_user'),
+    'password': os.getenv('DB_PASSWORD', 'prism_password'),
+}
+
+# Directories and files of the benchmark user's directory
+DIRECTORIES = 20
+FILES = 200
+
+# Seconds the API is given to start
+STARTUP_TIMEOUT = 60
+
+
+########################
+#  Data set
+########################
+
+def create_data(cursor, user_token):
+    cursor.execute("SELECT * FROM directory_create(%s, NULL, %s)", ("bench_workers", user_token))
+    root_id = cursor.fetchone()["directory_details"]["id"]
+    cursor.execute(
+        """
+        INSERT INTO directories (name, parent_id, user_token)
+        SELECT 'dir_' || g, %(root)s, %(u)s FROM generate_series(1, %(dirs)s) g
+        RETURNING id::text
+        """,
+        {"root": root_id, "u": user_token, "dirs": DIRECTORIES},
+    )
+    dir_ids = [row["id"] for row in cursor.fetchall()]
+    cursor.execute(
+        """
+        INSERT INTO files (name, parent_id, user_token, storage_id, metadata)
+        SELECT 'file_' || g || '.txt', %(root)s, %(u)s, 'store_' || g, jsonb_build_object('size', g)
+        FROM generate_series(1, %(files)s) g
+        RETURNING id::text
+        """,
+        {"root": root_id, "u": user_token, "files": FILES},
+    )
+    file_ids = [row["id"] for row in cursor.fetchall()]
+    return {"user_token": user_token, "root_id": str(root_id), "dir_ids": dir_ids, "file_ids": file_ids}
+
+
+def delete_data(cursor, user_token):
+    cursor.execute("DELETE FROM directories WHERE user_token = %s", (user_token,))
+    for table in ("tags", "root_versions", "change_events"):
+        cursor.execute(f"DELETE FROM {table} WHERE user_token = %s", (user_token,))
+
+
+########################
+#  API process
+########################
+
+def start_api(args, workers):
+    process = subprocess.Popen([
+        sys.executable, "-m", "vfs_api",
+        "--host", "127.0.0.1",
+        "--port", str(args.port),
+        "--workers", str(workers),
+        "--db_connection_budget", str(args.db_connection_budget),
+        "--cache_max_entries", "0",
+    ])
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            raise SystemExit(f"The API exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{api_url(args)}/ready", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            stop_api(process)
+            raise SystemExit("The API did not start")
+        time.sleep(0.2)
+
+
+def stop_api(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=STARTUP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def api_url(args):
+    return f"http://127.0.0.1:{args.port}"
+
+
+########################
+#  Load
+########################
+
+async def op_list_directory(client, ctx):
+    return await client.get(
+        "/directories",
+        params={"parent_id": ctx["root_id"], "limit": 100, "user_token": ctx["user_token"]},
+    )
+
+
+async def op_get_directory(client, ctx):
+    return await client.get(
+        f"/directories/{random.choice(ctx['dir_ids'])}",
+        params={"user_token": ctx["user_token"]},
+    )
+
+
+async def op_get_file(client, ctx):
+    return await client.get(
+        f"/files/{random.choice(ctx['file_ids'])}",
+        params={"user_token": ctx["user_token"]},
+    )
+
+
+OPERATIONS = {
+    op_list_directory: 30,
+    op_get_directory: 35,
+    op_get_file: 35,
+}
+
+
+async def client_load(url, ctx, concurrency, duration):
+    """Run closed-loop clients until the deadline, and return their latencies and errors."""
+    ops, weights = list(OPERATIONS), list(OPERATIONS.values())
+    latencies, errors = [], 0
+
+    async def loop(client, deadline):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await random.choices(ops, weights)[0](client, ctx)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(loop(client, deadline) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_client(url, ctx, concurrency, duration, seed):
+    random.seed(seed)
+    return asyncio.run(client_load(url, ctx, concurrency, duration))
+
+
+def run_load(executor, args, ctx, duration):
+    """Run the load from every client process, and return all latencies, errors and elapsed time."""
+    per_client = max(1, args.concurrency // args.clients)
+    start = time.perf_counter()
+    futures = [
+        executor.submit(run_client, api_url(args), ctx, per_client, duration, args.seed + i)
+        for i in range(args.clients)
+    ]
+    results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    return latencies, sum(errors for _, errors in results), elapsed
+
+
+########################
+#  Runner
+########################
+
+def percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(v * 1000 for v in latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def default_workers():
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def print_summary(summary):
+    print(f"{'workers':>8}{'req/s':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'speedup':>10}{'efficiency':>12}")
+    for workers, row in summary.items():
+        print(
+            f"{workers:>8}{row['rps']:>10}{row['errors']:>8}{row['p50_ms']:>10}{row['p99_ms']:>10}"
+            f"{row['speedup']:>10}{row['efficiency']:>12}"
+        )
+
+
+def run(args):
+    user_token = f"bench_workers_{uuid.uuid4().hex[:8]}"
+    summary = {}
+    with psycopg.connect(**DB_CONFIG, autocommit=True, row_factory=dict_row) as connection:
+        cursor = connection.cursor()
+        try:
+            ctx = create_data(cursor, user_token)
+            with ProcessPoolExecutor(max_workers=args.clients) as executor:
+                for workers in args.workers:
+                    process = start_api(args, workers)
+                    try:
+                        run_load(executor, args, ctx, args.warmup)
+                        summary[workers] = summarize(*run_load(executor, args, ctx, args.duration))
+                    finally:
+                        stop_api(process)
+        finally:
+            delete_data(cursor, user_token)
+
+    base = summary[min(summary)]["rps"] / min(summary)
+    for workers, row in summary.items():
+        row["speedup"] = round(row["rps"] / base, 2)
+        row["efficiency"] = round(row["rps"] / base / workers, 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers(),
+                        help="Worker counts to run (default: 1, 2, 4, ... up to the CPU cores)")
+    parser.add_argument("--port", type=int, default=8765, help="Port the benchmark starts the API on")
+    parser.add_argument("--db_connection_budget", type=int, default=64,
+                        help="Database connections shared by the workers of each run")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes generating the load")
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight, all clients together")
+    parser.add_argument("--duration", type=float, default=15, help="Duration of each run in seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before each run")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    summary = run(args)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "cores": os.cpu_count(),
+                "concurrency": args.concurrency,
+                "db_connection_budget": args.db_connection_budget,
+                "results": summary,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
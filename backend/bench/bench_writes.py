@@ -0,0 +1,277 @@
+"""
+Write-path micro-benchmark for the VFS database functions.
+
+Calls each write function directly, without the API, one statement at a time
+on a single connection, and reports per-function latency percentiles (p50/p99)
+and calls per second. Every iteration creates a directory with a file, updates,
+tags and copies the file, renames the directory and deletes the directory and
+file again, so the data set barely grows while the benchmark runs.
+
+Runs in a throwaway user of its own, no benchmark data set is needed.
+
+The import scenario measures how a long write transaction holds up the other writers of
+its user: writers create and delete files in a directory of their own, first alone, then
+while an import runs into another directory of the same user, then while it runs into
+another user. Writers of a user are serialized by the change events lock (see
+change_events_lock), so the second phase shows what it costs them.
+
+Usage:
+    python bench/bench_writes.py --iterations 2000
+    python bench/bench_writes.py --json results.json
+    python bench/bench_writes.py --scenario import --writers 4 --import_files 50000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+
+import psycopg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The benchmark times the database functions, so it connects to the database directly
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'dbname': os.getenv('DB_NAME', 'prism_vfs'),
+    'user': os.getenv('DB_USER', 'prism_user'),
+    'password': os.getenv('DB_PASSWORD', 'prism_password'),
+}
+
+
+########################
+#  Operations
+########################
+
+def run_iteration(cursor, user_token, root_id, i, samples):
+    def call(name, query, params):
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        samples.setdefault(name, []).append(time.perf_counter() - start)
+        return row[0] if row else None
+
+    directory = call(
+        "directory_create", "SELECT * FROM directory_create(%s, %s, %s)",
+        (f"dir_{i}", root_id, user_token),
+    )
+    file = call(
+        "file_create", "SELECT * FROM file_create(%s, %s, %s, %s, %s)",
+        (f"file_{i}.txt", directory["id"], user_token, f"storage_{i}", json.dumps({"size": i})),
+    )
+    call(
+        "file_update", "SELECT * FROM file_update(%s, %s, NULL, %s, %s)",
+        (file["id"], f"renamed_{i}.txt", json.dumps({"size": i + 1}), user_token),
+    )
+    call(
+        "file_tags_set", "SELECT * FROM file_tags_set(%s, %s, %s)",
+        (file["id"], ["bench", f"tag_{i % 10}"], user_token),
+    )
+    call(
+        "file_copy", "SELECT * FROM file_copy(%s, %s, %s)",
+        (file["id"], root_id, user_token),
+    )
+    call(
+        "directory_update", "SELECT * FROM directory_update(%s, %s, NULL, %s)",
+        (directory["id"], f"renamed_dir_{i}", user_token),
+    )
+    call(
+        "file_delete", "SELECT file_delete(%s, %s)",
+        (file["id"], user_token),
+    )
+    call(
+        "directory_delete", "SELECT directory_delete(%s, false, %s)",
+        (directory["id"], user_token),
+    )
+    # The copy is left at the root of the run, removed by the cleanup
+
+
+def run_import(connection, user_token, parent_id, files):
+    """Import files in directories of 1000 as the import endpoint does, in one transaction."""
+    with connection.transaction(), connection.cursor() as cursor:
+        cursor.execute(
+            """
+            CREATE TEMP TABLE import_staging (
+                path TEXT[] NOT NULL,
+                is_dir BOOLEAN NOT NULL,
+                storage_id TEXT,
+                metadata JSONB,
+                tags TEXT[]
+            ) ON COMMIT DROP
+            """
+        )
+        with cursor.copy("COPY import_staging (path, is_dir, storage_id, metadata, tags) FROM STDIN") as copy:
+            for i in range(files):
+                copy.write_row(([f"dir_{i // 1000}", f"file_{i}.txt"], False, f"storage_{i}", None, None))
+        cursor.execute("SELECT * FROM import_apply(%s, %s)", (parent_id, user_token))
+
+
+def run_writer(user_token, parent_id, stop, samples):
+    with psycopg.connect(**DB_CONFIG, autocommit=True) as connection:
+        cursor = connection.cursor()
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            cursor.execute(
+                "SELECT * FROM file_create(%s, %s, %s, %s)",
+                (f"writer_{uuid.uuid4().hex}.txt", parent_id, user_token, f"storage_{i}"),
+            )
+            file = cursor.fetchone()[0]
+            cursor.execute("SELECT file_delete(%s, %s)", (file["id"], user_token))
+            samples.append(time.perf_counter() - start)
+            i += 1
+
+
+def run_phase(args, writer_token, writer_dir, import_target=None):
+    """Run the writers until the import into import_target (user, directory) ends, or for duration seconds."""
+    stop = threading.Event()
+    samples = [[] for _ in range(args.writers)]
+    threads = [
+        threading.Thread(target=run_writer, args=(writer_token, writer_dir, stop, samples[w]))
+        for w in range(args.writers)
+    ]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    try:
+        if import_target is None:
+            time.sleep(args.duration)
+        else:
+            with psycopg.connect(**DB_CONFIG, autocommit=True) as connection:
+                run_import(connection, *import_target, args.import_files)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(v * 1000 for writer in samples for v in writer)
+    return {
+        "seconds": round(elapsed, 2),
+        "cycles": len(latencies),
+        "cycles_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 3) if latencies else None,
+        "max_ms": round(latencies[-1], 3) if latencies else None,
+    }
+
+
+########################
+#  Runner
+########################
+
+def percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def summarize(samples):
+    summary = {}
+    for name, values in samples.items():
+        latencies = sorted(v * 1000 for v in values)
+        summary[name] = {
+            "count": len(values),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+            "calls_per_s": round(len(values) / sum(values), 1),
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'function':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'calls/s':>10}")
+    for name, row in summary.items():
+        print(
+            f"{name:<20}{row['count']:>8}{row['p50_ms']:>10}{row['p99_ms']:>10}"
+            f"{row['mean_ms']:>10}{row['calls_per_s']:>10}"
+        )
+
+
+def cleanup(cursor, user_token):
+    cursor.execute("DELETE FROM directories WHERE user_token = %s", (user_token,))
+    for table in ("tags", "root_versions", "change_events"):
+        cursor.execute(f"DELETE FROM {table} WHERE user_token = %s", (user_token,))
+
+
+def run_import_scenario(args):
+    user_token = f"bench_writes_{uuid.uuid4().hex[:8]}"
+    other_token = f"bench_writes_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(**DB_CONFIG, autocommit=True) as connection:
+        cursor = connection.cursor()
+        try:
+            def create(name, token):
+                cursor.execute("SELECT * FROM directory_create(%s, NULL, %s)", (name, token))
+                return cursor.fetchone()[0]["id"]
+
+            writer_dir = create("bench_writers", user_token)
+            return {
+                "alone": run_phase(args, user_token, writer_dir),
+                "import_same_user": run_phase(args, user_token, writer_dir, (user_token, create("bench_import", user_token))),
+                "import_other_user": run_phase(args, user_token, writer_dir, (other_token, create("bench_import", other_token))),
+            }
+        finally:
+            cleanup(cursor, user_token)
+            cleanup(cursor, other_token)
+
+
+def print_phases(phases):
+    print(f"{'writers':<20}{'seconds':>9}{'cycles':>8}{'cycles/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, row in phases.items():
+        print(
+            f"{name:<20}{row['seconds']:>9}{row['cycles']:>8}{row['cycles_per_s']:>10}"
+            f"{row['p50_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}"
+        )
+
+
+def run(args):
+    user_token = f"bench_writes_{uuid.uuid4().hex[:8]}"
+    samples = {}
+    with psycopg.connect(**DB_CONFIG, autocommit=True) as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT * FROM directory_create(%s, NULL, %s)", ("bench_writes", user_token))
+            root_id = cursor.fetchone()[0]["id"]
+            for i in range(args.warmup):
+                run_iteration(cursor, user_token, root_id, args.iterations + i, {})
+            for i in range(args.iterations):
+                run_iteration(cursor, user_token, root_id, i, samples)
+        finally:
+            cleanup(cursor, user_token)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50, help="Iterations run before timing")
+    parser.add_argument("--scenario", choices=("functions", "import"), default="functions")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent writers (import scenario)")
+    parser.add_argument("--import_files", type=int, default=50000, help="Files imported (import scenario)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds the writers run alone (import scenario)")
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    if args.scenario == "import":
+        phases = run_import_scenario(args)
+        print_phases(phases)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"writers": args.writers, "import_files": args.import_files, "results": phases}, f, indent=2)
+        return
+
+    summary = run(args)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"iterations": args.iterations, "results": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
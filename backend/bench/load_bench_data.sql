@@ -0,0 +1,115 @@
+/*
+ * Benchmark Data Population Script
+ *
+ * This script populates the database with a large synthetic tree for the
+ * 'bench' user. It is used by the scripts in this directory and does not touch
+ * the mock data of the other users.
+ *
+ * Structure:
+ *   bench_root/
+ *   ├── dir_001/ ... dir_100/      500 files each (50,000 files)
+ *   ├── ingest/                    200,000 files in a single directory
+ *   └── copy_src/
+ *       └── sub_01/ ... sub_10/    100 files each (1,000 files)
+ *
+ * Tags: hot, cold, archived, review (assigned deterministically by file number)
+ */
+
+-- Start fresh - Clear existing benchmark data
+DELETE FROM directories WHERE user_token = 'bench';
+DELETE FROM files WHERE user_token = 'bench';
+DELETE FROM tags WHERE user_token = 'bench';
+
+DO $$
+DECLARE
+    bench_user text := 'bench';
+    v_root_id uuid;
+    v_copy_id uuid;
+    v_ingest_id uuid;
+BEGIN
+
+INSERT INTO directories (name, parent_id, user_token)
+VALUES ('bench_root', NULL, bench_user)
+RETURNING id INTO v_root_id;
+
+INSERT INTO directories (name, parent_id, user_token)
+VALUES ('copy_src', v_root_id, bench_user)
+RETURNING id INTO v_copy_id;
+
+INSERT INTO directories (name, parent_id, user_token)
+VALUES ('ingest', v_root_id, bench_user)
+RETURNING id INTO v_ingest_id;
+
+-- Wide directories under bench_root
+INSERT INTO directories (name, parent_id, user_token)
+SELECT format('dir_%s', lpad(g::text, 3, '0')), v_root_id, bench_user
+FROM generate_series(1, 100) g;
+
+-- Subdirectories of the copy source
+INSERT INTO directories (name, parent_id, user_token)
+SELECT format('sub_%s', lpad(g::text, 2, '0')), v_copy_id, bench_user
+FROM generate_series(1, 10) g;
+
+-- Files in every wide directory
+INSERT INTO files (name, parent_id, storage_id, metadata, user_token)
+SELECT
+    format('file_%s_%s.txt', substr(d.name, 5), lpad(g::text, 3, '0')),
+    d.id,
+    'store_' || gen_random_uuid(),
+    jsonb_build_object(
+        'type', (ARRAY['text', 'pdf', 'image', 'audio'])[1 + g % 4],
+        'size', g * 1024,
+        'status', CASE WHEN g % 3 = 0 THEN 'final' ELSE 'draft' END
+    ),
+    bench_user
+FROM directories d
+CROSS JOIN generate_series(1, 500) g
+WHERE d.parent_id = v_root_id
+    AND d.name LIKE 'dir\_%';
+
+-- Files in the copy source subdirectories
+INSERT INTO files (name, parent_id, storage_id, metadata, user_token)
+SELECT
+    format('doc_%s.md', lpad(g::text, 3, '0')),
+    d.id,
+    'store_' || gen_random_uuid(),
+    jsonb_build_object('type', 'markdown', 'size', g * 512),
+    bench_user
+FROM directories d
+CROSS JOIN generate_series(1, 100) g
+WHERE d.parent_id = v_copy_id;
+
+-- One very large directory, as produced by ingestion jobs
+INSERT INTO files (name, parent_id, storage_id, metadata, user_token)
+SELECT
+    format('item_%s.dat', lpad(g::text, 6, '0')),
+    v_ingest_id,
+    'store_' || gen_random_uuid(),
+    jsonb_build_object('type', 'binary', 'size', g),
+    bench_user
+FROM generate_series(1, 200000) g;
+
+-- Tags
+INSERT INTO tags (name, user_token)
+VALUES ('hot', bench_user), ('cold', bench_user), ('archived', bench_user), ('review', bench_user);
+
+INSERT INTO file_tags (file_id, tag_id, user_token)
+SELECT f.id, t.id, bench_user
+FROM files f
+CROSS JOIN tags t
+WHERE f.user_token = bench_user
+    AND t.user_token = bench_user
+    AND f.parent_id IS DISTINCT FROM v_ingest_id
+    AND (
+        (t.name = 'hot' AND f.name LIKE '%0.txt') OR
+        (t.name = 'cold' AND f.name NOT LIKE '%0.txt') OR
+        (t.name = 'archived' AND f.name LIKE '%00.txt') OR
+        (t.name = 'review' AND f.name LIKE 'file_00%')
+    );
+
+END $$;
+
+ANALYZE directories;
+ANALYZE files;
+ANALYZE file_tags;
+ANALYZE tags;
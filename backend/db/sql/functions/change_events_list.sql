@@ -0,0 +1,77 @@
+/*
+ * Function: change_events_list
+ *
+ * Lists a user's change events after a position of the feed, in order, optionally only those of
+ * a subtree. The API streams them from GET /events.
+ *
+ * Parameters:
+ *   - p_user_token (TEXT): The user token whose events are listed
+ *   - p_after (BIGINT): Sequence number of the last event already read (0 for the beginning)
+ *   - p_root_path (UUID[]): Materialized path of the subtree's root directory, as read when the
+ *     feed started (NULL for all the user's events)
+ *   - p_limit (INTEGER): Maximum number of events to return
+ *
+ * Returns:
+ *   TABLE:
+ *     - seq (BIGINT): Sequence number of the event, the position to resume after
+ *     - op (TEXT): 'created', 'updated', 'moved' or 'deleted'
+ *     - type (TEXT): 'directory' or 'file'
+ *     - id (UUID): The item's ID
+ *     - name (TEXT): The item's name after the change
+ *     - parent_id (UUID): Parent after the change, before it for deletes (NULL at the root level)
+ *     - previous_parent_id (UUID): Parent before a move
+ *     - created_at (TIMESTAMPTZ): When the change was made
+ *
+ * Implementation Notes:
+ *   - Reads idx_change_events_user_seq from p_after on, the subtree filter is applied to those
+ *     rows: an item is in the subtree when the root is among its containing directories, before
+ *     or after a move, so moves in and out of the subtree are both listed
+ *   - The changes of the root and of its ancestors are listed too, they change the subtree's
+ *     path. The path is the one read when the feed started, so that the delete of an ancestor,
+ *     which takes the root with it, is still listed once the root is gone
+ *   - Deleting a directory deletes its contents, which have no events of their own
+ *
+ * Examples:
+ *   -- Events of user123 after event 1000
+ *   SELECT * FROM change_events_list('user123', 1000, NULL, 500);
+ */
+
+CREATE OR REPLACE FUNCTION change_events_list(
+    p_user_token TEXT,
+    p_after BIGINT DEFAULT 0,
+    p_root_path UUID[] DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+    seq BIGINT,
+    op TEXT,
+    type TEXT,
+    id UUID,
+    name TEXT,
+    parent_id UUID,
+    previous_parent_id UUID,
+    created_at TIMESTAMPTZ
+) AS $$
+    SELECT e.seq, e.op, e.item_type, e.item_id, e.name, e.parent_id, e.previous_parent_id, e.created_at
+    FROM change_events e
+    WHERE e.user_token = p_user_token
+        AND e.seq > p_after
+        AND (
+            p_root_path IS NULL
+            OR e.item_id = ANY(p_root_path)
+            OR e.ancestors @> ARRAY[p_root_path[cardinality(p_root_path)]]
+            OR e.previous_ancestors @> ARRAY[p_root_path[cardinality(p_root_path)]]
+        )
+    ORDER BY e.seq
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION change_events_list(TEXT, BIGINT, UUID[], INTEGER) IS
+'Lists a user''s change events after a sequence number, in order, optionally within a subtree.
+Parameters:
+  - p_user_token: User whose events are listed
+  - p_after: Sequence number of the last event already read
+  - p_root_path: Path of the subtree''s root directory (NULL for all events)
+  - p_limit: Maximum number of events
+Returns: seq, op, type, id, name, parent_id, previous_parent_id and created_at of each event';
@@ -0,0 +1,47 @@
+/*
+ * Function: change_events_prune
+ *
+ * Deletes the change events older than a retention period, and records for each user the last
+ * event deleted: a feed resuming from before it has missed changes, and must reload its state.
+ * Meant to be run periodically, e.g. daily from cron or pg_cron.
+ *
+ * Parameters:
+ *   - p_retention (INTERVAL): How long events are kept
+ *
+ * Returns:
+ *   BIGINT: Number of events deleted
+ *
+ * Implementation Notes:
+ *   - Events are appended in time order, idx_change_events_created_at (BRIN) finds the old ones
+ *     without a full scan
+ *
+ * Examples:
+ *   SELECT change_events_prune('7 days');
+ */
+
+CREATE OR REPLACE FUNCTION change_events_prune(
+    p_retention INTERVAL DEFAULT '30 days'
+)
+RETURNS BIGINT AS $$
+    WITH pruned AS (
+        DELETE FROM change_events
+        WHERE created_at < CURRENT_TIMESTAMP - p_retention
+        RETURNING user_token, seq
+    ),
+    recorded AS (
+        INSERT INTO change_events_pruned (user_token, seq)
+        SELECT user_token, max(seq)
+        FROM pruned
+        GROUP BY user_token
+        ON CONFLICT (user_token) DO UPDATE
+        SET seq = GREATEST(change_events_pruned.seq, EXCLUDED.seq)
+    )
+    SELECT count(*) FROM pruned;
+$$ LANGUAGE sql;
+
+-- Add function comment
+COMMENT ON FUNCTION change_events_prune(INTERVAL) IS
+'Deletes the change events older than a retention period, recording the last one deleted per user.
+Parameters:
+  - p_retention: How long events are kept
+Returns: the number of events deleted';
@@ -21,10 +21,15 @@
  *
  * Implementation Notes:
  *   - Performs a deep copy of the entire directory structure
- *   - Preserves all file metadata and storage IDs
+ *   - Preserves all file metadata, storage IDs and tags
  *   - Creates new UUIDs for all copied items (directories and files)
  *   - Maintains user_token based access control throughout
- *   - Uses recursive CTEs for efficient tree traversal
+ *   - Finds the subtree with one lookup on the materialized path (idx_directories_path)
+ *   - Generates the old ID -> new ID mapping up front, then copies directories, files and
+ *     tags with one set-based INSERT each, regardless of tree depth
+ *   - Ownership, the subtree check and the name are read with one lookup of the source and one of
+ *     the destination. Name conflicts are detected by the unique (user_token, parent_id, name)
+ *     index when inserting the copy, rather than checked beforehand
  *   - Implements transactional safety with automatic rollback on failure
  *
  * Examples:
@@ -52,117 +57,94 @@ RETURNS TABLE (directory_details JSON) AS $$
 DECLARE
     v_new_root_id UUID;
     v_source_name TEXT;
+    v_destination_path UUID[];
+    v_dir_ids UUID[];
+    v_new_dir_ids UUID[];
     result JSON;
-    v_is_subdirectory BOOLEAN;
 BEGIN
-    -- Validate source directory exists and belongs to user
-    IF NOT validate_directory_ownership(p_source_id, p_user_token) THEN
-        RAISE EXCEPTION 'Source directory not found or access denied'
-            USING ERRCODE = 'P0002'; -- no_data_found
-    END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
 
-    -- Get source directory name
+    -- Source directory: ownership and name in one lookup
     SELECT name INTO v_source_name
     FROM directories
-    WHERE id = p_source_id;
+    WHERE id = p_source_id
+        AND user_token = p_user_token;
 
-    -- If destination parent specified, validate it exists and belongs to user
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Source directory not found or access denied'
+            USING ERRCODE = 'P0002'; -- no_data_found
+    END IF;
+
+    -- Destination parent: ownership, and its path to prevent copying the directory into
+    -- itself or its subdirectories
     IF p_destination_parent_id IS NOT NULL THEN
-        IF NOT validate_directory_ownership(p_destination_parent_id, p_user_token) THEN
+        SELECT path INTO v_destination_path
+        FROM directories
+        WHERE id = p_destination_parent_id
+            AND user_token = p_user_token;
+
+        IF NOT FOUND THEN
             RAISE EXCEPTION 'Destination parent directory not found or access denied'
                 USING ERRCODE = 'P0002'; -- no_data_found
         END IF;
 
-        -- Prevent copying directory into itself or its subdirectories
-        IF validate_is_subdirectory(p_destination_parent_id, p_source_id, p_user_token) THEN
+        IF p_source_id = ANY(v_destination_path) THEN
             RAISE EXCEPTION 'Cannot copy directory into itself or its subdirectories'
                 USING ERRCODE = 'P0001'; -- raise_exception
         END IF;
     END IF;
 
-    -- Check for name conflict in destination
-    IF validate_directory_name_exists(v_source_name, p_destination_parent_id, p_user_token) THEN
-        RAISE EXCEPTION 'Directory with name "%" already exists in destination', v_source_name
-            USING ERRCODE = '23505'; -- unique_violation
-    END IF;
-
-    -- Start transaction for the entire copy operation
-    BEGIN
-        -- First, create the new root directory
-        INSERT INTO directories (
-            name,
-            parent_id,
-            user_token
-        )
-        VALUES (
-            v_source_name,
-            p_destination_parent_id,
-            p_user_token
-        )
-        RETURNING id INTO v_new_root_id;
-
-        -- Copy directory structure and files using recursive CTE
-        WITH RECURSIVE dir_tree AS (
-            -- Base case: direct children of source directory
-            SELECT
-                d.id as source_id,
-                d.name,
-                d.parent_id as source_parent_id,
-                v_new_root_id as new_parent_id,
-                1 as level
-            FROM directories d
-            WHERE d.parent_id = p_source_id
-                AND d.user_token = p_user_token
-
-            UNION ALL
+    -- A name conflict in the destination fails the insert of the copied root with
+    -- unique_violation (23505), and the whole copy with it.
 
-            -- Recursive case: deeper levels
-            SELECT
-                d.id as source_id,
-                d.name,
-                d.parent_id as source_parent_id,
-                nd.id as new_parent_id,
-                dt.level + 1
-            FROM directories d
-            INNER JOIN dir_tree dt ON dt.source_id = d.parent_id
-            INNER JOIN directories nd ON nd.name = dt.name
-                AND nd.parent_id = dt.new_parent_id
-                AND nd.user_token = p_user_token
-            WHERE d.user_token = p_user_token
-        )
-        -- Copy directories
-        INSERT INTO directories (
-            name,
-            parent_id,
-            user_token
-        )
+    -- Map every directory of the source subtree to a new ID up front. The copies are
+    -- then inserted in one statement, and parents are resolved through the mapping
+    -- instead of being looked up again by name.
+    -- Directories are ordered parents first, which the path trigger relies on.
+    SELECT array_agg(id ORDER BY array_length(path, 1), id)
+    INTO v_dir_ids
+    FROM directories
+    WHERE path @> ARRAY[p_source_id]
+        AND user_token = p_user_token;
+
+    v_new_dir_ids := ARRAY(SELECT gen_random_uuid() FROM unnest(v_dir_ids));
+    v_new_root_id := v_new_dir_ids[1];
+
+    -- Copy directories, the source root goes under the destination
+    INSERT INTO directories (
+        id,
+        name,
+        parent_id,
+        user_token
+    )
+    SELECT
+        dm.new_id,
+        CASE WHEN d.id = p_source_id THEN v_source_name ELSE d.name END,
+        CASE WHEN d.id = p_source_id THEN p_destination_parent_id ELSE pm.new_id END,
+        p_user_token
+    FROM unnest(v_dir_ids, v_new_dir_ids) WITH ORDINALITY AS dm(old_id, new_id, ord)
+    INNER JOIN directories d ON d.id = dm.old_id
+        AND d.user_token = p_user_token
+    LEFT JOIN unnest(v_dir_ids, v_new_dir_ids) AS pm(old_id, new_id) ON pm.old_id = d.parent_id
+    ORDER BY dm.ord;
+
+    -- Copy files and their tags, through the file ID mapping
+    WITH file_mapping AS MATERIALIZED (
         SELECT
-            dt.name,
-            dt.new_parent_id,
-            p_user_token
-        FROM dir_tree dt;
-
-        -- Copy files
-        WITH RECURSIVE dir_mapping AS (
-            -- Base case: root directory mapping
-            SELECT
-                p_source_id as old_id,
-                v_new_root_id as new_id
-
-            UNION ALL
-
-            -- Add all other directory mappings
-            SELECT
-                d.id as old_id,
-                nd.id as new_id
-            FROM directories d
-            INNER JOIN dir_mapping dm ON d.parent_id = dm.old_id
-            INNER JOIN directories nd ON nd.parent_id = dm.new_id
-                AND nd.name = d.name
-                AND nd.user_token = p_user_token
-            WHERE d.user_token = p_user_token
-        )
+            f.id AS old_id,
+            gen_random_uuid() AS new_id,
+            dm.new_id AS new_parent_id,
+            f.name,
+            f.storage_id,
+            f.metadata
+        FROM unnest(v_dir_ids, v_new_dir_ids) AS dm(old_id, new_id)
+        INNER JOIN files f ON f.parent_id = dm.old_id
+        WHERE f.user_token = p_user_token
+    ),
+    copied_files AS (
         INSERT INTO files (
+            id,
             name,
             parent_id,
             storage_id,
@@ -170,31 +152,30 @@ BEGIN
             user_token
         )
         SELECT
-            f.name,
-            dm.new_id,
-            f.storage_id,
-            f.metadata,
+            fm.new_id,
+            fm.name,
+            fm.new_parent_id,
+            fm.storage_id,
+            fm.metadata,
             p_user_token
-        FROM files f
-        INNER JOIN dir_mapping dm ON f.parent_id = dm.old_id
-        WHERE f.user_token = p_user_token;
-
-        -- Get details of the new root directory
-        SELECT d.directory_details INTO result
-        FROM directory_details(v_new_root_id, p_user_token) d;
-
-        RETURN QUERY SELECT result;
-    EXCEPTION
-        WHEN OTHERS THEN
-            -- Cleanup on error (will be rolled back anyway, but good practice)
-            DELETE FROM directories WHERE id = v_new_root_id;
-            RAISE;
-    END;
-
-EXCEPTION
-    WHEN unique_violation THEN
-        RAISE EXCEPTION 'Name conflict occurred during copy operation'
-            USING ERRCODE = '23505'; -- unique_violation
+        FROM file_mapping fm
+    )
+    INSERT INTO file_tags (file_id, tag_id, user_token)
+    SELECT
+        fm.new_id,
+        ft.tag_id,
+        p_user_token
+    FROM file_mapping fm
+    INNER JOIN file_tags ft ON ft.file_id = fm.old_id
+        AND ft.user_token = p_user_token;
+
+    -- Details of the new root directory, whose child counts the triggers have updated
+    SELECT directory_json(d) INTO result
+    FROM directories d
+    WHERE d.id = v_new_root_id
+        AND d.user_token = p_user_token;
+
+    RETURN QUERY SELECT result;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -213,7 +194,7 @@ Raises:
   - 23505: Name conflict in destination location
 Notes:
   - Copies entire directory structure including all subdirectories
-  - Preserves file metadata and storage IDs
+  - Preserves file metadata, storage IDs and tags
   - Creates new UUIDs for all copied items
   - Maintains user_token based access control';
 
@@ -20,11 +20,13 @@
  *   - 23505: Name conflict detected (directory with same name exists in parent)
  *
  * Implementation Notes:
- *   - Validates parent directory existence and ownership (if parent_id provided)
- *   - Enforces unique directory names within the same parent
+ *   - Validates parent directory existence and ownership (if parent_id provided) and creates the
+ *     directory in a single INSERT, name conflicts being skipped with ON CONFLICT on the unique
+ *     (user_token, parent_id, name) index
+ *   - The parent and name are only looked up again when nothing was inserted, to report why
  *   - Assigns ownership via user_token
  *   - Creates new UUID for the directory
- *   - Returns complete directory details via directory_details function
+ *   - Returns the directory details built from the inserted row (see directory_json)
  *
  * Examples:
  *   -- Create a root-level directory
@@ -49,46 +51,44 @@ CREATE OR REPLACE FUNCTION directory_create(
 )
 RETURNS TABLE (directory_details JSON) AS $$
 DECLARE
-    v_new_id UUID;
     result JSON;
 BEGIN
-    -- Validate parent directory exists and belongs to user if parent_id is provided
-    IF p_parent_id IS NOT NULL THEN
-        IF NOT validate_directory_ownership(p_parent_id, p_user_token) THEN
-            RAISE EXCEPTION 'Parent directory not found or access denied'
-                USING ERRCODE = 'P0002'; -- no_data_found
-        END IF;
-    END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
 
-    -- Check for duplicate name in the same parent directory
-    IF validate_directory_name_exists(p_name, p_parent_id, p_user_token) THEN
-        RAISE EXCEPTION 'Directory with name "%" already exists in this location', p_name
-            USING ERRCODE = '23505'; -- unique_violation
-    END IF;
-
-    -- Create new directory
-    INSERT INTO directories (
+    -- One statement checks the parent, the name and creates the directory: the parent's
+    -- ownership is part of the INSERT and name conflicts are resolved by the unique index
+    INSERT INTO directories AS d (
         name,
         parent_id,
         user_token
     )
-    VALUES (
+    SELECT
         p_name,
         p_parent_id,
         p_user_token
-    )
-    RETURNING id INTO v_new_id;
+    WHERE p_parent_id IS NULL
+        OR EXISTS (
+            SELECT 1
+            FROM directories p
+            WHERE p.id = p_parent_id
+                AND p.user_token = p_user_token
+        )
+    ON CONFLICT (user_token, parent_id, name) DO NOTHING
+    RETURNING directory_json(d) INTO result;
 
-    -- Get full directory details using existing function
-    SELECT d.directory_details INTO result
-    FROM directory_details(v_new_id, p_user_token) d;
-
-    RETURN QUERY SELECT result;
+    -- Nothing inserted, find out why
+    IF result IS NULL THEN
+        IF p_parent_id IS NOT NULL AND NOT validate_directory_ownership(p_parent_id, p_user_token) THEN
+            RAISE EXCEPTION 'Parent directory not found or access denied'
+                USING ERRCODE = 'P0002'; -- no_data_found
+        END IF;
 
-EXCEPTION
-    WHEN unique_violation THEN
         RAISE EXCEPTION 'Directory with name "%" already exists in this location', p_name
             USING ERRCODE = '23505'; -- unique_violation
+    END IF;
+
+    RETURN QUERY SELECT result;
 END;
 $$ LANGUAGE plpgsql;
 
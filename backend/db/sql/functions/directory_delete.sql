@@ -23,14 +23,19 @@
  *     * Deletion operation failed
  *
  * Implementation Notes:
- *   - Validates directory existence and ownership before deletion
+ *   - Validates directory existence and ownership in the DELETE itself, and only looks the
+ *     directory up again when nothing was deleted, to report why
  *   - In non-recursive mode:
- *     * Verifies directory is empty (no subdirectories or files)
+ *     * Verifies directory is empty from its dir_count and file_count
  *     * Fails if directory contains any items
  *   - In recursive mode:
- *     * Utilizes PostgreSQL's CASCADE DELETE functionality
- *     * Automatically removes all subdirectories and files
- *     * Maintains referential integrity via foreign key constraints
+ *     * Finds the subtree from the materialized path (idx_directories_path)
+ *     * Deletes all its files, then all its directories, in a single statement, so the count,
+ *       rollup and change event triggers run once per table instead of once per directory
+ *     * The foreign keys' ON DELETE CASCADE still removes the tags of the files, with one
+ *       query per file, which takes most of the time of large deletes
+ *     * Runs with generic plans, which those queries also use instead of being planned
+ *       again for every file
  *   - Only affects items owned by the requesting user
  *   - Transaction safe
  *
@@ -56,57 +61,68 @@ CREATE OR REPLACE FUNCTION directory_delete(
     p_user_token TEXT DEFAULT 'public'
 )
 RETURNS VOID AS $$
+DECLARE
+    v_dir_count INTEGER;
+    v_file_count INTEGER;
+    v_subtree UUID[];
 BEGIN
-    -- Validate directory exists and belongs to user
-    IF NOT validate_directory_ownership(p_directory_id, p_user_token) THEN
-        RAISE EXCEPTION 'Directory not found or access denied'
-            USING ERRCODE = 'P0002'; -- no_data_found
-    END IF;
-
-    -- Check if directory has contents when non-recursive delete is requested
-    IF NOT p_recursive THEN
-        -- Check for subdirectories
-        IF EXISTS (
-            SELECT 1
-            FROM directories
-            WHERE parent_id = p_directory_id
-                AND user_token = p_user_token
-        ) THEN
-            RAISE EXCEPTION 'Directory contains subdirectories. Use recursive delete to remove'
-                USING ERRCODE = 'P0001'; -- raise_exception
-        END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
 
-        -- Check for files
-        IF EXISTS (
-            SELECT 1
-            FROM files
-            WHERE parent_id = p_directory_id
-                AND user_token = p_user_token
-        ) THEN
-            RAISE EXCEPTION 'Directory contains files. Use recursive delete to remove'
-                USING ERRCODE = 'P0001'; -- raise_exception
-        END IF;
-    END IF;
-
-    -- If recursive delete is requested or directory is empty, proceed with deletion
     IF p_recursive THEN
-        -- Using CASCADE will automatically delete all subdirectories and files
-        -- due to the foreign key constraints with ON DELETE CASCADE
+        -- The whole subtree, from the materialized path (idx_directories_path)
+        SELECT array_agg(id) INTO v_subtree
+        FROM directories
+        WHERE path @> ARRAY[p_directory_id]
+            AND user_token = p_user_token;
+
+        -- One statement deletes the files of all its directories, looked up by parent, then the
+        -- directories. The statement triggers run once for each table and find the parents of all
+        -- but the top directory gone, so only its parent's counts and rollups change and only its
+        -- deletion is recorded. ON DELETE CASCADE finds no directories or files left.
+        WITH deleted_files AS (
+            DELETE FROM files
+            WHERE user_token = p_user_token
+                AND parent_id = ANY(v_subtree)
+        )
         DELETE FROM directories
-        WHERE id = p_directory_id;
+        WHERE user_token = p_user_token
+            AND id = ANY(v_subtree);
     ELSE
-        -- Non-recursive delete (already verified directory is empty)
+        -- One statement checks ownership and emptiness, from the maintained child counts, and deletes
         DELETE FROM directories
-        WHERE id = p_directory_id;
+        WHERE id = p_directory_id
+            AND user_token = p_user_token
+            AND dir_count = 0
+            AND file_count = 0;
     END IF;
 
-    -- Check if deletion was successful
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    -- Nothing deleted, find out why
+    SELECT dir_count, file_count INTO v_dir_count, v_file_count
+    FROM directories
+    WHERE id = p_directory_id
+        AND user_token = p_user_token;
+
     IF NOT FOUND THEN
-        RAISE EXCEPTION 'Directory deletion failed'
+        RAISE EXCEPTION 'Directory not found or access denied'
+            USING ERRCODE = 'P0002'; -- no_data_found
+    ELSIF v_dir_count > 0 THEN
+        RAISE EXCEPTION 'Directory contains subdirectories. Use recursive delete to remove'
+            USING ERRCODE = 'P0001'; -- raise_exception
+    ELSIF v_file_count > 0 THEN
+        RAISE EXCEPTION 'Directory contains files. Use recursive delete to remove'
             USING ERRCODE = 'P0001'; -- raise_exception
     END IF;
+
+    RAISE EXCEPTION 'Directory deletion failed'
+        USING ERRCODE = 'P0001'; -- raise_exception
 END;
-$$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql
+SET plan_cache_mode = force_generic_plan;
 
 -- Add function comment
 COMMENT ON FUNCTION directory_delete(UUID, BOOLEAN, TEXT) IS
@@ -123,7 +139,7 @@ Raises:
 Notes:
   - When recursive is true, all subdirectories and files are deleted
   - When recursive is false, operation fails if directory contains any items
-  - Deletion is handled by foreign key CASCADE for recursive deletes
+  - Recursive deletes remove the whole subtree in one statement
   - Only deletes items belonging to the specified user_token';
 
 -- Example usage:
@@ -21,7 +21,8 @@
  *         "directories": integer,// Number of subdirectories
  *         "files": integer,     // Number of files
  *         "total": integer      // Total number of items
- *       }
+ *       },
+ *       "version": integer     // Changes with the details and the listing, the ETag of GET responses
  *     }
  *   Note: Returns NULL if directory not found or access denied
  *
@@ -29,8 +30,12 @@
  *   - Validates directory ownership via user_token
  *   - Counts only immediate children (not recursive)
  *   - Includes both basic metadata and computed statistics
- *   - Uses CTEs for efficient counting of child items
+ *   - Reads the child counts maintained by trigger on the directory row (dir_count, file_count),
+ *     so the details are a single primary key lookup
+ *   - Keeps its generic plan, pruned to the user's partition as it runs, instead of planning
+ *     the lookup again on every call
  *   - Returns NULL instead of raising an exception for not found/access denied
+ *   - STABLE, so that all of it is read from the snapshot of the calling statement
  *   - Only counts children owned by the same user
  *
  * Examples:
@@ -51,7 +56,8 @@
  *   --     "directories": 3,
  *   --     "files": 5,
  *   --     "total": 8
- *   --   }
+ *   --   },
+ *   --   "version": 1042
  *   -- }
  */
 
@@ -63,30 +69,8 @@ RETURNS TABLE (directory_details JSON) AS $$
 DECLARE
     result JSON;
 BEGIN
-    WITH directory_counts AS (
-        SELECT
-            COUNT(d.id) as directory_count,
-            COUNT(f.id) as file_count
-        FROM directories dir
-        LEFT JOIN directories d ON d.parent_id = dir.id AND d.user_token = p_user_token
-        LEFT JOIN files f ON f.parent_id = dir.id AND f.user_token = p_user_token
-        WHERE dir.id = p_directory_id
-            AND dir.user_token = p_user_token
-    )
-    SELECT json_build_object(
-        'id', d.id,
-        'name', d.name,
-        'created_at', d.created_at,
-        'updated_at', d.updated_at,
-        'parent_id', d.parent_id,
-        'child_counts', json_build_object(
-            'directories', COALESCE(dc.directory_count, 0),
-            'files', COALESCE(dc.file_count, 0),
-            'total', COALESCE(dc.directory_count + dc.file_count, 0)
-        )
-    ) INTO result
+    SELECT directory_json(d) INTO result
     FROM directories d
-    LEFT JOIN directory_counts dc ON true
     WHERE d.id = p_directory_id
         AND d.user_token = p_user_token;
 
@@ -98,7 +82,8 @@ BEGIN
 
     RETURN QUERY SELECT result;
 END;
-$$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql STABLE
+SET plan_cache_mode = force_generic_plan;
 
 -- Add function comment
 COMMENT ON FUNCTION directory_details(UUID, TEXT) IS
@@ -118,7 +103,8 @@ Returns:
         directories: integer,
         files: integer,
         total: integer
-      }
+      },
+      version: integer
     }
 Returns NULL if directory not found or user_token does not match.';
 
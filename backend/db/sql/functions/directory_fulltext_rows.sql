@@ -0,0 +1,67 @@
+/*
+ * Function: directory_fulltext_rows
+ *
+ * Full-text searches directories by the words of their name, returning one page of the matches
+ * as rows ordered by relevance. item_fulltext_search aggregates these rows into a JSON array, and
+ * the API streams them directly through a server-side cursor.
+ *
+ * Parameters:
+ *   - p_query (TEXT): Search terms in web search syntax ("quoted phrase", or, -excluded)
+ *   - p_parent_id (UUID): Optional parent directory UUID to limit search scope
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *   - p_limit (INTEGER): Maximum number of directories to return
+ *   - p_offset (INTEGER): Number of matches to skip
+ *
+ * Returns:
+ *   TABLE:
+ *     - type (TEXT): Always 'directory'
+ *     - id, name, parent_id, created_at, updated_at: Directory columns
+ *     - rank (REAL): Relevance of the directory to the query, higher is better
+ *
+ * Implementation Notes:
+ *   - Written in SQL so the planner inlines it into the calling query
+ *   - Matches directories.search_vector, served by idx_directories_search_vector
+ *   - Ties are ordered by (name, id) so pages are stable
+ */
+CREATE OR REPLACE FUNCTION directory_fulltext_rows(
+    p_query TEXT,
+    p_parent_id UUID DEFAULT NULL,
+    p_user_token TEXT DEFAULT 'public',
+    p_limit INTEGER DEFAULT 100,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    type TEXT,
+    id UUID,
+    name TEXT,
+    parent_id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    rank REAL
+) AS $$
+    SELECT
+        'directory'::TEXT,
+        d.id,
+        d.name,
+        d.parent_id,
+        d.created_at,
+        d.updated_at,
+        ts_rank(d.search_vector, websearch_to_tsquery('simple', translate(p_query, '.', ' '))) AS rank
+    FROM directories d
+    WHERE d.user_token = p_user_token
+        AND d.search_vector @@ websearch_to_tsquery('simple', translate(p_query, '.', ' '))
+        AND (p_parent_id IS NULL OR d.parent_id = p_parent_id)
+    ORDER BY rank DESC, d.name, d.id
+    LIMIT p_limit
+    OFFSET p_offset;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION directory_fulltext_rows(TEXT, UUID, TEXT, INTEGER, INTEGER) IS
+'Full-text searches directories by name, most relevant first.
+Parameters:
+  - p_query: Search terms in web search syntax
+  - p_parent_id: Limit search to items in this directory (optional)
+  - p_user_token: User token for access control
+  - p_limit, p_offset: Page of matches to return
+Returns: rows of matching directories with their rank, ordered by (rank DESC, name, id)';
@@ -0,0 +1,43 @@
+/*
+ * Function: directory_json
+ *
+ * Builds the details of a directory from its row, in the format returned by directory_details.
+ *
+ * Parameters:
+ *   - d (directories): The directory's row
+ *
+ * Returns:
+ *   JSON: The directory details (see directory_details)
+ *
+ * Implementation Notes:
+ *   - Takes the row rather than an ID, so that writes build their response from the row they
+ *     wrote (INSERT/UPDATE ... RETURNING directory_json(d)) instead of selecting it again
+ *   - The caller is responsible for access control
+ *
+ * Examples:
+ *   SELECT directory_json(d) FROM directories d WHERE d.id = '123e4567-e89b-12d3-a456-426614174000';
+ */
+
+CREATE OR REPLACE FUNCTION directory_json(d directories)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'id', d.id,
+        'name', d.name,
+        'created_at', d.created_at,
+        'updated_at', d.updated_at,
+        'parent_id', d.parent_id,
+        'child_counts', json_build_object(
+            'directories', d.dir_count,
+            'files', d.file_count,
+            'total', d.dir_count + d.file_count
+        ),
+        'version', d.version
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION directory_json(directories) IS
+'Builds the details JSON of a directory row, as returned by directory_details.
+Parameters:
+  - d: The directory row
+Returns: the directory details';
@@ -0,0 +1,160 @@
+/*
+ * Function: directory_list_page
+ *
+ * Lists one page of the directories and files within a specified parent directory (or root level)
+ * using keyset pagination. Directories come first, then files, each ordered by (name, id), so a
+ * page is read straight from the listing indexes and costs the same no matter how large the
+ * directory is or how deep into it the page starts.
+ *
+ * Parameters:
+ *   - p_parent_id (UUID): The UUID of the parent directory to list contents from (NULL for root level)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *   - p_limit (INTEGER): Maximum number of items to return
+ *   - p_after_type (TEXT): Type of the last item of the previous page ('directory' or 'file', NULL for the first page)
+ *   - p_after_name (TEXT): Name of the last item of the previous page
+ *   - p_after_id (UUID): ID of the last item of the previous page
+ *
+ * Returns:
+ *   TABLE:
+ *     - type (TEXT): 'directory' or 'file'
+ *     - id (UUID): Item's unique identifier
+ *     - name (TEXT): Item name
+ *     - created_at (TIMESTAMPTZ): Creation timestamp
+ *
+ * Implementation Notes:
+ *   - Lists only immediate children (non-recursive)
+ *   - Validates ownership via user_token
+ *   - Handles root level listing (parent_id = NULL)
+ *   - The id breaks ties between equal names, which can occur at root level
+ *   - Each branch stops after p_limit rows using idx_directories_listing / idx_files_listing
+ *   - The keyset and the parent are index conditions in every plan, generic plans included: the
+ *     first page seeks past a keyset below every item, and the root level has branches of its own
+ *   - Keeps its generic plans: with the tables partitioned, the custom plans the plan cache
+ *     otherwise picks plan the four branches again on every call, which takes longer than the page
+ *   - Callers request p_limit + 1 rows to find out whether another page exists
+ *
+ * Examples:
+ *   -- First page of 100 items at root level
+ *   SELECT * FROM directory_list_page(
+ *     NULL,       -- root level
+ *     'user123',  -- user token
+ *     100         -- page size
+ *   );
+ *
+ *   -- Next page, continuing after the last item of the previous one
+ *   SELECT * FROM directory_list_page(
+ *     '123e4567-e89b-12d3-a456-426614174000',  -- parent directory UUID
+ *     'user123',                                -- user token
+ *     100,                                      -- page size
+ *     'file',                                   -- type of the last item
+ *     'report_2024.pdf',                        -- name of the last item
+ *     '987fcdeb-51a2-12d3-a456-426614174000'    -- id of the last item
+ *   );
+ */
+
+CREATE OR REPLACE FUNCTION directory_list_page(
+    p_parent_id UUID DEFAULT NULL,
+    p_user_token TEXT DEFAULT 'public',
+    p_limit INTEGER DEFAULT 100,
+    p_after_type TEXT DEFAULT NULL,
+    p_after_name TEXT DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    type TEXT,
+    id UUID,
+    name TEXT,
+    created_at TIMESTAMPTZ
+) AS $$
+DECLARE
+    -- The first page starts after ('', nil UUID), before every item: no name sorts before ''
+    -- and no item has the nil UUID. So each branch always reads a range of the listing index
+    -- from the keyset, also in the generic plan that PL/pgSQL switches to after a few calls,
+    -- where an optional keyset would only be a filter over the whole directory.
+    v_dir_name TEXT := '';
+    v_dir_id UUID := '00000000-0000-0000-0000-000000000000';
+    v_file_name TEXT := '';
+    v_file_id UUID := '00000000-0000-0000-0000-000000000000';
+    v_dir_limit INTEGER := p_limit;
+BEGIN
+    IF p_after_type = 'directory' THEN
+        v_dir_name := p_after_name;
+        v_dir_id := p_after_id;
+    ELSIF p_after_type = 'file' THEN
+        -- Directories precede files, so a file cursor skips them all
+        v_dir_limit := 0;
+        v_file_name := p_after_name;
+        v_file_id := p_after_id;
+    END IF;
+
+    -- The root level and a directory are listed by separate branches, so that each has its
+    -- parent_id condition on the index. The branch that does not apply is skipped at run time.
+    -- The branches order by parent_id too, a single value: unlike parent_id = ..., the planner
+    -- does not take parent_id IS NULL to fix its value, and would not see the index as ordered
+    -- by (name, id) without it.
+    RETURN QUERY
+    SELECT items.type, items.id, items.name, items.created_at
+    FROM (
+        (
+            SELECT 'directory'::TEXT AS type, 0 AS rank, d.id, d.name, d.created_at
+            FROM directories d
+            WHERE p_parent_id IS NULL
+                AND d.user_token = p_user_token
+                AND d.parent_id IS NULL
+                AND (d.name, d.id) > (v_dir_name, v_dir_id)
+            ORDER BY d.parent_id, d.name, d.id
+            LIMIT v_dir_limit
+        )
+        UNION ALL
+        (
+            SELECT 'directory'::TEXT AS type, 0 AS rank, d.id, d.name, d.created_at
+            FROM directories d
+            WHERE p_parent_id IS NOT NULL
+                AND d.user_token = p_user_token
+                AND d.parent_id = p_parent_id
+                AND (d.name, d.id) > (v_dir_name, v_dir_id)
+            ORDER BY d.parent_id, d.name, d.id
+            LIMIT v_dir_limit
+        )
+        UNION ALL
+        (
+            SELECT 'file'::TEXT AS type, 1 AS rank, f.id, f.name, f.created_at
+            FROM files f
+            WHERE p_parent_id IS NULL
+                AND f.user_token = p_user_token
+                AND f.parent_id IS NULL
+                AND (f.name, f.id) > (v_file_name, v_file_id)
+            ORDER BY f.parent_id, f.name, f.id
+            LIMIT p_limit
+        )
+        UNION ALL
+        (
+            SELECT 'file'::TEXT AS type, 1 AS rank, f.id, f.name, f.created_at
+            FROM files f
+            WHERE p_parent_id IS NOT NULL
+                AND f.user_token = p_user_token
+                AND f.parent_id = p_parent_id
+                AND (f.name, f.id) > (v_file_name, v_file_id)
+            ORDER BY f.parent_id, f.name, f.id
+            LIMIT p_limit
+        )
+    ) items
+    ORDER BY items.rank, items.name, items.id
+    LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE
+SET plan_cache_mode = force_generic_plan;
+
+-- Add function comment
+COMMENT ON FUNCTION directory_list_page(UUID, TEXT, INTEGER, TEXT, TEXT, UUID) IS
+'Lists one page of the directories and files within a given parent directory (or root if parent_id is null),
+directories first, each ordered by (name, id).
+Parameters:
+  - p_parent_id: UUID of the parent directory (NULL for root level)
+  - p_user_token: User token for access control
+  - p_limit: Maximum number of items to return
+  - p_after_type, p_after_name, p_after_id: Keyset of the last item of the previous page (NULL for the first page)
+Returns: rows of {type, id, name, created_at}';
+
+-- Example usage:
+-- SELECT * FROM directory_list_page(NULL, 'user123', 100);
@@ -0,0 +1,64 @@
+/*
+ * Function: directory_listd_rows
+ *
+ * Lists all directories within a specified parent directory (or root level) as rows, ordered by
+ * (name, id). This is the row-returning counterpart of directory_listd, used to stream large
+ * listings through a server-side cursor.
+ *
+ * Parameters:
+ *   - p_parent_id (UUID): The UUID of the parent directory to list contents from (NULL for root level)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *
+ * Returns:
+ *   TABLE:
+ *     - type (TEXT): Always 'directory'
+ *     - id (UUID): Directory's unique identifier
+ *     - name (TEXT): Directory name
+ *     - created_at (TIMESTAMPTZ): Creation timestamp
+ *
+ * Implementation Notes:
+ *   - Written in SQL rather than PL/pgSQL so the planner inlines it into the calling query.
+ *     Rows are then read in order from idx_directories_listing and reach the client as the
+ *     index is scanned, instead of being collected and sorted first
+ *   - Lists only immediate children (non-recursive)
+ *   - Validates ownership via user_token
+ *
+ * Examples:
+ *   -- Stream the directories at root level
+ *   BEGIN;
+ *   DECLARE listing CURSOR FOR SELECT * FROM directory_listd_rows(NULL, 'user123');
+ *   FETCH 1000 FROM listing;
+ */
+
+CREATE OR REPLACE FUNCTION directory_listd_rows(
+    p_parent_id UUID DEFAULT NULL,
+    p_user_token TEXT DEFAULT 'public'
+)
+RETURNS TABLE (
+    type TEXT,
+    id UUID,
+    name TEXT,
+    created_at TIMESTAMPTZ
+) AS $$
+    SELECT
+        'directory'::TEXT,
+        d.id,
+        d.name,
+        d.created_at
+    FROM directories d
+    WHERE
+        d.user_token = p_user_token
+        AND (
+            (p_parent_id IS NULL AND d.parent_id IS NULL)
+            OR d.parent_id = p_parent_id
+        )
+    ORDER BY d.name, d.id;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION directory_listd_rows(UUID, TEXT) IS
+'Lists all directories within a given parent directory (or root if parent_id is null) as rows ordered by (name, id).
+Parameters:
+  - p_parent_id: UUID of the parent directory (NULL for root level)
+  - p_user_token: User token for access control
+Returns: rows of {type, id, name, created_at}';
@@ -0,0 +1,64 @@
+/*
+ * Function: directory_listf_rows
+ *
+ * Lists all files within a specified parent directory (or root level) as rows, ordered by
+ * (name, id). This is the row-returning counterpart of directory_listf, used to stream large
+ * listings through a server-side cursor.
+ *
+ * Parameters:
+ *   - p_parent_id (UUID): The UUID of the parent directory to list contents from (NULL for root level)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *
+ * Returns:
+ *   TABLE:
+ *     - type (TEXT): Always 'file'
+ *     - id (UUID): File's unique identifier
+ *     - name (TEXT): File name
+ *     - created_at (TIMESTAMPTZ): Creation timestamp
+ *
+ * Implementation Notes:
+ *   - Written in SQL rather than PL/pgSQL so the planner inlines it into the calling query.
+ *     Rows are then read in order from idx_files_listing and reach the client as the
+ *     index is scanned, instead of being collected and sorted first
+ *   - Lists only immediate children (non-recursive)
+ *   - Validates ownership via user_token
+ *
+ * Examples:
+ *   -- Stream the files at root level
+ *   BEGIN;
+ *   DECLARE listing CURSOR FOR SELECT * FROM directory_listf_rows(NULL, 'user123');
+ *   FETCH 1000 FROM listing;
+ */
+
+CREATE OR REPLACE FUNCTION directory_listf_rows(
+    p_parent_id UUID DEFAULT NULL,
+    p_user_token TEXT DEFAULT 'public'
+)
+RETURNS TABLE (
+    type TEXT,
+    id UUID,
+    name TEXT,
+    created_at TIMESTAMPTZ
+) AS $$
+    SELECT
+        'file'::TEXT,
+        f.id,
+        f.name,
+        f.created_at
+    FROM files f
+    WHERE
+        f.user_token = p_user_token
+        AND (
+            (p_parent_id IS NULL AND f.parent_id IS NULL)
+            OR f.parent_id = p_parent_id
+        )
+    ORDER BY f.name, f.id;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION directory_listf_rows(UUID, TEXT) IS
+'Lists all files within a given parent directory (or root if parent_id is null) as rows ordered by (name, id).
+Parameters:
+  - p_parent_id: UUID of the parent directory (NULL for root level)
+  - p_user_token: User token for access control
+Returns: rows of {type, id, name, created_at}';
@@ -2,8 +2,8 @@
  * Function: directory_path
  *
  * Retrieves the complete path information for a directory, including both names and IDs of all
- * directories in the path from root to the target directory. This function traverses the directory
- * tree upwards to construct the full path while ensuring proper access control.
+ * directories in the path from root to the target directory. The IDs come from the directory's
+ * materialized path, so only the names of the ancestors need to be looked up.
  *
  * Parameters:
  *   - p_directory_id (UUID): The UUID of the directory to get the path for
@@ -19,7 +19,7 @@
  *   Returns empty arrays if directory not found or access denied
  *
  * Implementation Notes:
- *   - Uses recursive CTE to traverse directory hierarchy upwards
+ *   - Reads the ancestor IDs from directories.path and resolves their names by primary key
  *   - Validates ownership at each level via user_token
  *   - Maintains parallel arrays for names and IDs
  *   - Arrays are ordered from root to leaf (e.g., ["root", "docs", "project"])
@@ -51,43 +51,17 @@ CREATE OR REPLACE FUNCTION directory_path(
 DECLARE
     result JSON;
 BEGIN
-    WITH RECURSIVE parent_dirs AS (
-        -- Base case: start with the current directory
-        SELECT
-            id,
-            name,
-            parent_id,
-            ARRAY[name] as path_names,
-            ARRAY[id] as path_ids,
-            1 as depth
-        FROM directories
-        WHERE id = p_directory_id
-            AND user_token = p_user_token
-
-        UNION ALL
-
-        -- Recursive case: get all parents up to root
-        SELECT
-            d.id,
-            d.name,
-            d.parent_id,
-            array_append(p.path_names, d.name),
-            array_append(p.path_ids, d.id),
-            p.depth + 1
-        FROM directories d
-        INNER JOIN parent_dirs p ON d.id = p.parent_id
-        WHERE d.user_token = p_user_token
-    )
+    -- Resolve the names of the IDs on the materialized path, keeping their order
     SELECT json_build_object(
-        'names', COALESCE(
-            (SELECT path_names FROM parent_dirs ORDER BY depth DESC LIMIT 1),
-            ARRAY[]::TEXT[]
-        ),
-        'ids', COALESCE(
-            (SELECT path_ids FROM parent_dirs ORDER BY depth DESC LIMIT 1),
-            ARRAY[]::UUID[]
-        )
-    ) INTO result;
+        'names', COALESCE(array_agg(a.name ORDER BY p.depth), ARRAY[]::TEXT[]),
+        'ids', COALESCE(array_agg(a.id ORDER BY p.depth), ARRAY[]::UUID[])
+    ) INTO result
+    FROM directories d
+    CROSS JOIN LATERAL unnest(d.path) WITH ORDINALITY AS p(id, depth)
+    INNER JOIN directories a ON a.id = p.id
+        AND a.user_token = p_user_token
+    WHERE d.id = p_directory_id
+        AND d.user_token = p_user_token;
 
     RETURN result;
 END;
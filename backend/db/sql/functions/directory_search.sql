@@ -9,6 +9,9 @@
  *   - p_user_token (TEXT): The user token for access control and ownership validation
  *
  * Returns: JSON array of matching directories
+ *
+ * Implementation Notes:
+ *   - Aggregates the rows of directory_search_rows, which holds the search criteria
  */
 CREATE OR REPLACE FUNCTION directory_search(
     p_query TEXT DEFAULT NULL,
@@ -17,30 +20,8 @@ CREATE OR REPLACE FUNCTION directory_search(
 )
 RETURNS JSON AS $$
 DECLARE
-    v_name_pattern TEXT;
     dir_result JSON;
 BEGIN
-    -- Prepare name search pattern if query provided
-    IF p_query IS NOT NULL THEN
-        v_name_pattern := '%' || p_query || '%';
-    END IF;
-
-    WITH matching_directories AS (
-        SELECT
-            d.id,
-            d.name,
-            d.parent_id,
-            d.created_at,
-            d.updated_at
-        FROM directories d
-        WHERE d.user_token = p_user_token
-            AND (p_parent_id IS NULL OR d.parent_id = p_parent_id)
-            AND (
-                p_query IS NULL
-                OR d.name ILIKE v_name_pattern
-            )
-        ORDER BY d.name
-    )
     SELECT json_agg(
         json_build_object(
             'id', id,
@@ -48,11 +29,12 @@ BEGIN
             'parent_id', parent_id,
             'created_at', created_at,
             'updated_at', updated_at,
-            'type', 'directory'
+            'type', 'directory',
+            'rank', NULL
         )
     )
     INTO dir_result
-    FROM matching_directories;
+    FROM directory_search_rows(p_query, p_parent_id, p_user_token);
 
     RETURN COALESCE(dir_result, '[]'::JSON);
 END;
@@ -0,0 +1,59 @@
+/*
+ * Function: directory_search_rows
+ *
+ * Searches for directories based on name pattern and parent directory, returning the matches as
+ * rows ordered by (name, id). directory_search aggregates these rows into a JSON array, and the
+ * API streams them directly through a server-side cursor.
+ *
+ * Parameters:
+ *   - p_query (TEXT): Optional text to search in directory names (case-insensitive, uses LIKE)
+ *   - p_parent_id (UUID): Optional parent directory UUID to limit search scope
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *
+ * Returns:
+ *   TABLE:
+ *     - type (TEXT): Always 'directory'
+ *     - id, name, parent_id, created_at, updated_at: Directory columns
+ *
+ * Implementation Notes:
+ *   - Written in SQL so the planner inlines it into the calling query
+ *   - The name match is served by the trigram index idx_directories_name_trgm on (user_token, name)
+ */
+CREATE OR REPLACE FUNCTION directory_search_rows(
+    p_query TEXT DEFAULT NULL,
+    p_parent_id UUID DEFAULT NULL,
+    p_user_token TEXT DEFAULT 'public'
+)
+RETURNS TABLE (
+    type TEXT,
+    id UUID,
+    name TEXT,
+    parent_id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ
+) AS $$
+    SELECT
+        'directory'::TEXT,
+        d.id,
+        d.name,
+        d.parent_id,
+        d.created_at,
+        d.updated_at
+    FROM directories d
+    WHERE d.user_token = p_user_token
+        AND (p_parent_id IS NULL OR d.parent_id = p_parent_id)
+        AND (
+            p_query IS NULL
+            OR d.name ILIKE '%' || p_query || '%'
+        )
+    ORDER BY d.name, d.id;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION directory_search_rows(TEXT, UUID, TEXT) IS
+'Searches for directories based on name pattern and parent directory.
+Parameters:
+  - p_query: Text to search in names (optional, case-insensitive)
+  - p_parent_id: Limit search to items in this directory (optional)
+  - p_user_token: User token for access control
+Returns: rows of matching directories ordered by (name, id)';
@@ -0,0 +1,70 @@
+/*
+ * Function: directory_stats
+ *
+ * Retrieves the recursive totals of a directory: every file and subdirectory below it at any
+ * depth, and the summed size of those files. Unlike the child counts of directory_details,
+ * which cover only the immediate children, these cover the whole subtree.
+ *
+ * Parameters:
+ *   - p_directory_id (UUID): The UUID of the directory to get the totals for
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *
+ * Returns:
+ *   TABLE (directory_stats JSON): JSON object containing:
+ *     {
+ *       "id": UUID,            // Directory's unique identifier
+ *       "files": integer,      // Number of files in the subtree
+ *       "directories": integer,// Number of directories in the subtree, excluding this one
+ *       "size": number         // Sum of metadata.size of those files (files without one count 0)
+ *     }
+ *   Note: Returns no row if directory not found or access denied
+ *
+ * Implementation Notes:
+ *   - Reads directory_rollups, kept up to date by the rollup triggers on files and
+ *     directories, so the cost does not depend on the size of the subtree
+ *   - Returns no row instead of raising an exception for not found/access denied
+ *
+ * Examples:
+ *   SELECT * FROM directory_stats('123e4567-e89b-12d3-a456-426614174000', 'user123');
+ *
+ *   -- Example result:
+ *   -- {
+ *   --   "id": "123e4567-e89b-12d3-a456-426614174000",
+ *   --   "files": 1250,
+ *   --   "directories": 42,
+ *   --   "size": 52428800
+ *   -- }
+ */
+
+CREATE OR REPLACE FUNCTION directory_stats(
+    p_directory_id UUID,
+    p_user_token TEXT DEFAULT 'public'
+)
+RETURNS TABLE (directory_stats JSON) AS $$
+    SELECT json_build_object(
+        'id', d.id,
+        'files', r.file_count,
+        'directories', r.dir_count,
+        'size', r.total_size
+    )
+    FROM directories d
+    JOIN directory_rollups r ON r.directory_id = d.id
+    WHERE d.id = p_directory_id
+        AND d.user_token = p_user_token;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION directory_stats(UUID, TEXT) IS
+'Retrieves the recursive file, directory and size totals of a directory.
+Parameters:
+  - p_directory_id: UUID of the directory
+  - p_user_token: User token for access control
+Returns:
+  - directory_stats: JSON object with structure:
+    {
+      id: UUID,
+      files: integer,
+      directories: integer,
+      size: number
+    }
+Returns no row if directory not found or user_token does not match.';
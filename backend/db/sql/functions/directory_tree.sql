@@ -1,98 +1,292 @@
+/*
+ * Function: directory_tree
+ *
+ * Builds the nested tree of directories and files below a directory (or the root level), down to
+ * a maximum depth and up to a maximum number of nodes. Directories whose children were not loaded
+ * are marked with "has_children", so clients can expand them lazily with another call.
+ *
+ * Parameters:
+ *   - p_parent_id (UUID): Starting directory UUID (NULL for the root level)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *   - p_max_depth (INTEGER): Levels to load, 1 loads only the immediate children
+ *   - p_max_nodes (INTEGER): Maximum number of items in the tree
+ *
+ * Returns:
+ *   TABLE:
+ *     - tree (JSON): Array of the items directly below the start, each:
+ *         {
+ *           "id": UUID,
+ *           "name": string,
+ *           "created_at": timestamp,
+ *           "type": "directory" | "file",
+ *           "has_children": boolean,   // Directories only, null for files
+ *           "children": array | null   // Directories only, null when not loaded and for files
+ *         }
+ *     - truncated (BOOLEAN): Whether children within p_max_depth were left out to stay within
+ *       p_max_nodes
+ *   Note: Always returns one row, with an empty tree if the start directory is not found or
+ *   access denied
+ *
+ * Implementation Notes:
+ *   - Children are loaded a whole directory at a time, breadth first in name order: a directory's
+ *     children are either all present or not loaded at all. Group sizes come from the maintained
+ *     dir_count/file_count, so files are only read for the directories that are expanded
+ *   - Directories are read one level at a time, only below the directories expanded so far, so
+ *     the work is bounded by p_max_nodes rather than by the size of the subtree
+ *   - The nested JSON is assembled bottom-up in a single pass, one level at a time
+ *   - Directories come before files, each ordered by (name, id), as in directory listings
+ *
+ * Examples:
+ *   -- Two levels below the root, at most 500 items
+ *   SELECT * FROM directory_tree(NULL, 'user123', 2, 500);
+ */
+
+-- The previous version had no node limit and returned only the tree, replace it rather than overload it
+DROP FUNCTION IF EXISTS directory_tree(UUID, TEXT, INTEGER);
+
 CREATE OR REPLACE FUNCTION directory_tree(
     p_parent_id UUID DEFAULT NULL,
     p_user_token TEXT DEFAULT 'public',
-    p_max_depth INTEGER DEFAULT 3
-) RETURNS TABLE (tree JSON) AS $$
-WITH RECURSIVE
--- First, get the directory hierarchy recursively
-directory_hierarchy AS (
-    -- Base case: starting level directories
-    SELECT
-        (json_array_elements(directory_listd(p_parent_id, p_user_token))->>'id')::UUID as id,
-        (json_array_elements(directory_listd(p_parent_id, p_user_token))->>'name')::TEXT as name,
-        (json_array_elements(directory_listd(p_parent_id, p_user_token))->>'created_at')::TIMESTAMPTZ as created_at,
-        1 as depth
-
-    UNION ALL
-
-    -- Recursive case: child directories
-    SELECT
-        (json_array_elements(directory_listd(dh.id, p_user_token))->>'id')::UUID as id,
-        (json_array_elements(directory_listd(dh.id, p_user_token))->>'name')::TEXT as name,
-        (json_array_elements(directory_listd(dh.id, p_user_token))->>'created_at')::TIMESTAMPTZ as created_at,
-        dh.depth + 1
-    FROM directory_hierarchy dh
-    WHERE dh.depth < p_max_depth
-),
-
--- Build the tree structure bottom-up
-directory_tree_builder AS (
-    SELECT
-        dh.id,
-        dh.name,
-        dh.created_at,
-        dh.depth,
-        json_build_object(
-            'id', dh.id,
-            'name', dh.name,
-            'created_at', dh.created_at,
-            'type', 'directory',
-            'children', COALESCE(
-                (
-                    WITH files AS (
-                        -- Get files in this directory
-                        SELECT json_array_elements(directory_listf(dh.id, p_user_token)) as file
-                    ),
-                    child_dirs AS (
-                        -- Get immediate child directories
-                        SELECT json_array_elements(directory_listd(dh.id, p_user_token)) as dir
+    p_max_depth INTEGER DEFAULT 3,
+    p_max_nodes INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+    tree JSON,
+    truncated BOOLEAN
+) AS $$
+DECLARE
+    v_root_count BIGINT;
+    v_used BIGINT;
+    v_frontier UUID[] := '{}';
+    v_dir_ids UUID[] := '{}';
+    v_dir_depths INTEGER[] := '{}';
+    v_dir_expanded BOOLEAN[] := '{}';
+    v_level_ids UUID[];
+    v_level_expanded BOOLEAN[];
+    v_level_used BIGINT;
+    v_level_truncated BOOLEAN;
+    v_levels JSONB;
+    v_truncated BOOLEAN := false;
+    v_children JSONB := '{}';
+BEGIN
+    -- Number of items directly below the start
+    IF p_parent_id IS NULL THEN
+        SELECT
+            (SELECT count(*) FROM directories WHERE user_token = p_user_token AND parent_id IS NULL)
+            + (SELECT count(*) FROM files WHERE user_token = p_user_token AND parent_id IS NULL)
+        INTO v_root_count;
+    ELSE
+        SELECT dir_count + file_count INTO v_root_count
+        FROM directories
+        WHERE id = p_parent_id
+            AND user_token = p_user_token;
+
+        IF NOT FOUND THEN
+            RETURN QUERY SELECT '[]'::JSON, false;
+            RETURN;
+        END IF;
+    END IF;
+
+    -- The children of the start are loaded first, if they fit at all
+    IF v_root_count > p_max_nodes THEN
+        RETURN QUERY SELECT '[]'::JSON, true;
+        RETURN;
+    END IF;
+    v_used := v_root_count;
+
+    -- Read the directories of the tree one level at a time: each level holds the children of
+    -- the directories expanded at the level above, in breadth-first name order. A directory
+    -- is expanded while the running count of loaded items stays within p_max_nodes, so only
+    -- directories that end up in the tree are read. Once a group of children does not fit,
+    -- no later directory is expanded.
+    FOR v_depth IN 1..p_max_depth LOOP
+        SELECT
+            COALESCE(array_agg(l.id ORDER BY l.ord, l.name), '{}'),
+            COALESCE(array_agg(l.expanded ORDER BY l.ord, l.name), '{}'),
+            COALESCE(sum(l.child_count) FILTER (WHERE l.expanded), 0),
+            COALESCE(bool_or(NOT l.expanded AND l.child_count > 0 AND v_depth < p_max_depth), false)
+        INTO v_level_ids, v_level_expanded, v_level_used, v_level_truncated
+        FROM (
+            SELECT
+                c.id,
+                c.ord,
+                c.name,
+                c.child_count,
+                -- Empty directories have nothing to load and are always expanded
+                v_depth < p_max_depth AND (
+                    c.child_count = 0
+                    OR (NOT v_truncated AND v_used + sum(c.child_count) OVER (
+                        ORDER BY c.ord, c.name ROWS UNBOUNDED PRECEDING
+                    ) <= p_max_nodes)
+                ) AS expanded
+            FROM (
+                SELECT d.id, 1::BIGINT AS ord, d.name, d.dir_count + d.file_count AS child_count
+                FROM directories d
+                WHERE v_depth = 1
+                    AND d.user_token = p_user_token
+                    AND (
+                        (p_parent_id IS NULL AND d.parent_id IS NULL)
+                        OR d.parent_id = p_parent_id
                     )
-                    SELECT json_agg(item ORDER BY (item->>'name'))
-                    FROM (
-                        -- Combine files and child directories
-                        SELECT json_build_object(
-                            'id', (file->>'id')::UUID,
-                            'name', file->>'name',
-                            'created_at', (file->>'created_at')::TIMESTAMPTZ,
-                            'type', 'file'
-                        ) as item
-                        FROM files
-
-                        UNION ALL
-
-                        SELECT json_build_object(
-                            'id', (dir->>'id')::UUID,
-                            'name', dir->>'name',
-                            'created_at', (dir->>'created_at')::TIMESTAMPTZ,
-                            'type', 'directory',
-                            'children', '[]'::JSON
-                        ) as item
-                        FROM child_dirs
-                    ) items
-                ),
-                '[]'::JSON
+
+                UNION ALL
+
+                SELECT d.id, p.ord, d.name, d.dir_count + d.file_count
+                FROM unnest(v_frontier) WITH ORDINALITY AS p(id, ord)
+                JOIN directories d ON d.parent_id = p.id
+                    AND d.user_token = p_user_token
+                WHERE v_depth > 1
+            ) c
+        ) l;
+
+        v_dir_ids := v_dir_ids || v_level_ids;
+        v_dir_depths := v_dir_depths || array_fill(v_depth, ARRAY[cardinality(v_level_ids)]);
+        v_dir_expanded := v_dir_expanded || v_level_expanded;
+        v_used := v_used + v_level_used;
+        v_truncated := v_truncated OR v_level_truncated;
+
+        SELECT COALESCE(array_agg(id ORDER BY ord), '{}') INTO v_frontier
+        FROM unnest(v_level_ids, v_level_expanded) WITH ORDINALITY AS l(id, expanded, ord)
+        WHERE l.expanded;
+
+        EXIT WHEN cardinality(v_frontier) = 0;
+    END LOOP;
+
+    -- Collect the nodes of the tree, grouped by depth
+    WITH tree_dirs AS (
+        SELECT
+            d.id,
+            d.name,
+            d.created_at,
+            d.dir_count + d.file_count AS child_count,
+            CASE WHEN t.depth = 1 THEN 'root' ELSE d.parent_id::TEXT END AS parent_key,
+            t.depth,
+            t.expanded
+        FROM unnest(v_dir_ids, v_dir_depths, v_dir_expanded) AS t(id, depth, expanded)
+        JOIN directories d ON d.id = t.id
+            AND d.user_token = p_user_token
+    ),
+    -- The start and the expanded directories, whose files are loaded
+    expanded AS (
+        SELECT 'root'::TEXT AS key, p_parent_id AS dir_id, 0 AS depth
+        UNION ALL
+        SELECT id::TEXT, id, depth
+        FROM tree_dirs
+        WHERE expanded
+    ),
+    nodes AS (
+        SELECT
+            td.depth,
+            td.parent_key,
+            td.id::TEXT AS key,
+            0 AS type_rank,
+            td.name,
+            td.id,
+            jsonb_build_object(
+                'id', td.id,
+                'name', td.name,
+                'created_at', td.created_at,
+                'type', 'directory',
+                'has_children', td.child_count > 0
+            ) AS node,
+            td.expanded
+        FROM tree_dirs td
+
+        UNION ALL
+
+        SELECT
+            p.depth + 1,
+            p.key,
+            NULL,
+            1,
+            f.name,
+            f.id,
+            jsonb_build_object(
+                'id', f.id,
+                'name', f.name,
+                'created_at', f.created_at,
+                'type', 'file',
+                'has_children', NULL,
+                'children', NULL
+            ),
+            false
+        FROM expanded p
+        JOIN files f ON f.parent_id = p.dir_id
+        WHERE f.user_token = p_user_token
+
+        UNION ALL
+
+        -- Files at the root level have no parent to join on
+        SELECT 1, 'root', NULL, 1, f.name, f.id,
+            jsonb_build_object(
+                'id', f.id,
+                'name', f.name,
+                'created_at', f.created_at,
+                'type', 'file',
+                'has_children', NULL,
+                'children', NULL
+            ),
+            false
+        FROM files f
+        WHERE p_parent_id IS NULL
+            AND f.user_token = p_user_token
+            AND f.parent_id IS NULL
+    )
+    SELECT jsonb_object_agg(depth, items)
+    INTO v_levels
+    FROM (
+        SELECT depth, jsonb_agg(jsonb_build_object(
+            'parent_key', parent_key,
+            'key', key,
+            'type_rank', type_rank,
+            'name', name,
+            'id', id,
+            'node', node,
+            'expanded', expanded
+        )) AS items
+        FROM nodes
+        GROUP BY depth
+    ) levels;
+
+    -- Nest the levels bottom-up: each level's directories take their children from the level below
+    FOR v_depth IN REVERSE p_max_depth..1 LOOP
+        SELECT COALESCE(jsonb_object_agg(parent_key, items), '{}')
+        INTO v_children
+        FROM (
+            SELECT
+                n.parent_key,
+                jsonb_agg(
+                    CASE
+                        WHEN n.expanded THEN n.node || jsonb_build_object('children', COALESCE(v_children->n.key, '[]'))
+                        WHEN n.type_rank = 0 THEN n.node || '{"children": null}'
+                        ELSE n.node
+                    END
+                    ORDER BY n.type_rank, n.name, n.id
+                ) AS items
+            FROM jsonb_to_recordset(COALESCE(v_levels->v_depth::TEXT, '[]')) AS n(
+                parent_key TEXT,
+                key TEXT,
+                type_rank INTEGER,
+                name TEXT,
+                id UUID,
+                node JSONB,
+                expanded BOOLEAN
             )
-        ) as tree_node
-    FROM directory_hierarchy dh
-)
+            GROUP BY n.parent_key
+        ) level_items;
+    END LOOP;
+
+    RETURN QUERY SELECT COALESCE(v_children->'root', '[]')::JSON, COALESCE(v_truncated, false);
+END;
+$$ LANGUAGE plpgsql STABLE;
 
--- Final assembly with proper nesting
-SELECT
-    COALESCE(
-        json_agg(
-            dtb.tree_node ORDER BY dtb.name
-        ),
-        '[]'::JSON
-    ) as tree
-FROM directory_tree_builder dtb
-WHERE dtb.depth = 1;
-
-$$ LANGUAGE SQL;
-
-COMMENT ON FUNCTION directory_tree(UUID, TEXT, INTEGER) IS
-'Builds a hierarchical JSON tree of directories and files using directory_listd and directory_listf helpers.
+COMMENT ON FUNCTION directory_tree(UUID, TEXT, INTEGER, INTEGER) IS
+'Builds the nested JSON tree of directories and files below a directory, bounded in depth and size.
 Parameters:
   - p_parent_id: Starting directory UUID (NULL for root)
   - p_user_token: Access control token
-  - p_max_depth: Maximum directory depth to traverse
-Returns a JSON tree structure containing directories and their contents.';
\ No newline at end of file
+  - p_max_depth: Levels to load (1 = immediate children)
+  - p_max_nodes: Maximum number of items in the tree
+Returns:
+  - tree: Array of items, directories carry has_children and children (null when not loaded)
+  - truncated: Whether children were left out because of p_max_nodes';
@@ -26,13 +26,15 @@
  *   - 23505: Name conflict in target location
  *
  * Implementation Notes:
- *   - Validates ownership of both source directory and target parent
- *   - Prevents circular references in directory structure
+ *   - Validates ownership of both source directory and target parent in the UPDATE itself, and
+ *     only looks them up again when nothing was updated, to report why
+ *   - Prevents circular references in directory structure: the path trigger rejects a new
+ *     parent whose path contains the directory
  *   - Handles partial updates (name only, location only, or both)
- *   - Maintains unique names within each directory level
- *   - Uses recursive CTE to validate move operations
+ *   - Maintains unique names within each directory level through the unique
+ *     (user_token, parent_id, name) index, a conflict raises unique_violation (23505)
  *   - Updates timestamps automatically via triggers
- *   - Returns complete updated directory details
+ *   - Returns the updated directory details built from the updated row (see directory_json)
  *   - Maintains referential integrity
  *
  * Examples:
@@ -83,68 +85,42 @@ CREATE OR REPLACE FUNCTION directory_update(
 )
 RETURNS TABLE (directory_details JSON) AS $$
 DECLARE
-    v_current_parent_id UUID;
-    v_current_name TEXT;
     result JSON;
 BEGIN
-    -- Get current directory details and validate ownership
-    IF NOT validate_directory_ownership(p_directory_id, p_user_token) THEN
-        RAISE EXCEPTION 'Directory not found or access denied'
-            USING ERRCODE = 'P0002'; -- no_data_found
-    END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
 
-    -- Get current directory details
-    SELECT parent_id, name INTO v_current_parent_id, v_current_name
-    FROM directories
-    WHERE id = p_directory_id;
+    -- One statement checks ownership of the directory and its new parent and updates it.
+    -- Moves into its own subtree are rejected by the path trigger, name conflicts by the
+    -- unique index.
+    UPDATE directories d
+    SET name = COALESCE(p_name, d.name),
+        parent_id = COALESCE(p_new_parent_id, d.parent_id)
+    WHERE d.id = p_directory_id
+        AND d.user_token = p_user_token
+        AND (
+            p_new_parent_id IS NULL
+            OR EXISTS (
+                SELECT 1
+                FROM directories p
+                WHERE p.id = p_new_parent_id
+                    AND p.user_token = p_user_token
+            )
+        )
+    RETURNING directory_json(d) INTO result;
 
-    -- If new parent specified, validate it exists and belongs to user
-    IF p_new_parent_id IS NOT NULL AND p_new_parent_id != v_current_parent_id THEN
-        -- Check if new parent exists and belongs to user
-        IF NOT validate_directory_ownership(p_new_parent_id, p_user_token) THEN
-            RAISE EXCEPTION 'New parent directory not found or access denied'
+    -- Nothing updated, find out why
+    IF result IS NULL THEN
+        IF NOT validate_directory_ownership(p_directory_id, p_user_token) THEN
+            RAISE EXCEPTION 'Directory not found or access denied'
                 USING ERRCODE = 'P0002'; -- no_data_found
         END IF;
 
-        -- Prevent moving directory to its own subdirectory
-        IF validate_is_subdirectory(p_new_parent_id, p_directory_id, p_user_token) THEN
-            RAISE EXCEPTION 'Cannot move directory to its own subdirectory'
-                USING ERRCODE = 'P0001'; -- raise_exception
-        END IF;
-    END IF;
-
-    -- If name is changing, check for duplicates in target location
-    IF (p_name IS NOT NULL AND p_name != v_current_name) OR
-       (p_new_parent_id IS NOT NULL AND p_new_parent_id != v_current_parent_id) THEN
-        IF validate_directory_name_exists(
-            COALESCE(p_name, v_current_name),
-            COALESCE(p_new_parent_id, v_current_parent_id),
-            p_user_token,
-            p_directory_id
-        ) THEN
-            RAISE EXCEPTION 'Directory with name "%" already exists in target location',
-                COALESCE(p_name, v_current_name)
-                USING ERRCODE = '23505'; -- unique_violation
-        END IF;
+        RAISE EXCEPTION 'New parent directory not found or access denied'
+            USING ERRCODE = 'P0002'; -- no_data_found
     END IF;
 
-    -- Update directory
-    UPDATE directories
-    SET name = COALESCE(p_name, name),
-        parent_id = COALESCE(p_new_parent_id, parent_id)
-    WHERE id = p_directory_id;
-
-    -- Get updated directory details
-    SELECT d.directory_details INTO result
-    FROM directory_details(p_directory_id, p_user_token) d;
-
     RETURN QUERY SELECT result;
-
-EXCEPTION
-    WHEN unique_violation THEN
-        RAISE EXCEPTION 'Directory with name "%" already exists in target location',
-            COALESCE(p_name, v_current_name)
-            USING ERRCODE = '23505'; -- unique_violation
 END;
 $$ LANGUAGE plpgsql;
 
@@ -0,0 +1,45 @@
+/*
+ * Function: directory_version
+ *
+ * Retrieves the version of a directory's listing (or of the root level listing), which changes
+ * whenever a child is created, deleted, renamed or moved in or out. The API sends it as the ETag
+ * of listings.
+ *
+ * Parameters:
+ *   - p_directory_id (UUID): The UUID of the directory (NULL for the root level)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *
+ * Returns:
+ *   BIGINT: The version, NULL if the directory is not found or access denied
+ *
+ * Implementation Notes:
+ *   - A primary key lookup on directories, or on root_versions for the root level
+ *   - The root level of a user that never had an item has version 0
+ *   - STABLE, so that in the same statement as directory_list_page it reads the same snapshot
+ *     and the version matches the listing
+ *
+ * Examples:
+ *   SELECT directory_version('123e4567-e89b-12d3-a456-426614174000', 'user123');
+ *   SELECT directory_version(NULL, 'user123');  -- root level
+ */
+
+CREATE OR REPLACE FUNCTION directory_version(
+    p_directory_id UUID,
+    p_user_token TEXT DEFAULT 'public'
+)
+RETURNS BIGINT AS $$
+    SELECT CASE
+        WHEN p_directory_id IS NULL THEN
+            COALESCE((SELECT version FROM root_versions WHERE user_token = p_user_token), 0)
+        ELSE
+            (SELECT version FROM directories WHERE id = p_directory_id AND user_token = p_user_token)
+    END;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION directory_version(UUID, TEXT) IS
+'Retrieves the version of a directory''s listing, or of the root level listing.
+Parameters:
+  - p_directory_id: UUID of the directory (NULL for root level)
+  - p_user_token: User token for access control
+Returns: the version, NULL if the directory is not found or user_token does not match';
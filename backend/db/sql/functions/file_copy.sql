@@ -25,6 +25,9 @@
  *     * Storage ID reference (points to same underlying storage)
  *   - Creates a new UUID for the copied file
  *   - Maintains user_token based access control
+ *   - Checks ownership of the source and destination in the INSERT itself, name conflicts being
+ *     skipped with ON CONFLICT on the unique (user_token, parent_id, name) index. They are only
+ *     looked up again when nothing was inserted, to report why
  *   - Implements transactional safety with automatic rollback on failure
  *   - Only copies files owned by the requesting user
  *
@@ -55,84 +58,78 @@ DECLARE
     v_source_name TEXT;
     result JSON;
 BEGIN
-    -- Validate source file ownership
-    IF NOT validate_file_ownership(p_source_id, p_user_token) THEN
-        RAISE EXCEPTION 'Source file not found or access denied'
-            USING ERRCODE = 'P0002';
-    END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
+
+    -- One statement checks ownership of the source and destination and copies the file,
+    -- name conflicts being skipped on the unique index
+    INSERT INTO files (
+        name,
+        parent_id,
+        storage_id,
+        metadata,
+        user_token
+    )
+    SELECT
+        s.name,
+        p_destination_parent_id,
+        s.storage_id,
+        s.metadata,
+        p_user_token
+    FROM files s
+    WHERE s.id = p_source_id
+        AND s.user_token = p_user_token
+        AND (
+            p_destination_parent_id IS NULL
+            OR EXISTS (
+                SELECT 1
+                FROM directories p
+                WHERE p.id = p_destination_parent_id
+                    AND p.user_token = p_user_token
+            )
+        )
+    ON CONFLICT (user_token, parent_id, name) DO NOTHING
+    RETURNING id INTO v_new_id;
 
-    -- Get source file name
-    SELECT name INTO v_source_name
-    FROM files
-    WHERE id = p_source_id;
+    -- Nothing inserted, find out why
+    IF v_new_id IS NULL THEN
+        SELECT name INTO v_source_name
+        FROM files
+        WHERE id = p_source_id
+            AND user_token = p_user_token;
 
-    -- If destination parent specified, validate ownership
-    IF p_destination_parent_id IS NOT NULL THEN
-        IF NOT validate_directory_ownership(p_destination_parent_id, p_user_token) THEN
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Source file not found or access denied'
+                USING ERRCODE = 'P0002'; -- no_data_found
+        END IF;
+
+        IF p_destination_parent_id IS NOT NULL
+            AND NOT validate_directory_ownership(p_destination_parent_id, p_user_token) THEN
             RAISE EXCEPTION 'Destination parent directory not found or access denied'
-                USING ERRCODE = 'P0002';
+                USING ERRCODE = 'P0002'; -- no_data_found
         END IF;
-    END IF;
 
-    -- Check for name conflict in destination
-    IF EXISTS (
-        SELECT 1
-        FROM files
-        WHERE name = v_source_name
-            AND COALESCE(parent_id, UUID_NIL()) = COALESCE(p_destination_parent_id, UUID_NIL())
-            AND user_token = p_user_token
-    ) THEN
         RAISE EXCEPTION 'File with name "%" already exists in destination', v_source_name
-            USING ERRCODE = '23505';
+            USING ERRCODE = '23505'; -- unique_violation
     END IF;
 
-    -- Start transaction for the entire copy operation
-    BEGIN
-        -- Copy the file with its metadata
-        INSERT INTO files (
-            name,
-            parent_id,
-            storage_id,
-            metadata,
-            user_token
-        )
-        SELECT
-            name,
-            p_destination_parent_id,
-            storage_id,
-            metadata,
-            p_user_token
-        FROM files
-        WHERE id = p_source_id
-            AND user_token = p_user_token
-        RETURNING id INTO v_new_id;
-
-        -- Copy tags
-        INSERT INTO file_tags (file_id, tag_id)
-        SELECT
-            v_new_id,
-            ft.tag_id
-        FROM file_tags ft
-        INNER JOIN files f ON f.id = ft.file_id
-        WHERE f.id = p_source_id
-            AND f.user_token = p_user_token;
-
-        -- Get details of the new file
-        SELECT f.file_details INTO result
-        FROM file_details(v_new_id, p_user_token) f;
+    -- Copy tags, the source's ownership was checked by the insert
+    INSERT INTO file_tags (file_id, tag_id, user_token)
+    SELECT
+        v_new_id,
+        ft.tag_id,
+        p_user_token
+    FROM file_tags ft
+    WHERE ft.file_id = p_source_id
+        AND ft.user_token = p_user_token;
 
-        RETURN QUERY SELECT result;
-    EXCEPTION
-        WHEN OTHERS THEN
-            -- Cleanup on error (will be rolled back anyway, but good practice)
-            DELETE FROM files WHERE id = v_new_id;
-            RAISE;
-    END;
+    -- Details of the new file, with the tags its tag_ids now mirror
+    SELECT file_json(f) INTO result
+    FROM files f
+    WHERE f.id = v_new_id
+        AND f.user_token = p_user_token;
 
-EXCEPTION
-    WHEN unique_violation THEN
-        RAISE EXCEPTION 'File with name "%" already exists in destination', v_source_name
-            USING ERRCODE = '23505'; -- unique_violation
+    RETURN QUERY SELECT result;
 END;
 $$ LANGUAGE plpgsql;
 
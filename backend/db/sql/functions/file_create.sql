@@ -22,11 +22,13 @@
  *   - 23505: Name conflict detected (file with same name exists in parent)
  *
  * Implementation Notes:
- *   - Validates parent directory existence and ownership
- *   - Enforces unique file names within the same parent directory
+ *   - Validates parent directory existence and ownership and creates the file in a single
+ *     INSERT, name conflicts being skipped with ON CONFLICT on the unique
+ *     (user_token, parent_id, name) index
+ *   - The parent is only looked up again when nothing was inserted, to report why
  *   - Assigns ownership via user_token
  *   - Creates new UUID for the file
- *   - Returns complete file details via file_details function
+ *   - Returns the file details built from the inserted row (see file_json)
  *
  * Example Usage:
  *   SELECT * FROM create_file(
@@ -61,54 +63,46 @@ CREATE OR REPLACE FUNCTION file_create(
 )
 RETURNS TABLE (file_details JSON) AS $$
 DECLARE
-    v_new_id UUID;
     result JSON;
 BEGIN
-    -- Validate parent directory exists and belongs to user (required for files)
-    IF NOT validate_directory_ownership(p_parent_id, p_user_token) THEN
-        RAISE EXCEPTION 'Parent directory not found or access denied'
-            USING ERRCODE = 'P0002'; -- no_data_found
-    END IF;
-
-    -- Check for duplicate name in the same parent directory
-    IF EXISTS (
-        SELECT 1
-        FROM files
-        WHERE name = p_name
-            AND parent_id = p_parent_id
-            AND user_token = p_user_token
-    ) THEN
-        RAISE EXCEPTION 'File with name "%" already exists in this location', p_name
-            USING ERRCODE = '23505'; -- unique_violation
-    END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
 
-    -- Create new file
-    INSERT INTO files (
+    -- One statement checks the parent, the name and creates the file, see directory_create
+    INSERT INTO files AS f (
         name,
         parent_id,
         user_token,
         storage_id,
         metadata
     )
-    VALUES (
+    SELECT
         p_name,
         p_parent_id,
         p_user_token,
         p_storage_id,
         COALESCE(p_metadata, '{}')
+    WHERE EXISTS (
+        SELECT 1
+        FROM directories p
+        WHERE p.id = p_parent_id
+            AND p.user_token = p_user_token
     )
-    RETURNING id INTO v_new_id;
-
-    -- Get full file details using existing function
-    SELECT f.file_details INTO result
-    FROM file_details(v_new_id, p_user_token) f;
+    ON CONFLICT (user_token, parent_id, name) DO NOTHING
+    RETURNING file_json(f) INTO result;
 
-    RETURN QUERY SELECT result;
+    -- Nothing inserted, find out why
+    IF result IS NULL THEN
+        IF NOT validate_directory_ownership(p_parent_id, p_user_token) THEN
+            RAISE EXCEPTION 'Parent directory not found or access denied'
+                USING ERRCODE = 'P0002'; -- no_data_found
+        END IF;
 
-EXCEPTION
-    WHEN unique_violation THEN
         RAISE EXCEPTION 'File with name "%" already exists in this location', p_name
             USING ERRCODE = '23505'; -- unique_violation
+    END IF;
+
+    RETURN QUERY SELECT result;
 END;
 $$ LANGUAGE plpgsql;
 
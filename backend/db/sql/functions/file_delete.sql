@@ -14,10 +14,9 @@
  *
  * Error Conditions:
  *   - P0002: File not found or access denied
- *   - P0001: Deletion operation failed
  *
  * Implementation Notes:
- *   - Validates file existence and ownership before deletion
+ *   - Validates file existence and ownership in the DELETE itself
  *   - Automatically removes associated file-tag relationships via CASCADE
  *   - Does not delete the tags themselves, only the associations
  *   - Only affects files owned by the requesting user
@@ -38,20 +37,17 @@ CREATE OR REPLACE FUNCTION file_delete(
 )
 RETURNS VOID AS $$
 BEGIN
-    -- Validate file exists and belongs to user
-    IF NOT validate_file_ownership(p_file_id, p_user_token) THEN
-        RAISE EXCEPTION 'File not found or access denied'
-            USING ERRCODE = 'P0002'; -- no_data_found
-    END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
 
-    -- Delete the file (associated file_tags will be deleted via CASCADE)
+    -- Delete the file if it belongs to the user (associated file_tags will be deleted via CASCADE)
     DELETE FROM files
-    WHERE id = p_file_id;
+    WHERE id = p_file_id
+        AND user_token = p_user_token;
 
-    -- Check if deletion was successful
     IF NOT FOUND THEN
-        RAISE EXCEPTION 'File deletion failed'
-            USING ERRCODE = 'P0001'; -- raise_exception
+        RAISE EXCEPTION 'File not found or access denied'
+            USING ERRCODE = 'P0002'; -- no_data_found
     END IF;
 END;
 $$ LANGUAGE plpgsql;
@@ -66,7 +62,6 @@ Returns:
   - void
 Raises:
   - P0002: File not found or access denied
-  - P0001: Deletion failed
 Notes:
   - Associated file_tags are automatically deleted via CASCADE
   - Only deletes files owned by the user
@@ -24,15 +24,17 @@
  *       "tags": {              // File tags information
  *         "names": string[],   // Array of tag names (sorted alphabetically)
  *         "ids": integer[]     // Array of tag IDs (matching names array order)
- *       }
+ *       },
+ *       "version": integer     // Changes with the details, the ETag of GET responses
  *     }
  *   Note: Returns NULL if file not found or access denied
  *
  * Implementation Notes:
- *   - Validates file ownership via user_token
- *   - Uses file_tags_list for tag information
+ *   - Validates file ownership via user_token, in the same primary key lookup that reads the file
+ *   - Builds the details with file_json, tags come from the file's tag_ids
  *   - Returns empty object for metadata if none exists
  *   - Returns NULL instead of raising an exception for not found/access denied
+ *   - STABLE, so that the tags and the version are read from the same snapshot
  *
  * Examples:
  *   -- Get details of a specific file
@@ -49,35 +51,15 @@ CREATE OR REPLACE FUNCTION file_details(
 RETURNS TABLE (file_details JSON) AS $$
 DECLARE
     result JSON;
-    file_tags_result JSON;
 BEGIN
-    -- Get tags using file_tags_list function
-    SELECT tags INTO file_tags_result
-    FROM file_tags_list(p_file_id, p_user_token);
-
-    -- If file_tags_list returns NULL, it means file not found or access denied
-    IF file_tags_result IS NULL THEN
-        RETURN QUERY SELECT NULL::JSON;
-        RETURN;
-    END IF;
-
-    SELECT json_build_object(
-        'id', f.id,
-        'name', f.name,
-        'created_at', f.created_at,
-        'updated_at', f.updated_at,
-        'parent_id', f.parent_id,
-        'storage_id', f.storage_id,
-        'metadata', COALESCE(f.metadata, '{}'::jsonb),
-        'tags', file_tags_result
-    ) INTO result
+    SELECT file_json(f) INTO result
     FROM files f
     WHERE f.id = p_file_id
         AND f.user_token = p_user_token;
 
     RETURN QUERY SELECT result;
 END;
-$$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql STABLE;
 
 -- Add function comment
 COMMENT ON FUNCTION file_details(UUID, TEXT) IS
@@ -98,7 +80,8 @@ Returns:
       tags: {
         names: string[],
         ids: integer[]
-      }
+      },
+      version: integer
     }
 Returns NULL if file not found or user_token does not match.';
 
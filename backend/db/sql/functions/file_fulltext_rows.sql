@@ -0,0 +1,93 @@
+/*
+ * Function: file_fulltext_rows
+ *
+ * Full-text searches files by the words of their name and the string values of their metadata,
+ * returning one page of the matches as rows ordered by relevance. item_fulltext_search aggregates
+ * these rows into a JSON array, and the API streams them directly through a server-side cursor.
+ *
+ * Parameters:
+ *   - p_query (TEXT): Search terms in web search syntax ("quoted phrase", or, -excluded)
+ *   - p_parent_id (UUID): Optional parent directory UUID to limit search scope
+ *   - p_tag_names (TEXT[]): Optional array of tag names to filter files (all must match)
+ *   - p_metadata_filters (JSONB): Optional metadata criteria (all must match)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *   - p_limit (INTEGER): Maximum number of files to return
+ *   - p_offset (INTEGER): Number of matches to skip
+ *
+ * Returns:
+ *   TABLE:
+ *     - type (TEXT): Always 'file'
+ *     - id, name, parent_id, created_at, updated_at, storage_id, metadata: File columns
+ *     - rank (REAL): Relevance of the file to the query, higher is better
+ *
+ * Implementation Notes:
+ *   - Written in SQL so the planner inlines it into the calling query
+ *   - Matches files.search_vector, served by idx_files_search_vector in the user's partition
+ *   - The tag filter tests files.tag_ids, like file_search_rows
+ *   - Name words weigh more than metadata words, ties are ordered by (name, id) so pages are stable
+ *   - '.' separates words in the query as it does in names, so 'report.pdf' finds report_2024.pdf
+ *
+ * Examples:
+ *   -- First 20 files about quarterly reports, excluding drafts
+ *   SELECT * FROM file_fulltext_rows('quarterly report -draft', NULL, NULL, NULL, 'user123', 20, 0);
+ */
+CREATE OR REPLACE FUNCTION file_fulltext_rows(
+    p_query TEXT,
+    p_parent_id UUID DEFAULT NULL,
+    p_tag_names TEXT[] DEFAULT NULL,
+    p_metadata_filters JSONB DEFAULT NULL,
+    p_user_token TEXT DEFAULT 'public',
+    p_limit INTEGER DEFAULT 100,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    type TEXT,
+    id UUID,
+    name TEXT,
+    parent_id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    storage_id TEXT,
+    metadata JSONB,
+    rank REAL
+) AS $$
+    SELECT
+        'file'::TEXT,
+        f.id,
+        f.name,
+        f.parent_id,
+        f.created_at,
+        f.updated_at,
+        f.storage_id,
+        f.metadata,
+        ts_rank(f.search_vector, websearch_to_tsquery('simple', translate(p_query, '.', ' '))) AS rank
+    FROM files f
+    WHERE f.user_token = p_user_token
+        AND f.search_vector @@ websearch_to_tsquery('simple', translate(p_query, '.', ' '))
+        AND (p_parent_id IS NULL OR f.parent_id = p_parent_id)
+        -- Tag filter, all requested tags must be present (see tags_resolve_ids)
+        AND (
+            p_tag_names IS NULL
+            OR f.tag_ids @> tags_resolve_ids(p_tag_names, p_user_token)
+        )
+        -- Metadata filter
+        AND (
+            p_metadata_filters IS NULL
+            OR f.metadata @> p_metadata_filters
+        )
+    ORDER BY rank DESC, f.name, f.id
+    LIMIT p_limit
+    OFFSET p_offset;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION file_fulltext_rows(TEXT, UUID, TEXT[], JSONB, TEXT, INTEGER, INTEGER) IS
+'Full-text searches files by name and metadata string values, most relevant first.
+Parameters:
+  - p_query: Search terms in web search syntax
+  - p_parent_id: Limit search to items in this directory (optional)
+  - p_tag_names: Array of tag names to filter by (optional, all must match)
+  - p_metadata_filters: JSONB object with metadata criteria (optional)
+  - p_user_token: User token for access control
+  - p_limit, p_offset: Page of matches to return
+Returns: rows of matching files with their rank, ordered by (rank DESC, name, id)';
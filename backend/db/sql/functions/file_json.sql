@@ -0,0 +1,54 @@
+/*
+ * Function: file_json
+ *
+ * Builds the details of a file from its row, in the format returned by file_details.
+ *
+ * Parameters:
+ *   - f (files): The file's row
+ *
+ * Returns:
+ *   JSON: The file details (see file_details)
+ *
+ * Implementation Notes:
+ *   - Takes the row rather than an ID, so that writes build their response from the row they
+ *     wrote (INSERT/UPDATE ... RETURNING file_json(f)) instead of selecting it again
+ *   - Tags are resolved from the row's tag_ids by primary key, without reading file_tags
+ *   - PL/pgSQL rather than SQL: the tags subquery keeps the function from being inlined, and a
+ *     SQL function would plan it over every tags partition again on each call
+ *   - The caller is responsible for access control
+ *
+ * Examples:
+ *   SELECT file_json(f) FROM files f WHERE f.id = '123e4567-e89b-12d3-a456-426614174000';
+ */
+
+CREATE OR REPLACE FUNCTION file_json(f files)
+RETURNS JSON AS $$
+BEGIN
+    RETURN json_build_object(
+        'id', f.id,
+        'name', f.name,
+        'created_at', f.created_at,
+        'updated_at', f.updated_at,
+        'parent_id', f.parent_id,
+        'storage_id', f.storage_id,
+        'metadata', COALESCE(f.metadata, '{}'::jsonb),
+        'tags', (
+            SELECT json_build_object(
+                'names', COALESCE(array_agg(t.name ORDER BY t.name), ARRAY[]::TEXT[]),
+                'ids', COALESCE(array_agg(t.id ORDER BY t.name), ARRAY[]::INTEGER[])
+            )
+            FROM tags t
+            WHERE t.id = ANY(f.tag_ids)
+                AND t.user_token = f.user_token
+        ),
+        'version', f.version
+    );
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION file_json(files) IS
+'Builds the details JSON of a file row, as returned by file_details.
+Parameters:
+  - f: The file row
+Returns: the file details, with its tags';
@@ -11,6 +11,9 @@
  *   - p_user_token (TEXT): The user token for access control and ownership validation
  *
  * Returns: JSON array of matching files
+ *
+ * Implementation Notes:
+ *   - Aggregates the rows of file_search_rows, which holds the search criteria
  */
 CREATE OR REPLACE FUNCTION file_search(
     p_query TEXT DEFAULT NULL,
@@ -21,57 +24,8 @@ CREATE OR REPLACE FUNCTION file_search(
 )
 RETURNS JSON AS $$
 DECLARE
-    v_name_pattern TEXT;
     file_result JSON;
 BEGIN
-    -- Prepare name search pattern if query provided
-    IF p_query IS NOT NULL THEN
-        v_name_pattern := '%' || p_query || '%';
-    END IF;
-
-    WITH matching_files AS (
-        SELECT DISTINCT
-            f.id,
-            f.name,
-            f.parent_id,
-            f.created_at,
-            f.updated_at,
-            f.storage_id,
-            f.metadata
-        FROM files f
-        -- Join with tags if tag filter is provided
-        LEFT JOIN file_tags ft ON f.id = ft.file_id
-        LEFT JOIN tags t ON ft.tag_id = t.id AND t.user_token = p_user_token
-        WHERE f.user_token = p_user_token
-            AND (p_parent_id IS NULL OR f.parent_id = p_parent_id)
-            AND (
-                p_query IS NULL
-                OR f.name ILIKE v_name_pattern
-            )
-            -- Tag filter
-            AND (
-                p_tag_names IS NULL
-                OR t.name = ANY(p_tag_names)
-            )
-            -- Metadata filter
-            AND (
-                p_metadata_filters IS NULL
-                OR f.metadata @> p_metadata_filters
-            )
-        GROUP BY
-            f.id,
-            f.name,
-            f.parent_id,
-            f.created_at,
-            f.updated_at,
-            f.storage_id,
-            f.metadata
-        -- If tags specified, ensure all required tags are present
-        HAVING
-            p_tag_names IS NULL
-            OR array_length(p_tag_names, 1) = count(DISTINCT t.name)
-        ORDER BY f.name
-    )
     SELECT json_agg(
         json_build_object(
             'id', id,
@@ -80,12 +34,13 @@ BEGIN
             'created_at', created_at,
             'updated_at', updated_at,
             'storage_id', storage_id,
-            'metadata', metadata,
-            'type', 'file'
+            'metadata', COALESCE(metadata, '{}'::jsonb),
+            'type', 'file',
+            'rank', NULL
         )
     )
     INTO file_result
-    FROM matching_files;
+    FROM file_search_rows(p_query, p_parent_id, p_tag_names, p_metadata_filters, p_user_token);
 
     RETURN COALESCE(file_result, '[]'::JSON);
 END;
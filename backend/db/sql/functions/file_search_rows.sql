@@ -0,0 +1,84 @@
+/*
+ * Function: file_search_rows
+ *
+ * Searches for files based on multiple criteria including name, location, tags, and metadata,
+ * returning the matches as rows ordered by (name, id). file_search aggregates these rows into a
+ * JSON array, and the API streams them directly through a server-side cursor.
+ *
+ * Parameters:
+ *   - p_query (TEXT): Optional text to search in file names (case-insensitive, uses LIKE)
+ *   - p_parent_id (UUID): Optional parent directory UUID to limit search scope
+ *   - p_tag_names (TEXT[]): Optional array of tag names to filter files (all must match)
+ *   - p_metadata_filters (JSONB): Optional metadata criteria (all must match)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *
+ * Returns:
+ *   TABLE:
+ *     - type (TEXT): Always 'file'
+ *     - id, name, parent_id, created_at, updated_at, storage_id, metadata: File columns
+ *
+ * Implementation Notes:
+ *   - Written in SQL so the planner inlines it into the calling query
+ *   - The name match is served by the trigram index idx_files_name_trgm on (user_token, name)
+ *   - The tag filter is one containment test of files.tag_ids against the requested tag IDs,
+ *     served by idx_files_tag_ids on (user_token, tag_ids). Files are neither joined to their
+ *     tags nor grouped, and GIN intersects the tags' posting lists starting from the rarest
+ *   - The IDs come from tags_resolve_ids rather than a subquery, so the planner sees them and
+ *     reads the trigram index instead when the name is rarer than the tags
+ */
+CREATE OR REPLACE FUNCTION file_search_rows(
+    p_query TEXT DEFAULT NULL,
+    p_parent_id UUID DEFAULT NULL,
+    p_tag_names TEXT[] DEFAULT NULL,
+    p_metadata_filters JSONB DEFAULT NULL,
+    p_user_token TEXT DEFAULT 'public'
+)
+RETURNS TABLE (
+    type TEXT,
+    id UUID,
+    name TEXT,
+    parent_id UUID,
+    created_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ,
+    storage_id TEXT,
+    metadata JSONB
+) AS $$
+    SELECT
+        'file'::TEXT,
+        f.id,
+        f.name,
+        f.parent_id,
+        f.created_at,
+        f.updated_at,
+        f.storage_id,
+        f.metadata
+    FROM files f
+    WHERE f.user_token = p_user_token
+        AND (p_parent_id IS NULL OR f.parent_id = p_parent_id)
+        AND (
+            p_query IS NULL
+            OR f.name ILIKE '%' || p_query || '%'
+        )
+        -- Tag filter, all requested tags must be present (see tags_resolve_ids)
+        AND (
+            p_tag_names IS NULL
+            OR f.tag_ids @> tags_resolve_ids(p_tag_names, p_user_token)
+        )
+        -- Metadata filter
+        AND (
+            p_metadata_filters IS NULL
+            OR f.metadata @> p_metadata_filters
+        )
+    ORDER BY f.name, f.id;
+$$ LANGUAGE sql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION file_search_rows(TEXT, UUID, TEXT[], JSONB, TEXT) IS
+'Searches for files based on multiple criteria.
+Parameters:
+  - p_query: Text to search in names (optional, case-insensitive)
+  - p_parent_id: Limit search to items in this directory (optional)
+  - p_tag_names: Array of tag names to filter by (optional, all must match)
+  - p_metadata_filters: JSONB object with metadata criteria (optional)
+  - p_user_token: User token for access control
+Returns: rows of matching files ordered by (name, id)';
@@ -19,7 +19,8 @@
  *   - P0002: File not found or access denied
  *
  * Implementation Notes:
- *   - Validates file ownership via user_token
+ *   - Validates file ownership via user_token in the statements that change the tags, and
+ *     reads the result with file_tags_list, which is NULL when the file is not found
  *   - Automatically creates missing tags
  *   - Maintains user-specific tag namespaces
  *   - Handles duplicate tags gracefully
@@ -36,45 +37,29 @@ RETURNS TABLE (tags JSON) AS $$
 DECLARE
     result JSON;
 BEGIN
-    -- Validate file exists and belongs to user
-    IF NOT validate_file_ownership(p_file_id, p_user_token) THEN
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
+
+    -- Ensure all tags exist (create if needed), then add the associations missing from the
+    -- file, if it belongs to the user
+    INSERT INTO file_tags (file_id, tag_id, user_token)
+    SELECT f.id, t.id, f.user_token
+    FROM files f
+    CROSS JOIN validate_tags_exist(p_tag_names, p_user_token) t
+    WHERE f.id = p_file_id
+        AND f.user_token = p_user_token
+    ON CONFLICT (file_id, tag_id, user_token) DO NOTHING;
+
+    -- Tags after the operation, NULL when the file is not found or access denied
+    SELECT t.tags INTO result
+    FROM file_tags_list(p_file_id, p_user_token) t;
+
+    IF result IS NULL THEN
         RAISE EXCEPTION 'File not found or access denied'
             USING ERRCODE = 'P0002';
     END IF;
 
-    -- Start transaction for the entire operation
-    BEGIN
-        -- First ensure all tags exist (create if needed)
-        WITH validated_tags AS (
-            SELECT id, name FROM validate_tags_exist(p_tag_names, p_user_token)
-        )
-        -- Then add new file-tag associations
-        INSERT INTO file_tags (file_id, tag_id)
-        SELECT p_file_id, id
-        FROM validated_tags
-        ON CONFLICT (file_id, tag_id) DO NOTHING;
-
-        -- Get updated tags
-        WITH file_tags_result AS (
-            SELECT
-                array_agg(t.name ORDER BY t.name) as tag_names,
-                array_agg(t.id ORDER BY t.name) as tag_ids
-            FROM file_tags ft
-            INNER JOIN tags t ON t.id = ft.tag_id
-            WHERE ft.file_id = p_file_id
-                AND t.user_token = p_user_token
-            GROUP BY ft.file_id
-        )
-        SELECT json_build_object(
-            'names', COALESCE((SELECT tag_names FROM file_tags_result), ARRAY[]::TEXT[]),
-            'ids', COALESCE((SELECT tag_ids FROM file_tags_result), ARRAY[]::INTEGER[])
-        ) INTO result;
-
-        RETURN QUERY SELECT result;
-    EXCEPTION
-        WHEN OTHERS THEN
-            RAISE;
-    END;
+    RETURN QUERY SELECT result;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -16,7 +16,8 @@
  *   Note: Returns NULL if file not found or access denied
  *
  * Implementation Notes:
- *   - Validates file ownership via user_token
+ *   - Validates file ownership via user_token, in the lookup of the file
+ *   - Reads the tag IDs mirrored in files.tag_ids and resolves them by primary key
  *   - Returns tags sorted alphabetically by name
  *   - Returns empty arrays if file has no tags
  *   - Returns NULL if file not found or access denied
@@ -33,36 +34,23 @@ RETURNS TABLE (tags JSON) AS $$
 DECLARE
     result JSON;
 BEGIN
-    -- First validate file ownership
-    IF NOT validate_file_ownership(p_file_id, p_user_token) THEN
-        RETURN QUERY SELECT NULL::JSON;
-        RETURN;
-    END IF;
-
-    WITH file_tags AS (
-        -- Get all tags for the file
-        SELECT
-            array_agg(t.name ORDER BY t.name) as tag_names,
-            array_agg(t.id ORDER BY t.name) as tag_ids
-        FROM files f
-        LEFT JOIN file_tags ft ON ft.file_id = f.id
-        LEFT JOIN tags t ON t.id = ft.tag_id AND t.user_token = p_user_token
-        WHERE f.id = p_file_id
-            AND f.user_token = p_user_token
-        GROUP BY f.id
-    )
-    SELECT json_build_object(
-        'names', COALESCE(ft.tag_names, ARRAY[]::TEXT[]),
-        'ids', COALESCE(ft.tag_ids, ARRAY[]::INTEGER[])
+    -- The file's lookup is the ownership check, its tag_ids mirror file_tags
+    SELECT (
+        SELECT json_build_object(
+            'names', COALESCE(array_agg(t.name ORDER BY t.name), ARRAY[]::TEXT[]),
+            'ids', COALESCE(array_agg(t.id ORDER BY t.name), ARRAY[]::INTEGER[])
+        )
+        FROM tags t
+        WHERE t.id = ANY(f.tag_ids)
+            AND t.user_token = f.user_token
     ) INTO result
-    FROM file_tags ft;
+    FROM files f
+    WHERE f.id = p_file_id
+        AND f.user_token = p_user_token;
 
-    RETURN QUERY SELECT COALESCE(result, json_build_object(
-        'names', ARRAY[]::TEXT[],
-        'ids', ARRAY[]::INTEGER[]
-    ));
+    RETURN QUERY SELECT result;
 END;
-$$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql STABLE;
 
 -- Add function comment
 COMMENT ON FUNCTION file_tags_list(UUID, TEXT) IS
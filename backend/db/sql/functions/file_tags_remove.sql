@@ -19,7 +19,8 @@
  *   - P0002: File not found or access denied
  *
  * Implementation Notes:
- *   - Validates file ownership via user_token
+ *   - Validates file ownership via user_token in the statements that change the tags, and
+ *     reads the result with file_tags_list, which is NULL when the file is not found
  *   - Silently ignores non-existent tags
  *   - All operations are atomic (transaction-based)
  *   - Returns alphabetically sorted tag lists
@@ -34,43 +35,29 @@ RETURNS TABLE (tags JSON) AS $$
 DECLARE
     result JSON;
 BEGIN
-    -- Validate file exists and belongs to user
-    IF NOT validate_file_ownership(p_file_id, p_user_token) THEN
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
+
+    -- Remove specified tags, if the file belongs to the user (file_tags rows carry the
+    -- user_token of their file)
+    DELETE FROM file_tags ft
+    USING tags t
+    WHERE ft.file_id = p_file_id
+        AND ft.user_token = p_user_token
+        AND ft.tag_id = t.id
+        AND t.name = ANY(p_tag_names)
+        AND t.user_token = p_user_token;
+
+    -- Tags after the operation, NULL when the file is not found or access denied
+    SELECT t.tags INTO result
+    FROM file_tags_list(p_file_id, p_user_token) t;
+
+    IF result IS NULL THEN
         RAISE EXCEPTION 'File not found or access denied'
             USING ERRCODE = 'P0002';
     END IF;
 
-    -- Start transaction for the entire operation
-    BEGIN
-        -- Remove specified tags
-        DELETE FROM file_tags ft
-        USING tags t
-        WHERE ft.file_id = p_file_id
-            AND ft.tag_id = t.id
-            AND t.name = ANY(p_tag_names)
-            AND t.user_token = p_user_token;
-
-        -- Get updated tags
-        WITH file_tags_result AS (
-            SELECT
-                array_agg(t.name ORDER BY t.name) as tag_names,
-                array_agg(t.id ORDER BY t.name) as tag_ids
-            FROM file_tags ft
-            INNER JOIN tags t ON t.id = ft.tag_id
-            WHERE ft.file_id = p_file_id
-                AND t.user_token = p_user_token
-            GROUP BY ft.file_id
-        )
-        SELECT json_build_object(
-            'names', COALESCE((SELECT tag_names FROM file_tags_result), ARRAY[]::TEXT[]),
-            'ids', COALESCE((SELECT tag_ids FROM file_tags_result), ARRAY[]::INTEGER[])
-        ) INTO result;
-
-        RETURN QUERY SELECT result;
-    EXCEPTION
-        WHEN OTHERS THEN
-            RAISE;
-    END;
+    RETURN QUERY SELECT result;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -19,7 +19,8 @@
  *   - P0002: File not found or access denied
  *
  * Implementation Notes:
- *   - Validates file ownership via user_token
+ *   - Validates file ownership via user_token in the statements that change the tags, and
+ *     reads the result with file_tags_list, which is NULL when the file is not found
  *   - Automatically creates missing tags
  *   - Maintains user-specific tag namespaces
  *   - All operations are atomic (transaction-based)
@@ -37,51 +38,39 @@ CREATE OR REPLACE FUNCTION file_tags_set(
 )
 RETURNS TABLE (tags JSON) AS $$
 DECLARE
+    v_tag_ids INTEGER[];
     result JSON;
 BEGIN
-    -- Validate file exists and belongs to user
-    IF NOT validate_file_ownership(p_file_id, p_user_token) THEN
-        RAISE EXCEPTION 'File not found or access denied'
-            USING ERRCODE = 'P0002';
-    END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
+
+    -- Ensure all new tags exist (create if needed)
+    v_tag_ids := ARRAY(SELECT id FROM validate_tags_exist(p_tag_names, p_user_token));
 
-    -- Start transaction for the entire operation
-    BEGIN
-        -- First remove all existing tags
-        DELETE FROM file_tags
-        WHERE file_id = p_file_id;
+    -- Replace the tags of the file if it belongs to the user, keeping the ones that stay.
+    -- file_tags rows carry the user_token of their file.
+    DELETE FROM file_tags
+    WHERE file_id = p_file_id
+        AND user_token = p_user_token
+        AND tag_id <> ALL(v_tag_ids);
 
-        -- Ensure all new tags exist (create if needed)
-        WITH validated_tags AS (
-            SELECT id, name FROM validate_tags_exist(p_tag_names, p_user_token)
-        )
-        -- Then set new file-tag associations
-        INSERT INTO file_tags (file_id, tag_id)
-        SELECT p_file_id, id
-        FROM validated_tags
-        ON CONFLICT (file_id, tag_id) DO NOTHING;
+    INSERT INTO file_tags (file_id, tag_id, user_token)
+    SELECT f.id, unnest(v_tag_ids), f.user_token
+    FROM files f
+    WHERE f.id = p_file_id
+        AND f.user_token = p_user_token
+    ON CONFLICT (file_id, tag_id, user_token) DO NOTHING;
 
-        -- Get updated tags
-        WITH file_tags_result AS (
-            SELECT
-                array_agg(t.name ORDER BY t.name) as tag_names,
-                array_agg(t.id ORDER BY t.name) as tag_ids
-            FROM file_tags ft
-            INNER JOIN tags t ON t.id = ft.tag_id
-            WHERE ft.file_id = p_file_id
-                AND t.user_token = p_user_token
-            GROUP BY ft.file_id
-        )
-        SELECT json_build_object(
-            'names', COALESCE((SELECT tag_names FROM file_tags_result), ARRAY[]::TEXT[]),
-            'ids', COALESCE((SELECT tag_ids FROM file_tags_result), ARRAY[]::INTEGER[])
-        ) INTO result;
+    -- Tags after the operation, NULL when the file is not found or access denied
+    SELECT t.tags INTO result
+    FROM file_tags_list(p_file_id, p_user_token) t;
+
+    IF result IS NULL THEN
+        RAISE EXCEPTION 'File not found or access denied'
+            USING ERRCODE = 'P0002';
+    END IF;
 
-        RETURN QUERY SELECT result;
-    EXCEPTION
-        WHEN OTHERS THEN
-            RAISE;
-    END;
+    RETURN QUERY SELECT result;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -1,7 +1,7 @@
 /*
  * Function: file_update
  *
- * Updates a file's properties, allowing for name changes, relocation, and metadata updates.
+ * Updates a file's properties, allowing for name changes, relocation, metadata and tag updates.
  * This function handles various types of updates while ensuring naming uniqueness, proper
  * access control, and data consistency.
  *
@@ -17,6 +17,9 @@
  *     * If NULL, keeps current metadata
  *     * If provided, replaces entire metadata object (not merged)
  *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *   - p_tag_names (TEXT[]): Optional new tag names
+ *     * If NULL, keeps current tags
+ *     * If provided, replaces all tags of the file, creating missing ones
  *
  * Returns:
  *   TABLE (file_details JSON): JSON object containing the updated file details
@@ -28,13 +31,17 @@
  *   - 23505: Name conflict in target location
  *
  * Implementation Notes:
- *   - Validates ownership of both source file and target parent directory
+ *   - Validates ownership of both source file and target parent directory in the UPDATE itself,
+ *     and only looks them up again when nothing was updated, to report why
  *   - Handles partial updates (name only, location only, metadata only, or combinations)
- *   - Maintains unique file names within each directory level
+ *   - Maintains unique file names within each directory level through the unique
+ *     (user_token, parent_id, name) index, a conflict raises unique_violation (23505)
  *   - Updates timestamps automatically via triggers
- *   - Returns complete updated file details including tags
- *   - All operations are atomic (transaction-based)
- *   - For tag management, use the separate manage_file_tags function
+ *   - Returns complete updated file details including tags, built from the updated row unless
+ *     the tags changed (see file_json)
+ *   - All operations are atomic (transaction-based), so the update, the tags and the
+ *     returned details take a single call
+ *   - Only the tags that change are deleted or inserted
  *   - Metadata updates replace the entire object (not merged with existing)
  *
  * Examples:
@@ -65,6 +72,16 @@
  *     'user123'                                 -- user token
  *   );
  *
+ *   -- Rename a file and replace its tags
+ *   SELECT * FROM file_update(
+ *     '123e4567-e89b-12d3-a456-426614174000',  -- file UUID
+ *     'final_report.pdf',                       -- new name
+ *     NULL,                                     -- keep current parent
+ *     NULL,                                     -- keep current metadata
+ *     'user123',                                -- user token
+ *     ARRAY['document', 'final']                -- new tags
+ *   );
+ *
  *   -- Example result:
  *   -- {
  *   --   "id": "123e4567-e89b-12d3-a456-426614174000",
@@ -84,90 +101,89 @@
  *   -- }
  */
 
+-- The previous version did not set tags, replace it rather than overload it
+DROP FUNCTION IF EXISTS file_update(UUID, TEXT, UUID, JSONB, TEXT);
+
 CREATE OR REPLACE FUNCTION file_update(
     p_file_id UUID,
     p_name TEXT DEFAULT NULL,
     p_new_parent_id UUID DEFAULT NULL,
     p_metadata JSONB DEFAULT NULL,
-    p_user_token TEXT DEFAULT 'public'
+    p_user_token TEXT DEFAULT 'public',
+    p_tag_names TEXT[] DEFAULT NULL
 )
 RETURNS TABLE (file_details JSON) AS $$
 DECLARE
-    v_current_parent_id UUID;
-    v_current_name TEXT;
+    v_tag_ids INTEGER[];
     result JSON;
 BEGIN
-    -- Get current file details and validate ownership
-    IF NOT validate_file_ownership(p_file_id, p_user_token) THEN
-        RAISE EXCEPTION 'File not found or access denied'
-            USING ERRCODE = 'P0002'; -- no_data_found
-    END IF;
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
 
-    -- Get current file details
-    SELECT parent_id, name INTO v_current_parent_id, v_current_name
-    FROM files
-    WHERE id = p_file_id;
+    -- One statement checks ownership of the file and its new parent and updates it.
+    -- Name conflicts are rejected by the unique index.
+    UPDATE files f
+    SET name = COALESCE(p_name, f.name),
+        parent_id = COALESCE(p_new_parent_id, f.parent_id),
+        metadata = COALESCE(p_metadata, f.metadata)
+    WHERE f.id = p_file_id
+        AND f.user_token = p_user_token
+        AND (
+            p_new_parent_id IS NULL
+            OR EXISTS (
+                SELECT 1
+                FROM directories p
+                WHERE p.id = p_new_parent_id
+                    AND p.user_token = p_user_token
+            )
+        )
+    RETURNING file_json(f) INTO result;
 
-    -- If new parent specified, validate it exists and belongs to user
-    IF p_new_parent_id IS NOT NULL AND p_new_parent_id != v_current_parent_id THEN
-        IF NOT validate_directory_ownership(p_new_parent_id, p_user_token) THEN
-            RAISE EXCEPTION 'New parent directory not found or access denied'
+    -- Nothing updated, find out why
+    IF result IS NULL THEN
+        IF NOT validate_file_ownership(p_file_id, p_user_token) THEN
+            RAISE EXCEPTION 'File not found or access denied'
                 USING ERRCODE = 'P0002'; -- no_data_found
         END IF;
-    END IF;
 
-    -- If name is changing, check for duplicates in target location
-    IF (p_name IS NOT NULL AND p_name != v_current_name) OR
-       (p_new_parent_id IS NOT NULL AND p_new_parent_id != v_current_parent_id) THEN
-        IF validate_file_name_exists(
-            COALESCE(p_name, v_current_name),
-            COALESCE(p_new_parent_id, v_current_parent_id),
-            p_user_token,
-            p_file_id
-        ) THEN
-            RAISE EXCEPTION 'File with name "%" already exists in target location',
-                COALESCE(p_name, v_current_name)
-                USING ERRCODE = '23505'; -- unique_violation
-        END IF;
+        RAISE EXCEPTION 'New parent directory not found or access denied'
+            USING ERRCODE = 'P0002'; -- no_data_found
     END IF;
 
-    -- Start transaction for the entire update operation
-    BEGIN
-        -- Update file basic details
-        UPDATE files
-        SET name = COALESCE(p_name, name),
-            parent_id = COALESCE(p_new_parent_id, parent_id),
-            metadata = COALESCE(p_metadata, metadata)
-        WHERE id = p_file_id;
+    -- Replace the tags, keeping the ones that stay
+    IF p_tag_names IS NOT NULL THEN
+        v_tag_ids := ARRAY(SELECT id FROM validate_tags_exist(p_tag_names, p_user_token));
+
+        DELETE FROM file_tags
+        WHERE file_id = p_file_id
+            AND user_token = p_user_token
+            AND tag_id <> ALL(v_tag_ids);
 
-        -- Get updated file details
-        SELECT f.file_details INTO result
-        FROM file_details(p_file_id, p_user_token) f;
+        INSERT INTO file_tags (file_id, tag_id, user_token)
+        SELECT p_file_id, unnest(v_tag_ids), p_user_token
+        ON CONFLICT (file_id, tag_id, user_token) DO NOTHING;
 
-        RETURN QUERY SELECT result;
-    EXCEPTION
-        WHEN OTHERS THEN
-            -- Rollback will happen automatically
-            RAISE;
-    END;
+        -- The returned details were built before the tags changed
+        SELECT file_json(f) INTO result
+        FROM files f
+        WHERE f.id = p_file_id
+            AND f.user_token = p_user_token;
+    END IF;
 
-EXCEPTION
-    WHEN unique_violation THEN
-        RAISE EXCEPTION 'File with name "%" already exists in target location',
-            COALESCE(p_name, v_current_name)
-            USING ERRCODE = '23505'; -- unique_violation
+    RETURN QUERY SELECT result;
 END;
 $$ LANGUAGE plpgsql;
 
 -- Add function comment
-COMMENT ON FUNCTION file_update(UUID, TEXT, UUID, JSONB, TEXT) IS
-'Updates a file''s basic details including name, location, and metadata.
+COMMENT ON FUNCTION file_update(UUID, TEXT, UUID, JSONB, TEXT, TEXT[]) IS
+'Updates a file''s details including name, location, metadata and tags.
 Parameters:
   - p_file_id: UUID of the file to update
   - p_name: New name for the file (optional)
   - p_new_parent_id: New parent directory UUID (optional)
   - p_metadata: New metadata JSONB object (optional)
   - p_user_token: User token for access control
+  - p_tag_names: New tag names, replacing the current ones (optional)
 Returns:
   - file_details: JSON object with the updated file''s details (same structure as file_details)
 Raises:
@@ -177,7 +193,7 @@ Notes:
   - Any NULL parameter means "keep existing value"
   - Metadata is replaced entirely if provided (not merged)
   - All operations are atomic (transaction)
-  - For tag management, use the manage_file_tags function instead';
+  - Missing tags are created automatically';
 
 -- Example usage:
 -- Update name only:
@@ -186,5 +202,7 @@ Notes:
 -- SELECT * FROM file_update('file-uuid', NULL, 'new-parent-uuid', NULL, 'user123');
 -- Update metadata only:
 -- SELECT * FROM file_update('file-uuid', NULL, NULL, '{"key": "value"}'::jsonb, 'user123');
+-- Replace tags only:
+-- SELECT * FROM file_update('file-uuid', NULL, NULL, NULL, 'user123', ARRAY['tag1', 'tag2']);
 -- Update multiple attributes:
 -- SELECT * FROM file_update('file-uuid', 'new_name', 'new-parent-uuid', '{"key": "value"}'::jsonb, 'user123');
\ No newline at end of file
@@ -0,0 +1,185 @@
+/*
+ * Function: import_apply
+ *
+ * Creates the directories, files and tags listed in the import_staging table below a directory
+ * (or at the root level). The API loads import_staging with COPY from a path manifest in the same
+ * transaction, see vfs_api.importer.
+ *
+ * Parameters:
+ *   - p_parent_id (UUID): Directory to import into (NULL for the root level)
+ *   - p_user_token (TEXT): The user token for access control and ownership of the new items
+ *
+ * Staging table (temporary, created by the caller):
+ *   import_staging (
+ *     path TEXT[],       -- Path components relative to p_parent_id
+ *     is_dir BOOLEAN,    -- Whether the entry is a directory rather than a file
+ *     storage_id TEXT,   -- Optional, generated when missing
+ *     metadata JSONB,    -- Optional
+ *     tags TEXT[]        -- Optional tag names, created when missing
+ *   )
+ *
+ * Returns:
+ *   TABLE:
+ *     - directories_created (BIGINT): Number of directories created
+ *     - files_created (BIGINT): Number of files created
+ *     - files_skipped (BIGINT): Number of files skipped because a file with that name already exists
+ *
+ * Error Conditions:
+ *   - P0002: Parent directory not found or access denied
+ *
+ * Implementation Notes:
+ *   - Every directory on the paths is resolved or created one level at a time, with one
+ *     statement per level for all the directories of that level, instead of one call per item
+ *   - Existing directories are reused, so a manifest can be imported again to add to a tree
+ *   - Files and their tags are inserted with one statement each, so the child count, rollup
+ *     and tag triggers run once for the whole import
+ *   - A path listed more than once is imported once
+ *   - Runs its statements, and the foreign key checks they fire, with generic plans. The
+ *     statistics of the user's partitions predate the import (or still count the rows of
+ *     users since deleted), and the checks planned with them looked the new rows up by
+ *     user_token alone, reading every file of the user for each tag of a file; the generic
+ *     plan looks each one up by its primary key
+ */
+CREATE OR REPLACE FUNCTION import_apply(
+    p_parent_id UUID,
+    p_user_token TEXT DEFAULT 'public'
+)
+RETURNS TABLE (
+    directories_created BIGINT,
+    files_created BIGINT,
+    files_skipped BIGINT
+) AS $$
+DECLARE
+    v_max_depth INTEGER;
+    v_files BIGINT;
+BEGIN
+    -- Before any row is locked, see change_events_lock
+    PERFORM change_events_lock(p_user_token);
+
+    IF p_parent_id IS NOT NULL AND NOT validate_directory_ownership(p_parent_id, p_user_token) THEN
+        RAISE EXCEPTION 'Parent directory not found or access denied'
+            USING ERRCODE = 'P0002'; -- no_data_found
+    END IF;
+
+    ANALYZE import_staging;
+
+    -- Every directory on the paths: the parents of the files and the listed directories
+    CREATE TEMP TABLE import_dirs ON COMMIT DROP AS
+    SELECT DISTINCT
+        s.path[1:n] AS rel_path,
+        n AS depth,
+        CASE WHEN n = 1 THEN p_parent_id END AS parent_id,
+        NULL::UUID AS id,
+        false AS created
+    FROM import_staging s
+    CROSS JOIN LATERAL generate_series(1, cardinality(s.path) - CASE WHEN s.is_dir THEN 0 ELSE 1 END) n;
+
+    ALTER TABLE import_dirs ADD PRIMARY KEY (rel_path);
+    ANALYZE import_dirs;
+
+    SELECT max(depth) INTO v_max_depth FROM import_dirs;
+
+    FOR v_depth IN 1..COALESCE(v_max_depth, 0) LOOP
+        -- Parents were resolved by the previous level
+        IF v_depth > 1 THEN
+            UPDATE import_dirs i
+            SET parent_id = p.id
+            FROM import_dirs p
+            WHERE i.depth = v_depth
+                AND p.rel_path = i.rel_path[1:v_depth - 1];
+        END IF;
+
+        -- Reuse the directories that already exist
+        IF v_depth = 1 AND p_parent_id IS NULL THEN
+            UPDATE import_dirs i
+            SET id = d.id
+            FROM directories d
+            WHERE i.depth = 1
+                AND d.parent_id IS NULL
+                AND d.name = i.rel_path[1]
+                AND d.user_token = p_user_token;
+        ELSE
+            UPDATE import_dirs i
+            SET id = d.id
+            FROM directories d
+            WHERE i.depth = v_depth
+                AND d.parent_id = i.parent_id
+                AND d.name = i.rel_path[v_depth]
+                AND d.user_token = p_user_token;
+        END IF;
+
+        -- Create the others
+        UPDATE import_dirs
+        SET id = gen_random_uuid(),
+            created = true
+        WHERE depth = v_depth
+            AND id IS NULL;
+
+        INSERT INTO directories (id, name, parent_id, user_token)
+        SELECT id, rel_path[v_depth], parent_id, p_user_token
+        FROM import_dirs
+        WHERE depth = v_depth
+            AND created;
+    END LOOP;
+
+    -- Files, with their new IDs and parents
+    CREATE TEMP TABLE import_files ON COMMIT DROP AS
+    SELECT DISTINCT ON (s.path)
+        gen_random_uuid() AS id,
+        s.path[cardinality(s.path)] AS name,
+        CASE WHEN cardinality(s.path) = 1 THEN p_parent_id ELSE i.id END AS parent_id,
+        COALESCE(s.storage_id, gen_random_uuid()::TEXT) AS storage_id,
+        COALESCE(s.metadata, '{}') AS metadata,
+        s.tags,
+        false AS inserted
+    FROM import_staging s
+    LEFT JOIN import_dirs i ON i.rel_path = s.path[1:cardinality(s.path) - 1]
+    WHERE NOT s.is_dir
+    ORDER BY s.path;
+
+    -- Files whose name is taken are skipped, the unique index covers the root level too
+    WITH inserted_files AS (
+        INSERT INTO files (id, name, parent_id, storage_id, metadata, user_token)
+        SELECT x.id, x.name, x.parent_id, x.storage_id, x.metadata, p_user_token
+        FROM import_files x
+        ON CONFLICT (user_token, parent_id, name) DO NOTHING
+        RETURNING id
+    )
+    UPDATE import_files x
+    SET inserted = true
+    FROM inserted_files i
+    WHERE x.id = i.id;
+
+    GET DIAGNOSTICS v_files = ROW_COUNT;
+
+    -- Tags, created when missing
+    INSERT INTO tags (name, user_token)
+    SELECT DISTINCT t.name, p_user_token
+    FROM import_files x
+    CROSS JOIN unnest(x.tags) AS t(name)
+    WHERE x.inserted
+    ON CONFLICT (name, user_token) DO NOTHING;
+
+    INSERT INTO file_tags (file_id, tag_id, user_token)
+    SELECT DISTINCT x.id, t.id, p_user_token
+    FROM import_files x
+    CROSS JOIN unnest(x.tags) AS n(name)
+    JOIN tags t ON t.name = n.name AND t.user_token = p_user_token
+    WHERE x.inserted;
+
+    RETURN QUERY
+    SELECT
+        (SELECT count(*) FROM import_dirs WHERE created),
+        v_files,
+        (SELECT count(*) FROM import_files) - v_files;
+END;
+$$ LANGUAGE plpgsql
+SET plan_cache_mode = force_generic_plan;
+
+-- Add function comment
+COMMENT ON FUNCTION import_apply(UUID, TEXT) IS
+'Creates the directories, files and tags staged in import_staging, set-wise.
+Parameters:
+  - p_parent_id: Directory to import into (NULL for root level)
+  - p_user_token: User token owning the imported items
+Returns: the number of directories and files created, and of files skipped because their name was taken';
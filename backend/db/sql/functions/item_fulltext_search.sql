@@ -0,0 +1,114 @@
+/*
+ * Function: item_fulltext_search
+ *
+ * Performs a ranked full-text search across files and directories. This is the full-text
+ * counterpart of item_search: items are matched by the words of their name (and, for files, the
+ * string values of their metadata) and returned most relevant first, one page at a time.
+ *
+ * Parameters:
+ *   - p_query (TEXT): Search terms in web search syntax ("quoted phrase", or, -excluded)
+ *   - p_type (TEXT): Type of items to search for ('all', 'file', or 'directory')
+ *   - p_parent_id (UUID): Optional parent directory UUID to limit search scope
+ *   - p_tag_names (TEXT[]): Optional array of tag names to filter files (all must match)
+ *   - p_metadata_filters (JSONB): Optional metadata criteria (all must match)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *   - p_limit (INTEGER): Maximum number of directories, and of files, to return
+ *   - p_offset (INTEGER): Number of matching directories, and of files, to skip
+ *
+ * Returns:
+ *   TABLE:
+ *     - directories (JSON): Array of matching directories, most relevant first
+ *     - files (JSON): Array of matching files, most relevant first
+ *
+ * Example usage:
+ *   SELECT * FROM item_fulltext_search(
+ *     'quarterly report',
+ *     'all',
+ *     NULL,
+ *     NULL,
+ *     NULL,
+ *     'user_token',
+ *     20,
+ *     0
+ *   );
+ */
+CREATE OR REPLACE FUNCTION item_fulltext_search(
+    p_query TEXT,
+    p_type TEXT DEFAULT 'all',
+    p_parent_id UUID DEFAULT NULL,
+    p_tag_names TEXT[] DEFAULT NULL,
+    p_metadata_filters JSONB DEFAULT NULL,
+    p_user_token TEXT DEFAULT 'public',
+    p_limit INTEGER DEFAULT 100,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    directories JSON,
+    files JSON
+) AS $$
+DECLARE
+    dir_result JSON;
+    file_result JSON;
+BEGIN
+    -- Validate type parameter
+    IF p_type NOT IN ('all', 'file', 'directory') THEN
+        RAISE EXCEPTION 'Invalid type parameter. Must be one of: all, file, directory'
+            USING ERRCODE = 'P0001';
+    END IF;
+
+    -- Get directories if needed
+    IF p_type IN ('all', 'directory') THEN
+        SELECT json_agg(
+            json_build_object(
+                'id', id,
+                'name', name,
+                'parent_id', parent_id,
+                'created_at', created_at,
+                'updated_at', updated_at,
+                'type', 'directory',
+                'rank', rank
+            )
+            ORDER BY rank DESC, name, id
+        )
+        INTO dir_result
+        FROM directory_fulltext_rows(p_query, p_parent_id, p_user_token, p_limit, p_offset);
+    END IF;
+
+    -- Get files if needed
+    IF p_type IN ('all', 'file') THEN
+        SELECT json_agg(
+            json_build_object(
+                'id', id,
+                'name', name,
+                'parent_id', parent_id,
+                'created_at', created_at,
+                'updated_at', updated_at,
+                'storage_id', storage_id,
+                'metadata', COALESCE(metadata, '{}'::jsonb),
+                'type', 'file',
+                'rank', rank
+            )
+            ORDER BY rank DESC, name, id
+        )
+        INTO file_result
+        FROM file_fulltext_rows(p_query, p_parent_id, p_tag_names, p_metadata_filters, p_user_token, p_limit, p_offset);
+    END IF;
+
+    RETURN QUERY SELECT COALESCE(dir_result, '[]'::JSON) AS directories, COALESCE(file_result, '[]'::JSON) AS files;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Add function comment
+COMMENT ON FUNCTION item_fulltext_search(TEXT, TEXT, UUID, TEXT[], JSONB, TEXT, INTEGER, INTEGER) IS
+'Full-text searches both files and directories, most relevant first.
+Parameters:
+  - p_query: Search terms in web search syntax
+  - p_type: Type of items to search ("all", "file", or "directory")
+  - p_parent_id: Limit search to items in this directory (optional)
+  - p_tag_names: Array of tag names to filter files by (optional)
+  - p_metadata_filters: JSONB object with metadata criteria (optional)
+  - p_user_token: User token for access control
+  - p_limit, p_offset: Page of matches to return for each type
+Returns: Table with two JSON columns:
+  - directories: Array of matching directories with their rank
+  - files: Array of matching files with their rank';
@@ -0,0 +1,207 @@
+/*
+ * Function: sync_changes
+ *
+ * Lists what changed in a user's tree (or in a directory's subtree) since a position of the change
+ * feed, one entry per changed item with its current state, for clients keeping a copy in sync.
+ * Deleted items, and items moved out of the subtree, are returned as tombstones.
+ *
+ * Parameters:
+ *   - p_root_id (UUID): Root directory of the subtree (NULL for all the user's items)
+ *   - p_user_token (TEXT): The user token for access control and ownership validation
+ *   - p_since (BIGINT): Position returned by the previous call, the sequence number of the last
+ *     change event it covered (NULL for the current position, without changes)
+ *   - p_limit (INTEGER): Maximum number of change events covered by one call
+ *
+ * Returns:
+ *   TABLE:
+ *     - next_cursor (BIGINT): Position to pass as p_since to the next call
+ *     - has_more (BOOLEAN): Whether more changes remain after next_cursor
+ *     - changes (JSON): Array of the changed items, tombstones first, then directories from the
+ *       top down and files, so each can be applied in order:
+ *         {
+ *           "op": "created" | "updated" | "moved" | "deleted",
+ *           "type": "directory" | "file",
+ *           "id": UUID,
+ *           "name": string,              // null in tombstones
+ *           "parent_id": UUID | null,    // null in tombstones
+ *           "version": number,           // null in tombstones
+ *           "storage_id": string,        // Files only, else null
+ *           "metadata": object           // Files only, else null
+ *         }
+ *
+ * Error Conditions:
+ *   - P0002: Root directory not found or access denied
+ *
+ * Implementation Notes:
+ *   - Reads up to p_limit events after p_since with change_events_list, so a call costs the
+ *     churn since the cursor, not the size of the tree
+ *   - An item changed several times is returned once, in its current state: "created" if it was
+ *     created since p_since, else "moved" if it was moved, else "updated". An item created and
+ *     deleted since p_since is left out
+ *   - Items read in their current state may have changed after next_cursor, and will be returned
+ *     again by the next call, so applying the changes must be idempotent
+ *   - Deleting a directory deletes its contents, which get no tombstones of their own
+ *   - A directory moved into the subtree from outside it is returned as "moved", and its current
+ *     contents, which the client never got, as "created" (found on idx_directories_path). They
+ *     are returned whole, however many they are: p_limit bounds the events read, not the entries
+ *   - The changes of the root's ancestors are left out, they are not in the subtree
+ *
+ * Examples:
+ *   -- Initial position, taken before loading the tree
+ *   SELECT * FROM sync_changes(NULL, 'user123', NULL, 1000);
+ *
+ *   -- Changes since position 1000 below a directory
+ *   SELECT * FROM sync_changes('123e4567-e89b-12d3-a456-426614174000', 'user123', 1000, 1000);
+ */
+
+CREATE OR REPLACE FUNCTION sync_changes(
+    p_root_id UUID,
+    p_user_token TEXT DEFAULT 'public',
+    p_since BIGINT DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+    next_cursor BIGINT,
+    has_more BOOLEAN,
+    changes JSON
+) AS $$
+DECLARE
+    v_root_path UUID[];
+BEGIN
+    IF p_root_id IS NOT NULL THEN
+        SELECT path INTO v_root_path
+        FROM directories
+        WHERE id = p_root_id
+            AND user_token = p_user_token;
+
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'Directory not found or access denied'
+                USING ERRCODE = 'P0002'; -- no_data_found
+        END IF;
+    END IF;
+
+    IF p_since IS NULL THEN
+        RETURN QUERY
+        SELECT COALESCE(max(e.seq), 0), false, '[]'::JSON
+        FROM change_events e
+        WHERE e.user_token = p_user_token;
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    WITH events AS (
+        SELECT e.seq, e.op, e.type, e.id
+        FROM change_events_list(p_user_token, p_since, v_root_path, p_limit) e
+    ),
+    -- Directories moved into the subtree from outside it, whose contents the client never got
+    entered AS (
+        SELECT DISTINCT e.id
+        FROM events e
+        JOIN change_events c ON c.seq = e.seq
+        WHERE v_root_path IS NOT NULL
+            AND e.type = 'directory'
+            AND e.op = 'moved'
+            AND NOT c.previous_ancestors @> ARRAY[p_root_id]
+    ),
+    -- Their current contents, unchanged themselves, so they have no events
+    contents AS (
+        SELECT 'directory'::TEXT AS type, d.id
+        FROM entered m
+        JOIN directories d ON d.user_token = p_user_token
+            AND d.path @> ARRAY[m.id]
+            AND d.id <> m.id
+        UNION ALL
+        SELECT 'file', f.id
+        FROM entered m
+        JOIN directories d ON d.user_token = p_user_token
+            AND d.path @> ARRAY[m.id]
+        JOIN files f ON f.parent_id = d.id
+            AND f.user_token = p_user_token
+    ),
+    items AS (
+        SELECT
+            u.type,
+            u.id,
+            bool_or(u.created) AS created,
+            bool_or(u.moved) AS moved
+        FROM (
+            SELECT e.type, e.id, e.op = 'created' AS created, e.op = 'moved' AS moved
+            FROM events e
+            WHERE v_root_path IS NULL
+                OR e.id <> ALL(v_root_path[1:cardinality(v_root_path) - 1])
+            UNION ALL
+            SELECT c.type, c.id, true, false
+            FROM contents c
+        ) u
+        GROUP BY u.type, u.id
+    ),
+    current_items AS (
+        SELECT
+            i.type,
+            i.id,
+            CASE
+                WHEN COALESCE(d.id, f.id) IS NULL THEN CASE WHEN NOT i.created THEN 'deleted' END
+                WHEN i.created THEN 'created'
+                WHEN i.moved THEN 'moved'
+                ELSE 'updated'
+            END AS op,
+            COALESCE(d.name, f.name) AS name,
+            COALESCE(d.parent_id, f.parent_id) AS parent_id,
+            COALESCE(d.version, f.version) AS version,
+            f.storage_id,
+            f.metadata,
+            cardinality(d.path) AS depth
+        FROM items i
+        LEFT JOIN directories d ON i.type = 'directory'
+            AND d.id = i.id
+            AND d.user_token = p_user_token
+            AND (p_root_id IS NULL OR d.path @> ARRAY[p_root_id])
+        LEFT JOIN files f ON i.type = 'file'
+            AND f.id = i.id
+            AND f.user_token = p_user_token
+            AND (
+                p_root_id IS NULL
+                OR EXISTS (
+                    SELECT 1
+                    FROM directories p
+                    WHERE p.id = f.parent_id
+                        AND p.user_token = p_user_token
+                        AND p.path @> ARRAY[p_root_id]
+                )
+            )
+    )
+    SELECT
+        COALESCE((SELECT max(e.seq) FROM events e), p_since),
+        (SELECT count(*) FROM events) = p_limit,
+        COALESCE(
+            (
+                -- Every entry has every key, tombstones read no item and directories no file,
+                -- so the keys that do not apply are null
+                SELECT json_agg(
+                    json_build_object(
+                        'op', c.op, 'type', c.type, 'id', c.id, 'name', c.name,
+                        'parent_id', c.parent_id, 'version', c.version,
+                        'storage_id', c.storage_id, 'metadata', c.metadata
+                    )
+                    ORDER BY c.op <> 'deleted', c.type = 'file', c.depth, c.id
+                )
+                FROM current_items c
+                WHERE c.op IS NOT NULL
+            ),
+            '[]'
+        );
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Add function comment
+COMMENT ON FUNCTION sync_changes(UUID, TEXT, BIGINT, INTEGER) IS
+'Lists the items changed since a change feed position, once each in their current state, with tombstones.
+Parameters:
+  - p_root_id: Root directory of the subtree (NULL for all items)
+  - p_user_token: Access control token
+  - p_since: Position returned by the previous call (NULL for the current position)
+  - p_limit: Maximum number of change events covered by one call
+Returns:
+  - next_cursor: Position for the next call
+  - has_more: Whether more changes remain
+  - changes: Array of changed items, tombstones first, then directories top-down and files';
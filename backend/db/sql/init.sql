@@ -1,41 +1,149 @@
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Trigram operator classes for substring (ILIKE '%q%') name searches
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Lets the name search indexes also hold the user_token (equality) column
+CREATE EXTENSION IF NOT EXISTS btree_gin;
 
+-- Versions of items, the ETags of their GET responses. Drawn from one sequence so that a
+-- version is never reused, even by an item deleted and created again with the same ID.
+CREATE SEQUENCE IF NOT EXISTS item_versions;
+
+-- Tenant tables (directories, files, tags, file_tags) are hash-partitioned by user_token, see
+-- the partitions below. Every query filters on user_token, so it only reads the partition of
+-- its user, and a large user does not bloat the indexes, vacuums and cache of every other.
+-- Primary keys, unique constraints and foreign keys of partitioned tables must include the
+-- partition key, so they all include user_token, which also keeps a user's items together.
 CREATE TABLE IF NOT EXISTS directories (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
     name TEXT NOT NULL,
     user_token TEXT NOT NULL,
-    parent_id UUID REFERENCES directories(id) ON DELETE CASCADE,
+    parent_id UUID,
+    -- Materialized path: IDs from the root directory down to this one, maintained by trigger
+    path UUID[] NOT NULL,
+    -- Number of immediate subdirectories and files, maintained by trigger
+    dir_count INTEGER NOT NULL DEFAULT 0,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    -- Changes with the directory's details and listing, maintained by trigger
+    version BIGINT NOT NULL DEFAULT nextval('item_versions'),
+    -- Full-text search document: the words of the name ('.' separates words too)
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', translate(name, '.', ' ')), 'A')
+    ) STORED,
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE (parent_id, name, user_token)
-);
+    PRIMARY KEY (id, user_token),
+    FOREIGN KEY (parent_id, user_token) REFERENCES directories (id, user_token) ON DELETE CASCADE,
+    -- Names are unique per parent, the root level (NULL parent) included. Writes rely on this
+    -- index for name conflicts (ON CONFLICT, unique_violation) instead of checking beforehand.
+    UNIQUE NULLS NOT DISTINCT (user_token, parent_id, name)
+) PARTITION BY HASH (user_token);
 
 CREATE TABLE IF NOT EXISTS files (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
     name TEXT NOT NULL,
     user_token TEXT NOT NULL,
-    parent_id UUID REFERENCES directories(id) ON DELETE CASCADE,
+    parent_id UUID,
     storage_id TEXT,
     metadata JSONB DEFAULT '{}',
+    -- IDs of the file's tags, mirrored from file_tags by trigger for tag-filtered searches
+    tag_ids INTEGER[] NOT NULL DEFAULT '{}',
+    -- Changes with the file's details, maintained by trigger
+    version BIGINT NOT NULL DEFAULT nextval('item_versions'),
+    -- Full-text search document: the words of the name, ranked above the string values of metadata
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', translate(name, '.', ' ')), 'A')
+        || setweight(jsonb_to_tsvector('simple', COALESCE(metadata, '{}'), '["string"]'), 'B')
+    ) STORED,
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE (parent_id, name, user_token)
+    PRIMARY KEY (id, user_token),
+    FOREIGN KEY (parent_id, user_token) REFERENCES directories (id, user_token) ON DELETE CASCADE,
+    -- Names are unique per parent, the root level (NULL parent) included. Writes rely on this
+    -- index for name conflicts (ON CONFLICT, unique_violation) instead of checking beforehand.
+    UNIQUE NULLS NOT DISTINCT (user_token, parent_id, name)
+) PARTITION BY HASH (user_token);
+
+-- Recursive totals of everything below each directory, maintained by trigger. A directory's
+-- row is removed by the same trigger when it is deleted, which needs the totals it held.
+CREATE TABLE IF NOT EXISTS directory_rollups (
+    directory_id UUID PRIMARY KEY,
+    file_count BIGINT NOT NULL DEFAULT 0,
+    dir_count BIGINT NOT NULL DEFAULT 0,
+    -- Sum of the numeric metadata.size of the files
+    total_size NUMERIC NOT NULL DEFAULT 0
+);
+
+-- Version of each user's root level listing, which has no directories row to hold it
+CREATE TABLE IF NOT EXISTS root_versions (
+    user_token TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT nextval('item_versions')
+);
+
+-- Change feed: one row per create, update, move and delete of a directory or file, appended
+-- by trigger in the same transaction as the change (see change_events_record)
+CREATE TABLE IF NOT EXISTS change_events (
+    -- A user's events are numbered in commit order, the position a feed resumes from
+    seq BIGSERIAL PRIMARY KEY,
+    user_token TEXT NOT NULL,
+    -- 'created', 'updated', 'moved' or 'deleted'
+    op TEXT NOT NULL,
+    -- 'directory' or 'file'
+    item_type TEXT NOT NULL,
+    item_id UUID NOT NULL,
+    name TEXT NOT NULL,
+    -- Parent after the change, before it for deletes (NULL at the root level)
+    parent_id UUID,
+    -- IDs of the directories containing the item, from the root down, for subtree filters
+    ancestors UUID[] NOT NULL,
+    -- Parent and containing directories before a move
+    previous_parent_id UUID,
+    previous_ancestors UUID[],
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Last event of each user removed by change_events_prune: a feed cannot resume from before it
+CREATE TABLE IF NOT EXISTS change_events_pruned (
+    user_token TEXT PRIMARY KEY,
+    seq BIGINT NOT NULL
 );
 
 CREATE TABLE IF NOT EXISTS tags (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     name TEXT NOT NULL,
     user_token TEXT NOT NULL,
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, user_token),
     UNIQUE (name, user_token)
-);
+) PARTITION BY HASH (user_token);
 
+-- Carries the user_token of its file and tag, for the partitioning and the foreign keys
 CREATE TABLE IF NOT EXISTS file_tags (
-    file_id UUID REFERENCES files(id) ON DELETE CASCADE,
-    tag_id INTEGER REFERENCES tags(id) ON DELETE CASCADE,
+    file_id UUID NOT NULL,
+    tag_id INTEGER NOT NULL,
+    user_token TEXT NOT NULL,
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-    PRIMARY KEY (file_id, tag_id)
-);
+    PRIMARY KEY (file_id, tag_id, user_token),
+    FOREIGN KEY (file_id, user_token) REFERENCES files (id, user_token) ON DELETE CASCADE,
+    FOREIGN KEY (tag_id, user_token) REFERENCES tags (id, user_token) ON DELETE CASCADE
+) PARTITION BY HASH (user_token);
+
+-- Partitions of the tenant tables. Their number is the vfs.partitions setting when the schema
+-- is created (default 16, e.g. PGOPTIONS='-c vfs.partitions=64'), changing it afterwards means
+-- moving every row (see migrations/partition_by_user_token.sql).
+DO $$
+DECLARE
+    v_partitions CONSTANT INTEGER := COALESCE(NULLIF(current_setting('vfs.partitions', true), '')::INTEGER, 16);
+    v_table TEXT;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY['directories', 'files', 'tags', 'file_tags'] LOOP
+        FOR v_remainder IN 0..v_partitions - 1 LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+                v_table || '_p' || v_remainder, v_table, v_partitions, v_remainder
+            );
+        END LOOP;
+    END LOOP;
+END $$;
 
 -- Updated_at trigger
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -46,32 +154,683 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- Only renames and moves count as directory updates, not maintenance of derived columns
 DROP TRIGGER IF EXISTS update_directories_updated_at ON directories;
 CREATE TRIGGER update_directories_updated_at
-    BEFORE UPDATE ON directories
+    BEFORE UPDATE OF name, parent_id ON directories
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
 DROP TRIGGER IF EXISTS update_files_updated_at ON files;
 CREATE TRIGGER update_files_updated_at
-    BEFORE UPDATE ON files
+    BEFORE UPDATE OF name, parent_id, storage_id, metadata ON files
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
 
+-- Version triggers
+-- Every update of a row gives it a new version. A directory's listing changes with its
+-- children, whose creates, deletes, renames and moves update the directory's counters
+-- (see the child count triggers), so that bumps its version too.
+CREATE OR REPLACE FUNCTION bump_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.version = nextval('item_versions');
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS bump_directories_version ON directories;
+CREATE TRIGGER bump_directories_version
+    BEFORE UPDATE ON directories
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_version();
+
+DROP TRIGGER IF EXISTS bump_files_version ON files;
+CREATE TRIGGER bump_files_version
+    BEFORE UPDATE ON files
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_version();
+
+
+-- Materialized path triggers
+-- A directory's path is its parent's path plus its own ID, so subtree and ancestry
+-- checks become a single lookup on idx_directories_path instead of a recursive walk.
+CREATE OR REPLACE FUNCTION directories_set_path()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_parent_path UUID[];
+BEGIN
+    IF NEW.parent_id IS NULL THEN
+        NEW.path = ARRAY[NEW.id];
+    ELSE
+        SELECT path INTO v_parent_path
+        FROM directories
+        WHERE id = NEW.parent_id
+            AND user_token = NEW.user_token;
+
+        IF NEW.id = ANY(v_parent_path) THEN
+            RAISE EXCEPTION 'Cannot move directory to its own subdirectory'
+                USING ERRCODE = 'P0001'; -- raise_exception
+        END IF;
+
+        NEW.path = v_parent_path || NEW.id;
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+-- After a move, rewrite the path prefix of every descendant
+CREATE OR REPLACE FUNCTION directories_move_subtree()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE directories
+    SET path = NEW.path || path[array_length(OLD.path, 1) + 1:]
+    WHERE path @> ARRAY[NEW.id]
+        AND user_token = NEW.user_token
+        AND id != NEW.id;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS set_directories_path ON directories;
+CREATE TRIGGER set_directories_path
+    BEFORE INSERT ON directories
+    FOR EACH ROW
+    EXECUTE FUNCTION directories_set_path();
+
+DROP TRIGGER IF EXISTS update_directories_path ON directories;
+CREATE TRIGGER update_directories_path
+    BEFORE UPDATE OF parent_id ON directories
+    FOR EACH ROW
+    WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+    EXECUTE FUNCTION directories_set_path();
+
+DROP TRIGGER IF EXISTS move_directories_subtree ON directories;
+CREATE TRIGGER move_directories_subtree
+    AFTER UPDATE OF parent_id ON directories
+    FOR EACH ROW
+    WHEN (OLD.path IS DISTINCT FROM NEW.path)
+    EXECUTE FUNCTION directories_move_subtree();
+
+
+-- Child count triggers
+-- Keep directories.dir_count and file_count up to date as children are created, deleted and
+-- moved, so directory details are a primary key lookup instead of counting the children.
+-- The triggers run once per statement and apply the net change to each affected parent.
+-- Renames update the parent too, with a net change of 0, so that its version changes with
+-- its listing. Changes at the root level bump the user's root_versions row instead.
+CREATE OR REPLACE FUNCTION directories_count_children()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_parent_ids UUID[];
+    v_parent_users TEXT[];
+    v_deltas INTEGER[];
+    v_root_users TEXT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT
+            array_agg(parent_id) FILTER (WHERE parent_id IS NOT NULL),
+            array_agg(user_token) FILTER (WHERE parent_id IS NOT NULL),
+            array_agg(1) FILTER (WHERE parent_id IS NOT NULL),
+            array_agg(DISTINCT user_token) FILTER (WHERE parent_id IS NULL)
+        INTO v_parent_ids, v_parent_users, v_deltas, v_root_users
+        FROM new_children;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT
+            array_agg(parent_id) FILTER (WHERE parent_id IS NOT NULL),
+            array_agg(user_token) FILTER (WHERE parent_id IS NOT NULL),
+            array_agg(-1) FILTER (WHERE parent_id IS NOT NULL),
+            array_agg(DISTINCT user_token) FILTER (WHERE parent_id IS NULL)
+        INTO v_parent_ids, v_parent_users, v_deltas, v_root_users
+        FROM old_children;
+    ELSE
+        -- A move leaves the old parent and enters the new one, a rename does both in place
+        SELECT
+            array_agg(m.parent_id) FILTER (WHERE m.parent_id IS NOT NULL),
+            array_agg(n.user_token) FILTER (WHERE m.parent_id IS NOT NULL),
+            array_agg(m.delta) FILTER (WHERE m.parent_id IS NOT NULL),
+            array_agg(DISTINCT n.user_token) FILTER (WHERE m.parent_id IS NULL)
+        INTO v_parent_ids, v_parent_users, v_deltas, v_root_users
+        FROM old_children o
+        JOIN new_children n ON n.id = o.id
+        CROSS JOIN LATERAL (VALUES (o.parent_id, -1), (n.parent_id, 1)) AS m(parent_id, delta)
+        WHERE o.parent_id IS DISTINCT FROM n.parent_id
+            OR o.name != n.name;
+    END IF;
+
+    -- Nothing changed, this also ends the recursion through the counter updates below
+    IF v_parent_ids IS NULL AND v_root_users IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF v_root_users IS NOT NULL THEN
+        INSERT INTO root_versions (user_token)
+        SELECT unnest(v_root_users)
+        ON CONFLICT (user_token) DO UPDATE
+        SET version = nextval('item_versions');
+    END IF;
+
+    -- Parents with a net change of 0 are updated as well, for their version
+    SELECT array_agg(parent_id), array_agg(user_token), array_agg(delta)
+    INTO v_parent_ids, v_parent_users, v_deltas
+    FROM (
+        SELECT parent_id, user_token, sum(delta)::INTEGER AS delta
+        FROM unnest(v_parent_ids, v_parent_users, v_deltas) AS u(parent_id, user_token, delta)
+        GROUP BY parent_id, user_token
+    ) c;
+
+    -- A single parent, as for most writes, is updated by its key (see Trigger plans)
+    IF cardinality(v_parent_ids) = 1 THEN
+        UPDATE directories d
+        SET dir_count = d.dir_count + CASE WHEN TG_TABLE_NAME = 'directories' THEN v_deltas[1] ELSE 0 END,
+            file_count = d.file_count + CASE WHEN TG_TABLE_NAME = 'files' THEN v_deltas[1] ELSE 0 END
+        WHERE d.id = v_parent_ids[1]
+            AND d.user_token = v_parent_users[1];
+    ELSIF v_parent_ids IS NOT NULL THEN
+        UPDATE directories d
+        SET dir_count = d.dir_count + CASE WHEN TG_TABLE_NAME = 'directories' THEN c.delta ELSE 0 END,
+            file_count = d.file_count + CASE WHEN TG_TABLE_NAME = 'files' THEN c.delta ELSE 0 END
+        FROM unnest(v_parent_ids, v_parent_users, v_deltas) AS c(parent_id, user_token, delta)
+        WHERE d.id = c.parent_id
+            AND d.user_token = c.user_token;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS insert_directories_count ON directories;
+CREATE TRIGGER insert_directories_count
+    AFTER INSERT ON directories
+    REFERENCING NEW TABLE AS new_children
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_count_children();
+
+DROP TRIGGER IF EXISTS update_directories_count ON directories;
+CREATE TRIGGER update_directories_count
+    AFTER UPDATE ON directories
+    REFERENCING OLD TABLE AS old_children NEW TABLE AS new_children
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_count_children();
+
+DROP TRIGGER IF EXISTS delete_directories_count ON directories;
+CREATE TRIGGER delete_directories_count
+    AFTER DELETE ON directories
+    REFERENCING OLD TABLE AS old_children
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_count_children();
+
+DROP TRIGGER IF EXISTS insert_files_count ON files;
+CREATE TRIGGER insert_files_count
+    AFTER INSERT ON files
+    REFERENCING NEW TABLE AS new_children
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_count_children();
+
+DROP TRIGGER IF EXISTS update_files_count ON files;
+CREATE TRIGGER update_files_count
+    AFTER UPDATE ON files
+    REFERENCING OLD TABLE AS old_children NEW TABLE AS new_children
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_count_children();
+
+DROP TRIGGER IF EXISTS delete_files_count ON files;
+CREATE TRIGGER delete_files_count
+    AFTER DELETE ON files
+    REFERENCING OLD TABLE AS old_children
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_count_children();
+
+
+-- Rollup triggers
+-- Creates, deletes and moves add their change to every ancestor in the materialized path,
+-- so the recursive totals of a directory (directory_rollups) are read instead of computed.
+-- Like the child counts, they run once per statement and update each ancestor once.
+
+-- The size a file contributes to the totals, 0 unless metadata.size is a number
+CREATE OR REPLACE FUNCTION file_metadata_size(p_metadata JSONB)
+RETURNS NUMERIC AS $$
+    SELECT CASE WHEN jsonb_typeof(p_metadata->'size') = 'number'
+        THEN (p_metadata->>'size')::NUMERIC
+        ELSE 0
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Add each change to the given parent directories (and their users) and all their ancestors.
+-- PL/pgSQL rather than SQL, which would plan the UPDATE over every directories partition again
+-- on each call, that is each write: PL/pgSQL keeps the plan for the session.
+DROP FUNCTION IF EXISTS directory_rollups_add(UUID[], BIGINT[], BIGINT[], NUMERIC[]);
+
+CREATE OR REPLACE FUNCTION directory_rollups_add(
+    p_parent_ids UUID[],
+    p_user_tokens TEXT[],
+    p_files BIGINT[],
+    p_dirs BIGINT[],
+    p_sizes NUMERIC[]
+)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE directory_rollups r
+    SET file_count = r.file_count + c.files,
+        dir_count = r.dir_count + c.dirs,
+        total_size = r.total_size + c.size
+    FROM (
+        SELECT a.id, sum(u.files) AS files, sum(u.dirs) AS dirs, sum(u.size) AS size
+        FROM (
+            SELECT parent_id, user_token, sum(files) AS files, sum(dirs) AS dirs, sum(size) AS size
+            FROM unnest(p_parent_ids, p_user_tokens, p_files, p_dirs, p_sizes)
+                AS u(parent_id, user_token, files, dirs, size)
+            GROUP BY parent_id, user_token
+        ) u
+        -- Each parent's path is looked up by its key (see Trigger plans). Parents deleted in
+        -- the same statement have none and are skipped, their ancestors were already updated
+        -- when the topmost deleted directory was subtracted
+        CROSS JOIN unnest((
+            SELECT p.path FROM directories p
+            WHERE p.id = u.parent_id AND p.user_token = u.user_token
+        )) AS a(id)
+        GROUP BY a.id
+    ) c
+    WHERE r.directory_id = c.id
+        AND (c.files != 0 OR c.dirs != 0 OR c.size != 0);
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION files_rollup()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_parent_ids UUID[];
+    v_users TEXT[];
+    v_files BIGINT[];
+    v_sizes NUMERIC[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(parent_id), array_agg(user_token), array_agg(1), array_agg(file_metadata_size(metadata))
+        INTO v_parent_ids, v_users, v_files, v_sizes
+        FROM new_files
+        WHERE parent_id IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(parent_id), array_agg(user_token), array_agg(-1), array_agg(-file_metadata_size(metadata))
+        INTO v_parent_ids, v_users, v_files, v_sizes
+        FROM old_files
+        WHERE parent_id IS NOT NULL;
+    ELSE
+        -- A move or size change leaves the old parent and enters the new one
+        SELECT array_agg(c.parent_id), array_agg(n.user_token), array_agg(c.files), array_agg(c.size)
+        INTO v_parent_ids, v_users, v_files, v_sizes
+        FROM old_files o
+        JOIN new_files n ON n.id = o.id
+        CROSS JOIN LATERAL (VALUES
+            (o.parent_id, -1, -file_metadata_size(o.metadata)),
+            (n.parent_id, 1, file_metadata_size(n.metadata))
+        ) AS c(parent_id, files, size)
+        WHERE (o.parent_id IS DISTINCT FROM n.parent_id
+                OR file_metadata_size(o.metadata) != file_metadata_size(n.metadata))
+            AND c.parent_id IS NOT NULL;
+    END IF;
+
+    IF v_parent_ids IS NOT NULL THEN
+        PERFORM directory_rollups_add(
+            v_parent_ids,
+            v_users,
+            v_files,
+            array_fill(0::BIGINT, ARRAY[cardinality(v_parent_ids)]),
+            v_sizes
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION directories_rollup()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_parent_ids UUID[];
+    v_users TEXT[];
+    v_files BIGINT[];
+    v_dirs BIGINT[];
+    v_sizes NUMERIC[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO directory_rollups (directory_id)
+        SELECT id FROM new_dirs
+        ON CONFLICT (directory_id) DO NOTHING;
+
+        SELECT array_agg(parent_id), array_agg(user_token), array_agg(0), array_agg(1), array_agg(0)
+        INTO v_parent_ids, v_users, v_files, v_dirs, v_sizes
+        FROM new_dirs
+        WHERE parent_id IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        -- A deleted directory takes its whole subtree with it
+        SELECT array_agg(o.parent_id), array_agg(o.user_token), array_agg(-r.file_count), array_agg(-r.dir_count - 1),
+            array_agg(-r.total_size)
+        INTO v_parent_ids, v_users, v_files, v_dirs, v_sizes
+        FROM old_dirs o
+        JOIN directory_rollups r ON r.directory_id = o.id
+        WHERE o.parent_id IS NOT NULL;
+    ELSE
+        -- A moved directory takes its whole subtree from the old parent to the new one
+        SELECT array_agg(c.parent_id), array_agg(n.user_token), array_agg(c.sign * r.file_count),
+            array_agg(c.sign * (r.dir_count + 1)), array_agg(c.sign * r.total_size)
+        INTO v_parent_ids, v_users, v_files, v_dirs, v_sizes
+        FROM old_dirs o
+        JOIN new_dirs n ON n.id = o.id
+        JOIN directory_rollups r ON r.directory_id = o.id
+        CROSS JOIN LATERAL (VALUES (o.parent_id, -1), (n.parent_id, 1)) AS c(parent_id, sign)
+        WHERE o.parent_id IS DISTINCT FROM n.parent_id
+            AND c.parent_id IS NOT NULL;
+    END IF;
+
+    IF v_parent_ids IS NOT NULL THEN
+        PERFORM directory_rollups_add(v_parent_ids, v_users, v_files, v_dirs, v_sizes);
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM directory_rollups
+        WHERE directory_id IN (SELECT id FROM old_dirs);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS insert_directories_rollup ON directories;
+CREATE TRIGGER insert_directories_rollup
+    AFTER INSERT ON directories
+    REFERENCING NEW TABLE AS new_dirs
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_rollup();
+
+DROP TRIGGER IF EXISTS update_directories_rollup ON directories;
+CREATE TRIGGER update_directories_rollup
+    AFTER UPDATE ON directories
+    REFERENCING OLD TABLE AS old_dirs NEW TABLE AS new_dirs
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_rollup();
+
+DROP TRIGGER IF EXISTS delete_directories_rollup ON directories;
+CREATE TRIGGER delete_directories_rollup
+    AFTER DELETE ON directories
+    REFERENCING OLD TABLE AS old_dirs
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION directories_rollup();
+
+DROP TRIGGER IF EXISTS insert_files_rollup ON files;
+CREATE TRIGGER insert_files_rollup
+    AFTER INSERT ON files
+    REFERENCING NEW TABLE AS new_files
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION files_rollup();
+
+DROP TRIGGER IF EXISTS update_files_rollup ON files;
+CREATE TRIGGER update_files_rollup
+    AFTER UPDATE ON files
+    REFERENCING OLD TABLE AS old_files NEW TABLE AS new_files
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION files_rollup();
+
+DROP TRIGGER IF EXISTS delete_files_rollup ON files;
+CREATE TRIGGER delete_files_rollup
+    AFTER DELETE ON files
+    REFERENCING OLD TABLE AS old_files
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION files_rollup();
+
+
+-- Tag ID triggers
+-- files.tag_ids mirrors file_tags so that "has all these tags" is one containment test
+-- (tag_ids @> ARRAY[...]) on idx_files_tag_ids instead of a join and count per file.
+-- The triggers run once per statement, so bulk tagging and copies refresh each file once.
+CREATE OR REPLACE FUNCTION files_refresh_tag_ids()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Deleting a file cascades an empty delete to file_tags, skip the files partitions then
+    IF NOT EXISTS (SELECT 1 FROM changed_file_tags) THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE files f
+    SET tag_ids = ARRAY(
+        SELECT ft.tag_id
+        FROM file_tags ft
+        WHERE ft.file_id = f.id
+            AND ft.user_token = f.user_token
+        ORDER BY ft.tag_id
+    )
+    WHERE (f.id, f.user_token) IN (SELECT file_id, user_token FROM changed_file_tags);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS insert_file_tags_tag_ids ON file_tags;
+CREATE TRIGGER insert_file_tags_tag_ids
+    AFTER INSERT ON file_tags
+    REFERENCING NEW TABLE AS changed_file_tags
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION files_refresh_tag_ids();
+
+DROP TRIGGER IF EXISTS delete_file_tags_tag_ids ON file_tags;
+CREATE TRIGGER delete_file_tags_tag_ids
+    AFTER DELETE ON file_tags
+    REFERENCING OLD TABLE AS changed_file_tags
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION files_refresh_tag_ids();
+
+-- The IDs of the named tags of a user, for tag_ids @> filters, NULL (matching nothing) when any
+-- of them does not exist. A STABLE function rather than a subquery: the planner evaluates it
+-- when planning with known arguments and estimates the filter from the tag_ids statistics,
+-- where a subquery's result is a blind guess.
+CREATE OR REPLACE FUNCTION tags_resolve_ids(p_tag_names TEXT[], p_user_token TEXT)
+RETURNS INTEGER[] AS $$
+    SELECT CASE WHEN count(*) = cardinality(ARRAY(SELECT DISTINCT unnest(p_tag_names)))
+        THEN array_agg(t.id) END
+    FROM tags t
+    WHERE t.user_token = p_user_token
+        AND t.name = ANY(p_tag_names);
+$$ LANGUAGE sql STABLE;
+
+
+-- Change feed triggers
+-- Takes the lock numbering a user's events, kept until the transaction ends (see
+-- change_events_record). Writers take it before locking any row: taken after, by the
+-- events trigger, a transaction running several statements could wait for it while
+-- holding rows that the transaction holding it then needs, and deadlock. The writing
+-- functions take it first thing, as should any other transaction writing directly.
+-- The writes of a user are serialized by it: a long transaction, such as an import, holds
+-- the user's other writers until it commits (see bench_writes.py --scenario import), while
+-- other users' writers are not held. Anonymous clients all write as the 'public' user.
+CREATE OR REPLACE FUNCTION change_events_lock(p_user_token TEXT)
+RETURNS VOID AS $$
+    SELECT pg_advisory_xact_lock(hashtextextended('change_events:' || p_user_token, 0));
+$$ LANGUAGE sql;
+
+-- Record every create, update, move and delete of a directory or file in change_events and
+-- notify the change_events channel with the user token, which is delivered on commit. Tag
+-- changes are recorded as updates of their files through the files.tag_ids refresh.
+-- The contents of a deleted directory go with it: their cascaded deletes, whose parent is
+-- already gone, are not recorded. Only name and parent changes are recorded for directories,
+-- not the maintenance of their counters and paths.
+CREATE OR REPLACE FUNCTION change_events_record()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids UUID[];
+    v_ops TEXT[];
+    v_names TEXT[];
+    v_parent_ids UUID[];
+    v_previous_parent_ids UUID[];
+    v_user_tokens TEXT[];
+    v_user TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(id), array_agg('created'::TEXT), array_agg(name), array_agg(parent_id),
+            array_agg(NULL::UUID), array_agg(user_token)
+        INTO v_ids, v_ops, v_names, v_parent_ids, v_previous_parent_ids, v_user_tokens
+        FROM new_items;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(o.id), array_agg('deleted'::TEXT), array_agg(o.name), array_agg(o.parent_id),
+            array_agg(NULL::UUID), array_agg(o.user_token)
+        INTO v_ids, v_ops, v_names, v_parent_ids, v_previous_parent_ids, v_user_tokens
+        FROM old_items o
+        WHERE o.parent_id IS NULL
+            OR EXISTS (SELECT 1 FROM directories d WHERE d.id = o.parent_id AND d.user_token = o.user_token);
+    ELSIF TG_TABLE_NAME = 'directories' THEN
+        SELECT array_agg(n.id), array_agg(CASE WHEN m.moved THEN 'moved' ELSE 'updated' END), array_agg(n.name),
+            array_agg(n.parent_id), array_agg(CASE WHEN m.moved THEN o.parent_id END), array_agg(n.user_token)
+        INTO v_ids, v_ops, v_names, v_parent_ids, v_previous_parent_ids, v_user_tokens
+        FROM old_items o
+        JOIN new_items n ON n.id = o.id
+        CROSS JOIN LATERAL (SELECT o.parent_id IS DISTINCT FROM n.parent_id) AS m(moved)
+        WHERE m.moved
+            OR o.name != n.name;
+    ELSE
+        SELECT array_agg(n.id), array_agg(CASE WHEN m.moved THEN 'moved' ELSE 'updated' END), array_agg(n.name),
+            array_agg(n.parent_id), array_agg(CASE WHEN m.moved THEN o.parent_id END), array_agg(n.user_token)
+        INTO v_ids, v_ops, v_names, v_parent_ids, v_previous_parent_ids, v_user_tokens
+        FROM old_items o
+        JOIN new_items n ON n.id = o.id
+        CROSS JOIN LATERAL (SELECT o.parent_id IS DISTINCT FROM n.parent_id) AS m(moved)
+        WHERE (o.name, o.parent_id, o.storage_id, o.metadata, o.tag_ids)
+            IS DISTINCT FROM (n.name, n.parent_id, n.storage_id, n.metadata, n.tag_ids);
+    END IF;
+
+    -- Nothing changed, e.g. counter updates
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- A user's events are numbered while holding a lock kept until the transaction ends, so
+    -- they are numbered in commit order: once a reader sees an event, it also sees every
+    -- earlier event of the user, and a feed can resume from the last event it read.
+    -- Writers already hold it (see change_events_lock), this only covers direct writes.
+    FOR v_user IN SELECT DISTINCT u FROM unnest(v_user_tokens) AS u ORDER BY u LOOP
+        PERFORM change_events_lock(v_user);
+        PERFORM pg_notify('change_events', v_user);
+    END LOOP;
+
+    INSERT INTO change_events (user_token, op, item_type, item_id, name, parent_id, ancestors,
+        previous_parent_id, previous_ancestors)
+    SELECT
+        c.user_token,
+        c.op,
+        CASE WHEN TG_TABLE_NAME = 'directories' THEN 'directory' ELSE 'file' END,
+        c.id,
+        c.name,
+        c.parent_id,
+        -- Looked up by key (see Trigger plans), like the previous parent's
+        COALESCE((
+            SELECT p.path FROM directories p
+            WHERE p.id = c.parent_id AND p.user_token = c.user_token
+        ), '{}'),
+        c.previous_parent_id,
+        -- Looked up for moves only: the NULL previous parents of large inserts would
+        -- otherwise be looked up too
+        CASE WHEN c.op = 'moved' THEN COALESCE((
+            SELECT q.path FROM directories q
+            WHERE q.id = c.previous_parent_id AND q.user_token = c.user_token
+        ), '{}') END
+    FROM unnest(v_user_tokens, v_ops, v_ids, v_names, v_parent_ids, v_previous_parent_ids)
+        WITH ORDINALITY AS c(user_token, op, id, name, parent_id, previous_parent_id, ordinality)
+    ORDER BY c.ordinality;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS insert_directories_events ON directories;
+CREATE TRIGGER insert_directories_events
+    AFTER INSERT ON directories
+    REFERENCING NEW TABLE AS new_items
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION change_events_record();
+
+DROP TRIGGER IF EXISTS update_directories_events ON directories;
+CREATE TRIGGER update_directories_events
+    AFTER UPDATE ON directories
+    REFERENCING OLD TABLE AS old_items NEW TABLE AS new_items
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION change_events_record();
+
+DROP TRIGGER IF EXISTS delete_directories_events ON directories;
+CREATE TRIGGER delete_directories_events
+    AFTER DELETE ON directories
+    REFERENCING OLD TABLE AS old_items
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION change_events_record();
+
+DROP TRIGGER IF EXISTS insert_files_events ON files;
+CREATE TRIGGER insert_files_events
+    AFTER INSERT ON files
+    REFERENCING NEW TABLE AS new_items
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION change_events_record();
+
+DROP TRIGGER IF EXISTS update_files_events ON files;
+CREATE TRIGGER update_files_events
+    AFTER UPDATE ON files
+    REFERENCING OLD TABLE AS old_items NEW TABLE AS new_items
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION change_events_record();
+
+DROP TRIGGER IF EXISTS delete_files_events ON files;
+CREATE TRIGGER delete_files_events
+    AFTER DELETE ON files
+    REFERENCING OLD TABLE AS old_items
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION change_events_record();
+
+
+-- Trigger plans
+-- The trigger functions join the partitioned tables on the user tokens of their transition
+-- tables, so planning with the values at hand prunes no partition. Once the tables have been
+-- analyzed, the plan cache can still prefer such custom plans and plan every partition again
+-- on each write, which cost more than the write itself. Keep the generic plans, pruned as they run.
+-- A generic plan costs a join as if it read every partition, though, so for the few rows of a
+-- write it scanned the directories of every user instead: the parents and their paths are looked
+-- up by key, which reads the user's partition only.
+ALTER FUNCTION directories_count_children() SET plan_cache_mode = force_generic_plan;
+ALTER FUNCTION directory_rollups_add(UUID[], TEXT[], BIGINT[], BIGINT[], NUMERIC[]) SET plan_cache_mode = force_generic_plan;
+ALTER FUNCTION files_rollup() SET plan_cache_mode = force_generic_plan;
+ALTER FUNCTION directories_rollup() SET plan_cache_mode = force_generic_plan;
+ALTER FUNCTION files_refresh_tag_ids() SET plan_cache_mode = force_generic_plan;
+ALTER FUNCTION change_events_record() SET plan_cache_mode = force_generic_plan;
+
+
 -- Indexes
 CREATE INDEX IF NOT EXISTS idx_file_tags_tag_id ON file_tags(tag_id);
 CREATE INDEX IF NOT EXISTS idx_file_tags_file_id ON file_tags(file_id);
 
 CREATE INDEX IF NOT EXISTS idx_file_metadata ON files USING GIN (metadata);
 
+-- For tag-filtered searches (tag_ids @> ARRAY[...]) within a user's files. GIN intersects the
+-- posting lists of the requested tags, so the rarest tag bounds the work.
+CREATE INDEX IF NOT EXISTS idx_files_tag_ids ON files USING GIN (user_token, tag_ids);
+
 -- For faster directory tree traversal
 CREATE INDEX IF NOT EXISTS idx_directories_parent_id ON directories(parent_id);
 
+-- For subtree (path @> ARRAY[id]) and ancestry lookups
+CREATE INDEX IF NOT EXISTS idx_directories_path ON directories USING GIN (path);
+
+-- For keyset-paginated directory listings ordered by (name, id), served by index-only scans
+CREATE INDEX IF NOT EXISTS idx_directories_listing ON directories(user_token, parent_id, name, id) INCLUDE (created_at);
+CREATE INDEX IF NOT EXISTS idx_files_listing ON files(user_token, parent_id, name, id) INCLUDE (created_at);
+
 -- For user-specific queries (if you frequently filter by user)
 CREATE INDEX IF NOT EXISTS idx_directories_user_token ON directories(user_token);
 CREATE INDEX IF NOT EXISTS idx_files_user_token ON files(user_token);
 
--- For name searches (if you do partial name matches)
-CREATE INDEX IF NOT EXISTS idx_directories_name ON directories(name);
-CREATE INDEX IF NOT EXISTS idx_files_name ON files(name);
+-- For substring name searches (name ILIKE '%q%') within a user's items. A btree on name
+-- cannot serve a leading wildcard, trigrams can, and user_token narrows the match in the index.
+CREATE INDEX IF NOT EXISTS idx_directories_name_trgm ON directories USING GIN (user_token, name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_files_name_trgm ON files USING GIN (user_token, name gin_trgm_ops);
+
+-- For ranked full-text searches (search_vector @@ query) within a user's items. The user's
+-- partition already narrows the search: a user_token key would match every row of the user,
+-- which made the planner scan the partition instead.
+CREATE INDEX IF NOT EXISTS idx_directories_search_vector ON directories USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_files_search_vector ON files USING GIN (search_vector);
+
+-- For reading a user's events after a position, in order
+CREATE INDEX IF NOT EXISTS idx_change_events_user_seq ON change_events(user_token, seq);
+
+-- For pruning old events. Events are appended in time order, so a BRIN index stays tiny and
+-- costs appends next to nothing.
+CREATE INDEX IF NOT EXISTS idx_change_events_created_at ON change_events USING BRIN (created_at);
@@ -0,0 +1,78 @@
+/*
+ * Migration: partition_by_user_token
+ *
+ * Moves the directories, files, tags and file_tags of a database created before these tables
+ * were hash-partitioned by user_token into the partitioned tables of init.sql.
+ *
+ * Usage (psql, as the database owner, with the API stopped):
+ *   psql -v ON_ERROR_STOP=1 -f db/sql/migrations/partition_by_user_token.sql
+ *   then load every db/sql/functions/*.sql file again, as db/init.sh does
+ *
+ * Steps:
+ *   - The old tables are moved to the unpartitioned schema, with their indexes, constraints,
+ *     triggers and sequences, so that init.sql creates the partitioned tables under their names
+ *   - Rows are copied as they are, derived columns (paths, counts, versions, tag_ids) included,
+ *     with triggers disabled (session_replication_role), so the copy records no change events
+ *     and leaves the counters, rollups and versions untouched. This needs a superuser.
+ *   - file_tags rows take the user_token of their file
+ *   - The old tables are dropped, with the functions taking their row types (directory_json,
+ *     file_json), hence loading the functions again afterwards
+ *
+ * Notes:
+ *   - Runs in one transaction, a failure leaves the database as it was
+ *   - Fails if a user has two items with the same name at the root level, which the unique
+ *     constraints now reject: rename them first
+ *   - The number of partitions is the vfs.partitions setting, e.g.
+ *     PGOPTIONS='-c vfs.partitions=64' psql -f ...
+ */
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'directories'::regclass) = 'p' THEN
+        RAISE EXCEPTION 'The tables are already partitioned';
+    END IF;
+END $$;
+
+CREATE SCHEMA unpartitioned;
+ALTER TABLE file_tags SET SCHEMA unpartitioned;
+ALTER TABLE tags SET SCHEMA unpartitioned;
+ALTER TABLE files SET SCHEMA unpartitioned;
+ALTER TABLE directories SET SCHEMA unpartitioned;
+
+\ir ../init.sql
+
+SET LOCAL session_replication_role = replica;
+
+INSERT INTO directories (id, name, user_token, parent_id, path, dir_count, file_count, version,
+    created_at, updated_at)
+SELECT id, name, user_token, parent_id, path, dir_count, file_count, version, created_at, updated_at
+FROM unpartitioned.directories;
+
+INSERT INTO files (id, name, user_token, parent_id, storage_id, metadata, tag_ids, version,
+    created_at, updated_at)
+SELECT id, name, user_token, parent_id, storage_id, metadata, tag_ids, version, created_at, updated_at
+FROM unpartitioned.files;
+
+INSERT INTO tags (id, name, user_token, created_at)
+SELECT id, name, user_token, created_at
+FROM unpartitioned.tags;
+
+INSERT INTO file_tags (file_id, tag_id, user_token, created_at)
+SELECT ft.file_id, ft.tag_id, f.user_token, ft.created_at
+FROM unpartitioned.file_tags ft
+JOIN unpartitioned.files f ON f.id = ft.file_id;
+
+-- New tags continue after the copied ones
+SELECT setval(pg_get_serial_sequence('tags', 'id'), COALESCE(max(id), 0) + 1, false)
+FROM tags;
+
+DROP SCHEMA unpartitioned CASCADE;
+
+COMMIT;
+
+ANALYZE directories;
+ANALYZE files;
+ANALYZE tags;
+ANALYZE file_tags;
@@ -139,10 +139,11 @@ files_insert AS (
     RETURNING id, name
 )
 -- Create file-tag associations
-INSERT INTO file_tags (file_id, tag_id)
+INSERT INTO file_tags (file_id, tag_id, user_token)
 SELECT
     f.id,
-    t.id
+    t.id,
+    user1
 FROM files_insert f
 CROSS JOIN tags_insert t
 WHERE
@@ -187,10 +188,11 @@ files_insert AS (
     RETURNING id, name
 )
 -- Create file-tag associations for user2
-INSERT INTO file_tags (file_id, tag_id)
+INSERT INTO file_tags (file_id, tag_id, user_token)
 SELECT
     f.id,
-    t.id
+    t.id,
+    user2
 FROM files_insert f
 CROSS JOIN tags_insert t
 WHERE t.name = 'music';
@@ -0,0 +1,97 @@
+import pytest
+import os
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+import psycopg
+
+# Load environment variables from .env file
+load_dotenv()
+
+# These tests run concurrent transactions, so they connect to the database directly
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'dbname': os.getenv('DB_NAME', 'prism_vfs'),
+    'user': os.getenv('DB_USER', 'prism_user'),
+    'password': os.getenv('DB_PASSWORD', 'prism_password'),
+}
+
+# Seconds a transaction is given to start waiting on the other one
+WAIT_TIMEOUT = 10
+
+def connect():
+    try:
+        return psycopg.connect(**DB_CONFIG, connect_timeout=5)
+    except psycopg.OperationalError as e:
+        pytest.skip(f"Database not reachable: {e}")
+
+# Two committed files in a directory of a user of their own, removed afterwards
+@pytest.fixture
+def user_files():
+    user_token = f"events_test_{uuid.uuid4().hex[:8]}"
+    with connect() as connection:
+        parent_id = connection.execute(
+            "SELECT directory_create('events_test', NULL, %s)", (user_token,)
+        ).fetchone()[0]["id"]
+        ids = [
+            connection.execute(
+                "SELECT file_create(%s, %s, %s, %s)", (name, parent_id, user_token, f"store_{name}")
+            ).fetchone()[0]["id"]
+            for name in ("a.txt", "b.txt")
+        ]
+        connection.commit()
+        yield user_token, ids
+        connection.execute("DELETE FROM directories WHERE user_token = %s", (user_token,))
+        for table in ("root_versions", "change_events"):
+            connection.execute(f"DELETE FROM {table} WHERE user_token = %s", (user_token,))
+
+def wait_until_blocked(connection, pid):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        waiting = connection.execute(
+            "SELECT wait_event_type = 'Lock' FROM pg_stat_activity WHERE pid = %s", (pid,)
+        ).fetchone()[0]
+        if waiting:
+            return
+        time.sleep(0.05)
+    pytest.fail("The second transaction never waited on the first")
+
+# Test two transactions updating the same files in opposite orders, one statement at a time,
+# wait on each other instead of deadlocking: the second one waits for the change events lock
+# before locking its file, so the first one can still update that file
+def test_concurrent_writers_do_not_deadlock(user_files):
+    user_token, (file_a, file_b) = user_files
+    first, second, observer = connect(), connect(), connect()
+    errors = []
+
+    def update_b():
+        try:
+            second.execute("SELECT file_update(%s, 'b2.txt', p_user_token => %s)", (file_b, user_token))
+            second.execute("SELECT file_update(%s, 'a3.txt', p_user_token => %s)", (file_a, user_token))
+            second.commit()
+        except psycopg.Error as e:
+            errors.append(e)
+            second.rollback()
+
+    with first, second, observer:
+        observer.autocommit = True
+        first.execute("SELECT file_update(%s, 'a2.txt', p_user_token => %s)", (file_a, user_token))
+        thread = threading.Thread(target=update_b)
+        thread.start()
+        wait_until_blocked(observer, second.info.backend_pid)
+        first.execute("SELECT file_update(%s, 'b3.txt', p_user_token => %s)", (file_b, user_token))
+        first.commit()
+        thread.join(WAIT_TIMEOUT)
+
+        assert not errors
+        names = observer.execute(
+            "SELECT name FROM files WHERE user_token = %s ORDER BY name", (user_token,)
+        ).fetchall()
+        assert [name for (name,) in names] == ["a3.txt", "b2.txt"]
+        # Both transactions' events were numbered in commit order
+        ops = observer.execute(
+            "SELECT count(*) FROM change_events WHERE user_token = %s AND op = 'updated'", (user_token,)
+        ).fetchone()[0]
+        assert ops == 4
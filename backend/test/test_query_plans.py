@@ -0,0 +1,282 @@
+import pytest
+import json
+import os
+import uuid
+from dotenv import load_dotenv
+import psycopg
+from psycopg import sql
+
+# Load environment variables from .env file
+load_dotenv()
+
+# These tests inspect query plans, so they connect to the database directly
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'dbname': os.getenv('DB_NAME', 'prism_vfs'),
+    'user': os.getenv('DB_USER', 'prism_user'),
+    'password': os.getenv('DB_PASSWORD', 'prism_password'),
+}
+
+# Items created for the test user, enough for a scan of all of them to cost more than an index
+PLAN_TEST_ITEMS = 20000
+
+# Every test runs in a transaction that is rolled back, so the data it creates never persists
+@pytest.fixture
+def connection():
+    try:
+        connection = psycopg.connect(**DB_CONFIG, connect_timeout=5)
+    except psycopg.OperationalError as e:
+        pytest.skip(f"Database not reachable: {e}")
+    with connection:
+        yield connection
+        connection.rollback()
+
+@pytest.fixture
+def large_user(connection):
+    user_token = f"plan_test_{uuid.uuid4().hex[:8]}"
+    connection.execute(
+        """
+        INSERT INTO directories (name, user_token)
+        SELECT 'dir_' || i, %(user_token)s FROM generate_series(1, %(n)s) i
+        """,
+        {"user_token": user_token, "n": PLAN_TEST_ITEMS}
+    )
+    connection.execute(
+        """
+        INSERT INTO files (name, user_token)
+        SELECT 'file_' || i || '.txt', %(user_token)s FROM generate_series(1, %(n)s) i
+        """,
+        {"user_token": user_token, "n": PLAN_TEST_ITEMS}
+    )
+    connection.execute("ANALYZE directories (user_token, name, search_vector)")
+    connection.execute("ANALYZE files (user_token, name, search_vector)")
+    # Rows inserted at once wait in the pending list of GIN indexes, which the planner costs
+    # as a scan, until vacuumed: merge them into the indexes, as vacuum would
+    connection.execute(
+        """
+        SELECT gin_clean_pending_list(i.indexrelid::regclass)
+        FROM pg_inherits p
+        JOIN pg_index i ON i.indrelid = p.inhrelid
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am a ON a.oid = c.relam
+        WHERE p.inhparent IN ('directories'::regclass, 'files'::regclass) AND a.amname = 'gin'
+        """
+    )
+    return user_token
+
+def plan_nodes(connection, query, params=None):
+    """Return every node of the query's plan.
+
+    Tables are partitioned by user_token, so plans scan partitions and their indexes. Nodes
+    name the partitioned table and index instead, the partition is kept as "Partition Name".
+    """
+    plan = connection.execute(f"EXPLAIN (FORMAT JSON) {query}", params).fetchone()[0][0]["Plan"]
+    return flatten_plan(connection, plan)
+
+def flatten_plan(connection, plan):
+    parents = dict(connection.execute(
+        "SELECT inhrelid::regclass::text, inhparent::regclass::text FROM pg_inherits"
+    ).fetchall())
+    nodes = [plan]
+    for node in nodes:
+        nodes.extend(node.get("Plans", []))
+        if node.get("Relation Name") in parents:
+            node["Partition Name"] = node["Relation Name"]
+            node["Relation Name"] = parents[node["Relation Name"]]
+        if node.get("Index Name") in parents:
+            node["Index Name"] = parents[node["Index Name"]]
+    return nodes
+
+def nested_plan_nodes(connection, query, params=None):
+    """Return every node of the plans of the statements the query runs, in functions too,
+    with their actual row counts.
+
+    EXPLAIN stops at PL/pgSQL functions, so the plans are the ones auto_explain reports as
+    notices. Skipped when auto_explain cannot be loaded, which takes a superuser.
+    """
+    try:
+        with connection.transaction():
+            connection.execute("LOAD 'auto_explain'")
+    except (psycopg.errors.InsufficientPrivilege, psycopg.errors.UndefinedFile) as e:
+        pytest.skip(f"auto_explain not available: {e}")
+    for setting, value in [
+        ("auto_explain.log_min_duration", "0"),
+        ("auto_explain.log_nested_statements", "on"),
+        ("auto_explain.log_analyze", "on"),
+        ("auto_explain.log_format", "json"),
+        ("auto_explain.log_level", "notice"),
+    ]:
+        connection.execute(f"SET LOCAL {setting} = {value}")
+    notices = []
+    def handler(diagnostic):
+        notices.append(diagnostic.message_primary)
+    connection.add_notice_handler(handler)
+    try:
+        connection.execute(query, params).fetchall()
+    finally:
+        connection.remove_notice_handler(handler)
+        connection.execute("SET LOCAL auto_explain.log_min_duration = -1")
+    return [
+        node
+        for notice in notices if "plan:\n" in notice
+        for node in flatten_plan(connection, json.loads(notice.split("plan:\n", 1)[1])["Plan"])
+    ]
+
+# Test a user's queries only read the partition holding the user's rows
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM files WHERE user_token = %s AND parent_id IS NULL",
+    "SELECT * FROM directory_search_rows('_1234', NULL, %s)",
+])
+def test_queries_read_one_partition(connection, large_user, query):
+    nodes = plan_nodes(connection, query, (large_user,))
+    scanned = {n["Partition Name"] for n in nodes if "Partition Name" in n}
+    assert len(scanned) == 1
+
+# Test the generic plan of a prepared query, as the API runs them, still prunes the
+# partitions of other users once the user_token is bound
+def test_prepared_queries_read_one_partition(connection, large_user):
+    connection.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+    connection.execute(
+        "PREPARE root_files (text) AS SELECT * FROM files WHERE user_token = $1 AND parent_id IS NULL"
+    )
+    # EXPLAIN takes no parameters, the user_token is bound client-side
+    execute = sql.SQL("EXECUTE root_files ({})").format(large_user).as_string(connection)
+    nodes = plan_nodes(connection, execute)
+    scanned = {n["Partition Name"] for n in nodes if "Partition Name" in n}
+    assert len(scanned) == 1
+
+# Test substring name searches use the trigram indexes instead of scanning the user's rows
+@pytest.mark.parametrize("query, index_name", [
+    ("SELECT * FROM file_search_rows(%s, NULL, NULL, NULL, %s)", "idx_files_name_trgm"),
+    ("SELECT * FROM directory_search_rows(%s, NULL, %s)", "idx_directories_name_trgm"),
+])
+def test_search_uses_trigram_index(connection, large_user, query, index_name):
+    nodes = plan_nodes(connection, query, ("_1234", large_user))
+    assert not [n for n in nodes if n["Node Type"] == "Seq Scan"]
+    assert index_name in [n.get("Index Name") for n in nodes]
+
+# Test ranked full-text searches match through the search_vector indexes
+@pytest.mark.parametrize("query, index_name", [
+    ("SELECT * FROM file_fulltext_rows(%s, NULL, NULL, NULL, %s)", "idx_files_search_vector"),
+    ("SELECT * FROM directory_fulltext_rows(%s, NULL, %s)", "idx_directories_search_vector"),
+])
+def test_fulltext_search_uses_search_vector_index(connection, large_user, query, index_name):
+    nodes = plan_nodes(connection, query, ("1234", large_user))
+    assert not [n for n in nodes if n["Node Type"] == "Seq Scan"]
+    assert index_name in [n.get("Index Name") for n in nodes]
+
+# Test a page after a cursor seeks to the cursor in the listing indexes, at the root level,
+# and reads the page from there rather than every item after it to sort them. The function keeps its
+# generic plan, where the cursor is only known as a parameter.
+def test_directory_list_page_seeks_to_cursor(connection, large_user):
+    after_name, after_id = connection.execute(
+        "SELECT name, id FROM files WHERE user_token = %s AND name = 'file_5000.txt'", (large_user,)
+    ).fetchone()
+    query = "SELECT name FROM directory_list_page(NULL, %s, 3, 'file', %s, %s)"
+    nodes = nested_plan_nodes(connection, query, (large_user, after_name, after_id))
+    scans = [n for n in nodes if n.get("Relation Name") in ("directories", "files")]
+    assert not [n for n in scans if n["Node Type"] == "Seq Scan"]
+    assert [
+        n for n in scans
+        if n["Relation Name"] == "files"
+            and "parent_id IS NULL" in n.get("Index Cond", "")
+            and "name" in n["Index Cond"].split("parent_id IS NULL", 1)[1]
+    ]
+    assert sum(n["Actual Rows"] * n["Actual Loops"] for n in scans) <= 10
+
+    rows = connection.execute(query, (large_user, after_name, after_id)).fetchall()
+    expected = connection.execute(
+        """
+        SELECT name FROM files
+        WHERE user_token = %s AND parent_id IS NULL AND (name, id) > (%s, %s)
+        ORDER BY name, id
+        LIMIT 3
+        """,
+        (large_user, after_name, after_id)
+    ).fetchall()
+    assert rows == expected
+
+# The large user's files tagged 'common', and 'rare' for file_1234.txt and file_12340.txt ...
+# file_12349.txt
+@pytest.fixture
+def tagged_user(connection, large_user):
+    connection.execute(
+        "INSERT INTO tags (name, user_token) VALUES ('common', %(u)s), ('rare', %(u)s)",
+        {"u": large_user}
+    )
+    connection.execute(
+        """
+        INSERT INTO file_tags (file_id, tag_id, user_token)
+        SELECT f.id, t.id, f.user_token
+        FROM files f
+        JOIN tags t ON t.user_token = f.user_token
+        WHERE f.user_token = %s
+            AND (t.name = 'common' OR f.name LIKE 'file\\_1234%%')
+        """,
+        (large_user,)
+    )
+    connection.execute("ANALYZE files (user_token, tag_ids)")
+    return large_user
+
+# Test tag-filtered searches intersect the tags in idx_files_tag_ids instead of joining file_tags
+def test_tag_search_uses_tag_ids_index(connection, tagged_user):
+    query = "SELECT * FROM file_search_rows(NULL, NULL, %s, NULL, %s)"
+    nodes = plan_nodes(connection, query, (["common", "rare"], tagged_user))
+    assert not [n for n in nodes if n["Node Type"] == "Seq Scan" and n.get("Relation Name") == "files"]
+    assert "idx_files_tag_ids" in [n.get("Index Name") for n in nodes]
+    assert not [n for n in nodes if n.get("Relation Name") == "file_tags"]
+
+    rows = connection.execute(query, (["common", "rare"], tagged_user)).fetchall()
+    assert len(rows) == 11
+
+# Test a name rarer than the requested tag is searched through the trigram index, and the tag
+# tested on the matching files, rather than every file with the tag being read
+def test_tag_search_with_rare_name_uses_trigram_index(connection, tagged_user):
+    query = "SELECT * FROM file_search_rows(%s, NULL, %s, NULL, %s)"
+    nodes = plan_nodes(connection, query, ("file_1234", ["common"], tagged_user))
+    index_names = [n.get("Index Name") for n in nodes]
+    assert "idx_files_name_trgm" in index_names
+    assert "idx_files_tag_ids" not in index_names
+
+    rows = connection.execute(query, ("file_1234", ["common"], tagged_user)).fetchall()
+    assert len(rows) == 11
+
+# Test a size-bounded tree only reads the directories it may load, not the whole subtree
+# within the depth
+def test_directory_tree_reads_within_max_nodes(connection):
+    user_token = f"plan_test_{uuid.uuid4().hex[:8]}"
+    start = connection.execute(
+        "INSERT INTO directories (name, user_token) VALUES ('start', %s) RETURNING id", (user_token,)
+    ).fetchone()[0]
+    connection.execute(
+        """
+        WITH children AS (
+            INSERT INTO directories (name, parent_id, user_token)
+            SELECT 'child_' || i, %(start)s, %(u)s FROM generate_series(1, 3) i
+            RETURNING id
+        )
+        INSERT INTO directories (name, parent_id, user_token)
+        SELECT 'grandchild_' || i, c.id, %(u)s FROM children c CROSS JOIN generate_series(1, 1000) i
+        """,
+        {"start": start, "u": user_token}
+    )
+    connection.execute("ANALYZE directories (user_token, parent_id)")
+
+    def directories_read():
+        return connection.execute(
+            """
+            SELECT sum(COALESCE(idx_tup_fetch, 0) + seq_tup_read)
+            FROM pg_stat_xact_user_tables
+            WHERE relid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'directories'::regclass)
+            """
+        ).fetchone()[0]
+
+    before = directories_read()
+    tree, truncated = connection.execute(
+        "SELECT tree::text, truncated FROM directory_tree(%s, %s, 3, 10)", (start, user_token)
+    ).fetchone()
+    # The children fit, none of their groups of 1000 does
+    assert truncated
+    assert tree.count('"type": "directory"') == 3
+    assert directories_read() - before < 100
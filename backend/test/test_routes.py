@@ -89,6 +89,63 @@ def test_health_check(client):
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
+# Readiness probe and startup timings
+def test_ready_check(client):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    ready = response.json()
+    assert ready["status"] == "ready"
+    assert 0 <= ready["serving_s"] <= ready["ready_s"]
+
+    startup = client.get("/stats").json()["startup"]
+    assert set(startup) == {"serving_s", "ready_s"}
+
+# Liveness does not depend on the database, readiness does: run in-process against a
+# database that refuses connections
+def test_probes_without_database(monkeypatch):
+    import vfs_api.db_utils as db_utils
+    from vfs_api.__main__ import build_parser, create_app
+
+    monkeypatch.setitem(db_utils.DB_CONFIG, 'host', '127.0.0.1')
+    monkeypatch.setitem(db_utils.DB_CONFIG, 'port', '1')
+    with TestClient(create_app(build_parser().parse_args([]))) as app_client:
+        response = app_client.get("/health")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+
+        response = app_client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["ready_s"] is None
+
+# Requests that get no connection fail with 503, whether the pool is waiting for the
+# database or closed
+def test_pool_unavailable(monkeypatch):
+    import vfs_api.db_utils as db_utils
+    from vfs_api.__main__ import build_parser, create_app
+
+    monkeypatch.setitem(db_utils.DB_CONFIG, 'host', '127.0.0.1')
+    monkeypatch.setitem(db_utils.DB_CONFIG, 'port', '1')
+    monkeypatch.setitem(db_utils.POOL_CONFIG, 'timeout', 0.5)
+    with TestClient(create_app(build_parser().parse_args([]))) as app_client:
+        response = app_client.get("/directories", params={"user_token": f"pool_test_{uuid.uuid4().hex[:8]}"})
+        assert response.status_code == 503
+
+        app_client.portal.call(db_utils.connection_pool.close)
+        response = app_client.get("/directories", params={"user_token": f"pool_test_{uuid.uuid4().hex[:8]}"})
+        assert response.status_code == 503
+        response = app_client.post("/files/", json={"filename": "a.txt", "parent_id": None})
+        assert response.status_code == 503
+
+# Test connection pool statistics
+def test_pool_stats(client, mock_public_user):
+    client.get("/directories", params={"user_token": mock_public_user})
+    response = client.get("/stats")
+    assert response.status_code == 200
+    pool = response.json()["pool"]
+    assert pool["requests"] >= 1
+    assert 0 <= pool["in_use"] <= pool["size"] <= pool["max_size"]
+    assert pool["idle"] == pool["size"] - pool["in_use"]
+
 # Test listing directories
 def test_list_directories(client, mock_public_user):
     response = client.get("/directories", params={"user_token": mock_public_user})
@@ -97,6 +154,166 @@ def test_list_directories(client, mock_public_user):
     assert "directories" in data
     assert "files" in data
 
+# Test the JSON built by the database has exactly the fields of the response models
+def test_response_fields(client, mock_public_user):
+    params = {"user_token": mock_public_user}
+    dir_id = client.post("/directories", params=params, json={"name": f"TestFieldsDir_{uuid.uuid4().hex[:8]}", "parent_id": None}).json()["id"]
+    client.post("/files/", params=params, json={"filename": "a.txt", "parent_id": dir_id})
+    client.post("/directories", params=params, json={"name": "sub", "parent_id": dir_id})
+
+    response = client.get("/directories", params={**params, "parent_id": dir_id})
+    assert response.headers["content-type"] == "application/json"
+    data = response.json()
+    assert set(data) == {"directories", "files", "next_cursor", "version"}
+    assert set(data["directories"][0]) == set(data["files"][0]) == {"id", "name", "created_at"}
+
+    tree = client.get("/directories/tree", params={**params, "parent_id": dir_id}).json()["items"]["tree"]
+    assert [(item["type"], item["has_children"]) for item in tree] == [("directory", False), ("file", None)]
+    assert tree[1]["children"] is None
+
+    files = client.post("/search", params=params, json={"query": "a.txt", "parent_id": dir_id}).json()["files"]
+    assert files[0]["rank"] is None and files[0]["metadata"] == {}
+
+# Test paging through a directory listing
+def test_list_directories_pagination(client, mock_public_user):
+    dir_response = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"TestPageDir_{uuid.uuid4().hex[:8]}", "parent_id": None}
+    )
+    assert dir_response.status_code == 200
+    dir_id = dir_response.json()["id"]
+
+    # Two subdirectories and three files, listed directories first
+    for name in ["sub_b", "sub_a"]:
+        client.post("/directories", params={"user_token": mock_public_user}, json={"name": name, "parent_id": dir_id})
+    for name in ["c.txt", "a.txt", "b.txt"]:
+        client.post("/files/", params={"user_token": mock_public_user}, json={"filename": name, "parent_id": dir_id})
+
+    names = []
+    params = {"parent_id": dir_id, "limit": 2, "user_token": mock_public_user}
+    while True:
+        response = client.get("/directories", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["directories"]) + len(data["files"]) <= 2
+        names += [d["name"] for d in data["directories"]] + [f["name"] for f in data["files"]]
+        if not data["next_cursor"]:
+            break
+        params["after"] = data["next_cursor"]
+    assert names == ["sub_a", "sub_b", "a.txt", "b.txt", "c.txt"]
+
+    response = client.get("/directories", params={"after": "not-a-cursor", "user_token": mock_public_user})
+    assert response.status_code == 400
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
+# Test cached listings and details are dropped by the writes that change them
+def test_listing_cache(client, mock_public_user):
+    def listing(parent_id):
+        response = client.get("/directories", params={"parent_id": parent_id, "user_token": mock_public_user})
+        return sorted(item["name"] for item in response.json()["directories"] + response.json()["files"])
+
+    def details(dir_id):
+        return client.get(f"/directories/{dir_id}", params={"user_token": mock_public_user})
+
+    dir_id = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"TestCacheDir_{uuid.uuid4().hex[:8]}", "parent_id": None}
+    ).json()["id"]
+    other_id = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": "other", "parent_id": dir_id}
+    ).json()["id"]
+
+    assert listing(dir_id) == ["other"]
+    hits = client.get("/stats").json()["cache"]["hits"]
+    assert listing(dir_id) == ["other"]
+    assert client.get("/stats").json()["cache"]["hits"] in (hits, hits + 1)  # hits + 1 unless disabled
+
+    # Creating, renaming and moving files
+    file_id = client.post(
+        "/files/",
+        params={"user_token": mock_public_user},
+        json={"filename": "a.txt", "parent_id": dir_id}
+    ).json()["id"]
+    assert listing(dir_id) == ["a.txt", "other"]
+    assert details(dir_id).json()["child_counts"]["files"] == 1
+    client.patch(f"/files/{file_id}", params={"user_token": mock_public_user}, json={"updates": {"name": "b.txt"}})
+    assert listing(dir_id) == ["b.txt", "other"]
+    assert listing(other_id) == []
+    client.patch(f"/files/{file_id}", params={"user_token": mock_public_user}, json={"updates": {"parent_id": other_id}})
+    assert listing(dir_id) == ["other"]
+    assert listing(other_id) == ["b.txt"]
+    assert details(other_id).json()["child_counts"]["files"] == 1
+    assert details(dir_id).json()["child_counts"]["files"] == 0
+
+    # Renaming a directory, and deleting it with its subtree
+    client.patch(f"/directories/{other_id}", params={"user_token": mock_public_user}, json={"updates": {"name": "renamed"}})
+    assert listing(dir_id) == ["renamed"]
+    assert details(other_id).json()["name"] == "renamed"
+    client.request("DELETE", f"/directories/{other_id}", params={"user_token": mock_public_user}, json={"recursive": True})
+    assert listing(dir_id) == []
+    assert details(other_id).status_code == 404
+    assert listing(other_id) == []
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
+# Test streaming a directory listing and a search as NDJSON
+def test_ndjson_streaming(client, mock_public_user):
+    dir_response = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"TestStreamDir_{uuid.uuid4().hex[:8]}", "parent_id": None}
+    )
+    assert dir_response.status_code == 200
+    dir_id = dir_response.json()["id"]
+    client.post("/directories", params={"user_token": mock_public_user}, json={"name": "sub", "parent_id": dir_id})
+    for name in ["stream_b.txt", "stream_a.txt"]:
+        client.post("/files/", params={"user_token": mock_public_user}, json={"filename": name, "parent_id": dir_id})
+
+    headers = {"Accept": "application/x-ndjson"}
+    response = client.get("/directories", params={"parent_id": dir_id, "user_token": mock_public_user}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert [(i["type"], i["name"]) for i in items] == [
+        ("directory", "sub"), ("file", "stream_a.txt"), ("file", "stream_b.txt")
+    ]
+
+    response = client.post(
+        "/search",
+        params={"user_token": mock_public_user},
+        json={"query": "stream_", "type": "file", "parent_id": dir_id},
+        headers=headers
+    )
+    assert response.status_code == 200
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert [i["name"] for i in items] == ["stream_a.txt", "stream_b.txt"]
+    assert all(i["type"] == "file" and "storage_id" in i for i in items)
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
 # Test creating a directory
 def test_create_directory(client, mock_public_user):
     # Create a unique directory name to avoid conflicts
@@ -110,6 +327,35 @@ def test_create_directory(client, mock_public_user):
     data = response.json()
     assert data["name"] == dir_name
 
+    # Names are unique at the root level too
+    response = client.post("/directories", params={"user_token": mock_public_user}, json=test_dir)
+    assert response.status_code == 409
+    response = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": dir_name, "parent_id": str(uuid.uuid4())}
+    )
+    assert response.status_code == 404
+
+    # Renaming onto a sibling's name conflicts as well
+    other = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"{dir_name}_other", "parent_id": None}
+    ).json()
+    response = client.patch(
+        f"/directories/{other['id']}",
+        params={"user_token": mock_public_user},
+        json={"updates": {"name": dir_name}}
+    )
+    assert response.status_code == 409
+    client.request(
+        "DELETE",
+        f"/directories/{other['id']}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
     # Cleanup - delete the created directory
     dir_id = data["id"]
     delete_response = client.request(
@@ -156,6 +402,201 @@ def test_create_and_delete_file(client, mock_public_user):
         json={"recursive": True}
     )
 
+# Test updating a file's properties and tags together
+def test_update_file(client, mock_public_user):
+    dir_response = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"TestUpdateFileDir_{uuid.uuid4().hex[:8]}", "parent_id": None}
+    )
+    dir_id = dir_response.json()["id"]
+    file_ids = [
+        client.post("/files/", params={"user_token": mock_public_user}, json={"filename": name, "parent_id": dir_id}).json()["id"]
+        for name in ["a.txt", "b.txt"]
+    ]
+
+    response = client.patch(
+        f"/files/{file_ids[0]}",
+        params={"user_token": mock_public_user},
+        json={"updates": {"name": "c.txt", "metadata": {"size": 1}, "tags": ["red", "blue"]}}
+    )
+    assert response.status_code == 200
+    assert response.json()["name"] == "c.txt"
+    assert response.json()["metadata"] == {"size": 1}
+    assert response.json()["tags"]["names"] == ["blue", "red"]
+
+    # Fields left out are kept
+    response = client.patch(
+        f"/files/{file_ids[0]}",
+        params={"user_token": mock_public_user},
+        json={"updates": {"tags": ["red", "green"]}}
+    )
+    assert response.json()["name"] == "c.txt"
+    assert response.json()["metadata"] == {"size": 1}
+    assert response.json()["tags"]["names"] == ["green", "red"]
+
+    # A name conflict leaves the tags untouched
+    response = client.patch(
+        f"/files/{file_ids[0]}",
+        params={"user_token": mock_public_user},
+        json={"updates": {"name": "b.txt", "tags": []}}
+    )
+    assert response.status_code == 409
+    response = client.get(f"/files/{file_ids[0]}", params={"user_token": mock_public_user})
+    assert response.json()["tags"]["names"] == ["green", "red"]
+
+    response = client.patch(
+        f"/files/{uuid.uuid4()}",
+        params={"user_token": mock_public_user},
+        json={"updates": {"tags": ["red"]}}
+    )
+    assert response.status_code == 404
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
+# Test the change feed of a subtree, and resuming it
+def test_event_stream(client, mock_public_user):
+    params = {"user_token": mock_public_user}
+
+    def read_events(count, **extra):
+        events = []
+        with client.stream("GET", "/events", params={**params, **extra.get("params", {})},
+                           headers=extra.get("headers"), timeout=30) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            event_id = None
+            for line in response.iter_lines():
+                if line.startswith("id: "):
+                    event_id = int(line[4:])
+                elif line.startswith("data: "):
+                    event = json.loads(line[6:])
+                    assert event["seq"] == event_id
+                    events.append(event)
+                    if len(events) == count:
+                        return events
+
+    dir_id = client.post("/directories", params=params, json={"name": f"TestEventsDir_{uuid.uuid4().hex[:8]}", "parent_id": None}).json()["id"]
+    sub_id = client.post("/directories", params=params, json={"name": "sub", "parent_id": dir_id}).json()["id"]
+    file_id = client.post("/files/", params=params, json={"filename": "a.txt", "parent_id": dir_id}).json()["id"]
+    client.patch(f"/files/{file_id}", params=params, json={"updates": {"name": "b.txt"}})
+    client.patch(f"/files/{file_id}", params=params, json={"updates": {"parent_id": sub_id}})
+    client.request("DELETE", f"/directories/{sub_id}", params=params, json={"recursive": True})
+
+    events = read_events(6, params={"parent_id": dir_id, "after": 0})
+    assert [(e["op"], e["type"], e["id"]) for e in events] == [
+        ("created", "directory", dir_id),
+        ("created", "directory", sub_id),
+        ("created", "file", file_id),
+        ("updated", "file", file_id),
+        ("moved", "file", file_id),
+        ("deleted", "directory", sub_id),
+    ]
+    assert events[4]["previous_parent_id"] == dir_id and events[4]["parent_id"] == sub_id
+    assert [e["seq"] for e in events] == sorted(e["seq"] for e in events)
+
+    # Resuming after an event starts with the next one
+    resumed = read_events(1, params={"parent_id": dir_id}, headers={"Last-Event-ID": str(events[2]["seq"])})
+    assert resumed[0]["seq"] == events[3]["seq"]
+
+    response = client.get("/events", params={**params, "parent_id": str(uuid.uuid4())})
+    assert response.status_code == 404
+    response = client.get("/events", params=params, headers={"Last-Event-ID": "abc"})
+    assert response.status_code == 400
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params=params,
+        json={"recursive": True}
+    )
+
+# Test syncing a subtree from a cursor
+def test_sync_changes(client, mock_public_user):
+    params = {"user_token": mock_public_user}
+    dir_id = client.post("/directories", params=params, json={"name": f"TestSyncDir_{uuid.uuid4().hex[:8]}", "parent_id": None}).json()["id"]
+
+    def sync(since, **extra):
+        response = client.get("/sync", params={**params, "parent_id": dir_id, "since": since, **extra})
+        assert response.status_code == 200
+        return response.json()
+
+    response = client.get("/sync", params={**params, "parent_id": dir_id})
+    assert response.status_code == 200
+    assert response.json()["changes"] == []
+    cursor = response.json()["next_cursor"]
+
+    # Changes are compacted to one per item, in its current state
+    sub_id = client.post("/directories", params=params, json={"name": "sub", "parent_id": dir_id}).json()["id"]
+    file_id = client.post("/files/", params=params, json={"filename": "a.txt", "parent_id": dir_id}).json()["id"]
+    client.patch(f"/files/{file_id}", params=params, json={"updates": {"name": "b.txt", "parent_id": sub_id}})
+    temp_id = client.post("/files/", params=params, json={"filename": "temp.txt", "parent_id": dir_id}).json()["id"]
+    client.delete(f"/files/{temp_id}", params=params)
+    result = sync(cursor)
+    assert not result["has_more"]
+    assert [(c["op"], c["type"], c["id"]) for c in result["changes"]] == [
+        ("created", "directory", sub_id),
+        ("created", "file", file_id),
+    ]
+    assert result["changes"][1]["name"] == "b.txt" and result["changes"][1]["parent_id"] == sub_id
+
+    # Nothing changed since
+    cursor = result["next_cursor"]
+    assert sync(cursor) == {"next_cursor": cursor, "has_more": False, "changes": []}
+
+    # Pages cover limit events each
+    client.patch(f"/files/{file_id}", params=params, json={"updates": {"metadata": {"size": 1}}})
+    client.patch(f"/directories/{sub_id}", params=params, json={"updates": {"name": "renamed"}})
+    first = sync(cursor, limit=1)
+    assert first["has_more"]
+    assert [(c["op"], c["id"]) for c in first["changes"]] == [("updated", file_id)]
+    second = sync(first["next_cursor"], limit=1)
+    assert [(c["op"], c["id"], c["name"]) for c in second["changes"]] == [("updated", sub_id, "renamed")]
+    cursor = second["next_cursor"]
+
+    # Deleting a directory leaves a single tombstone
+    client.request("DELETE", f"/directories/{sub_id}", params=params, json={"recursive": True})
+    assert sync(cursor)["changes"] == [{
+        "op": "deleted", "type": "directory", "id": sub_id, "name": None, "parent_id": None,
+        "version": None, "storage_id": None, "metadata": None
+    }]
+    cursor = sync(cursor)["next_cursor"]
+
+    # A directory moved in from outside the subtree comes with its contents
+    outside_id = client.post("/directories", params=params, json={"name": f"TestSyncOutside_{uuid.uuid4().hex[:8]}", "parent_id": None}).json()["id"]
+    inner_id = client.post("/directories", params=params, json={"name": "inner", "parent_id": outside_id}).json()["id"]
+    inner_file_id = client.post("/files/", params=params, json={"filename": "c.txt", "parent_id": inner_id}).json()["id"]
+    outer_file_id = client.post("/files/", params=params, json={"filename": "d.txt", "parent_id": outside_id}).json()["id"]
+    assert sync(cursor)["changes"] == []
+    client.patch(f"/directories/{outside_id}", params=params, json={"updates": {"parent_id": dir_id}})
+    result = sync(cursor)
+    assert [(c["op"], c["type"], c["id"]) for c in result["changes"]] == [
+        ("moved", "directory", outside_id),
+        ("created", "directory", inner_id),
+    ] + sorted([("created", "file", inner_file_id), ("created", "file", outer_file_id)], key=lambda c: c[2])
+
+    # Moved within the subtree, it comes alone
+    cursor = result["next_cursor"]
+    assert client.patch(f"/directories/{inner_id}", params=params, json={"updates": {"parent_id": dir_id}}).status_code == 200
+    assert [(c["op"], c["id"]) for c in sync(cursor)["changes"]] == [("moved", inner_id)]
+
+    response = client.get("/sync", params={**params, "parent_id": str(uuid.uuid4())})
+    assert response.status_code == 404
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params=params,
+        json={"recursive": True}
+    )
+
 # Test searching for items
 def test_search_items(client, mock_public_user):
     search_request = {
@@ -171,6 +612,98 @@ def test_search_items(client, mock_public_user):
     assert "directories" in data
     assert "files" in data
 
+# Test tag-filtered search requires every requested tag and follows tag changes
+def test_search_by_tags(client, mock_public_user):
+    tag_a, tag_b = f"taga_{uuid.uuid4().hex[:8]}", f"tagb_{uuid.uuid4().hex[:8]}"
+    dir_response = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"TestTagSearchDir_{uuid.uuid4().hex[:8]}", "parent_id": None}
+    )
+    dir_id = dir_response.json()["id"]
+
+    file_ids = {}
+    for name, tags in [("both.txt", [tag_a, tag_b]), ("only_a.txt", [tag_a])]:
+        response = client.post("/files/", params={"user_token": mock_public_user}, json={"filename": name, "parent_id": dir_id})
+        file_ids[name] = response.json()["id"]
+        client.post(f"/files/{file_ids[name]}/tags", params={"user_token": mock_public_user}, json={"tags": tags})
+
+    def search(tags):
+        response = client.post("/search", params={"user_token": mock_public_user}, json={"type": "file", "tags": tags})
+        assert response.status_code == 200
+        return sorted(f["name"] for f in response.json()["files"])
+
+    assert search([tag_a]) == ["both.txt", "only_a.txt"]
+    assert search([tag_a, tag_b]) == ["both.txt"]
+    assert search([tag_a, tag_b, tag_b]) == ["both.txt"]
+    assert search([tag_a, f"missing_{uuid.uuid4().hex[:8]}"]) == []
+
+    client.request("DELETE", f"/files/{file_ids['both.txt']}/tags", params={"user_token": mock_public_user}, json={"tags": [tag_b]})
+    assert search([tag_a, tag_b]) == []
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
+# Test ranked full-text search with paging
+def test_fulltext_search(client, mock_public_user):
+    word = f"ftword{uuid.uuid4().hex[:8]}"
+    dir_response = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"TestFulltextDir_{uuid.uuid4().hex[:8]}", "parent_id": None}
+    )
+    dir_id = dir_response.json()["id"]
+
+    # A name match ranks above a metadata match
+    file_ids = {}
+    for name in [f"{word}_report.pdf", "notes.txt", "other.txt"]:
+        response = client.post("/files/", params={"user_token": mock_public_user}, json={"filename": name, "parent_id": dir_id})
+        file_ids[name] = response.json()["id"]
+    client.patch(
+        f"/files/{file_ids['notes.txt']}",
+        params={"user_token": mock_public_user},
+        json={"updates": {"metadata": {"summary": f"mentions {word}"}}}
+    )
+
+    search_request = {"query": word, "type": "file", "mode": "fulltext"}
+    response = client.post("/search", params={"user_token": mock_public_user}, json=search_request)
+    assert response.status_code == 200
+    files = response.json()["files"]
+    assert [f["name"] for f in files] == [f"{word}_report.pdf", "notes.txt"]
+    assert files[0]["rank"] > files[1]["rank"]
+
+    # Words of a name are separated by '.' and '_' too
+    response = client.post(
+        "/search",
+        params={"user_token": mock_public_user},
+        json={**search_request, "query": f"{word} report.pdf"}
+    )
+    assert [f["name"] for f in response.json()["files"]] == [f"{word}_report.pdf"]
+
+    response = client.post(
+        "/search",
+        params={"user_token": mock_public_user},
+        json={**search_request, "limit": 1, "offset": 1}
+    )
+    assert [f["name"] for f in response.json()["files"]] == ["notes.txt"]
+
+    # Paging is only supported by the ranked search
+    response = client.post("/search", params={"user_token": mock_public_user}, json={"query": word, "limit": 1})
+    assert response.status_code == 400
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
 # Test getting directory tree
 def test_get_directory_tree(client, mock_public_user):
     response = client.get("/directories/tree", params={"user_token": mock_public_user})
@@ -178,6 +711,72 @@ def test_get_directory_tree(client, mock_public_user):
     data = response.json()
     assert "items" in data
 
+# Test the tree nests every level, and stops at the depth and node limits
+def test_directory_tree_limits(client, mock_public_user):
+    def create(name, parent_id=None):
+        response = client.post(
+            "/directories",
+            params={"user_token": mock_public_user},
+            json={"name": name, "parent_id": parent_id}
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def tree(**params):
+        response = client.get("/directories/tree", params={"parent_id": root_id, "user_token": mock_public_user, **params})
+        assert response.status_code == 200
+        return response.json()
+
+    def summary(items):
+        # (name, children) where children is None when not loaded
+        return [
+            (item["name"], None if item["children"] is None else summary(item["children"]))
+            if item["type"] == "directory" else item["name"]
+            for item in items
+        ]
+
+    # root/{a/{a1/{deep/}, f1.txt}, b/, r.txt}
+    root_id = create(f"TestTreeRoot_{uuid.uuid4().hex[:8]}")
+    a_id = create("a", root_id)
+    a1_id = create("a1", a_id)
+    create("deep", a1_id)
+    create("b", root_id)
+    for name, parent_id in [("f1.txt", a_id), ("r.txt", root_id)]:
+        client.post("/files/", params={"user_token": mock_public_user}, json={"filename": name, "parent_id": parent_id})
+
+    data = tree(level=3)
+    assert summary(data["items"]["tree"]) == [("a", [("a1", [("deep", None)]), "f1.txt"]), ("b", []), "r.txt"]
+    assert data["truncated"] is False
+
+    # Directories below the depth limit are only marked
+    data = tree(level=2)
+    a1 = data["items"]["tree"][0]["children"][0]
+    assert a1["name"] == "a1" and a1["children"] is None and a1["has_children"] is True
+    assert data["items"]["tree"][1]["has_children"] is False
+    assert data["truncated"] is False
+
+    # The node limit loads whole directories, breadth first
+    data = tree(level=3, max_nodes=4)
+    assert summary(data["items"]["tree"]) == [("a", None), ("b", []), "r.txt"]
+    assert data["truncated"] is True
+    data = tree(level=3, max_nodes=2)
+    assert data["items"]["tree"] == []
+    assert data["truncated"] is True
+
+    response = client.get("/directories/tree", params={"level": 0, "user_token": mock_public_user})
+    assert response.status_code == 422
+
+    response = client.get("/directories/tree", params={"parent_id": root_id, "user_token": f"other_{uuid.uuid4().hex[:8]}"})
+    assert response.json() == {"items": {"tree": []}, "truncated": False}
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{root_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
 # Test getting directory details
 def test_get_directory_details(client, mock_public_user):
     # First create a directory
@@ -204,6 +803,165 @@ def test_get_directory_details(client, mock_public_user):
         json={"recursive": True}
     )
 
+# Test ETags and 304 responses of listings and details
+def test_conditional_get(client, mock_public_user):
+    params = {"user_token": mock_public_user}
+
+    def etag_of(url, **extra):
+        response = client.get(url, params={**params, **extra})
+        assert response.status_code == 200
+        assert response.headers["etag"] == f'"{response.json()["version"]}"'
+        return response.headers["etag"]
+
+    def status_with(url, etag, **extra):
+        return client.get(url, params={**params, **extra}, headers={"If-None-Match": etag}).status_code
+
+    root_etag = etag_of("/directories")
+    dir_id = client.post("/directories", params=params, json={"name": f"TestETagDir_{uuid.uuid4().hex[:8]}", "parent_id": None}).json()["id"]
+    assert status_with("/directories", root_etag) == 200
+
+    dir_etag = etag_of(f"/directories/{dir_id}")
+    list_etag = etag_of("/directories", parent_id=dir_id)
+    assert status_with(f"/directories/{dir_id}", dir_etag) == 304
+    assert status_with("/directories", list_etag, parent_id=dir_id) == 304
+    assert status_with("/directories", f'W/"0", {list_etag}', parent_id=dir_id) == 304
+
+    # A new child changes the listing and the counts of the details
+    file_id = client.post("/files/", params=params, json={"filename": "a.txt", "parent_id": dir_id}).json()["id"]
+    assert status_with(f"/directories/{dir_id}", dir_etag) == 200
+    assert status_with("/directories", list_etag, parent_id=dir_id) == 200
+
+    # So does renaming it, but not changing its metadata
+    list_etag = etag_of("/directories", parent_id=dir_id)
+    file_etag = etag_of(f"/files/{file_id}")
+    assert status_with(f"/files/{file_id}", file_etag) == 304
+    client.patch(f"/files/{file_id}", params=params, json={"updates": {"metadata": {"size": 1}}})
+    assert status_with("/directories", list_etag, parent_id=dir_id) == 304
+    assert status_with(f"/files/{file_id}", file_etag) == 200
+    client.patch(f"/files/{file_id}", params=params, json={"updates": {"name": "b.txt"}})
+    assert status_with("/directories", list_etag, parent_id=dir_id) == 200
+
+    # Tags are part of the file details
+    file_etag = etag_of(f"/files/{file_id}")
+    client.post(f"/files/{file_id}/tags", params=params, json={"tags": ["etag"]})
+    assert status_with(f"/files/{file_id}", file_etag) == 200
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params=params,
+        json={"recursive": True}
+    )
+
+# Test child counts follow creates, moves and deletes, and are not multiplied by each other
+def test_directory_child_counts(client, mock_public_user):
+    def create(name, parent_id=None):
+        response = client.post(
+            "/directories",
+            params={"user_token": mock_public_user},
+            json={"name": name, "parent_id": parent_id}
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def child_counts(dir_id):
+        response = client.get(f"/directories/{dir_id}", params={"user_token": mock_public_user})
+        assert response.status_code == 200
+        return response.json()["child_counts"]
+
+    dir_id = create(f"TestCountsDir_{uuid.uuid4().hex[:8]}")
+    other_id = create(f"TestCountsOther_{uuid.uuid4().hex[:8]}")
+    sub_ids = [create(f"sub_{i}", dir_id) for i in range(3)]
+    file_ids = []
+    for name in ["a.txt", "b.txt"]:
+        response = client.post("/files/", params={"user_token": mock_public_user}, json={"filename": name, "parent_id": dir_id})
+        file_ids.append(response.json()["id"])
+    assert child_counts(dir_id) == {"directories": 3, "files": 2, "total": 5}
+
+    # Moves leave the old parent and enter the new one
+    client.patch(f"/files/{file_ids[0]}", params={"user_token": mock_public_user}, json={"updates": {"parent_id": other_id}})
+    client.patch(f"/directories/{sub_ids[0]}", params={"user_token": mock_public_user}, json={"updates": {"parent_id": other_id}})
+    assert child_counts(dir_id) == {"directories": 2, "files": 1, "total": 3}
+    assert child_counts(other_id) == {"directories": 1, "files": 1, "total": 2}
+
+    client.request("DELETE", f"/directories/{sub_ids[1]}", params={"user_token": mock_public_user}, json={"recursive": True})
+    client.delete(f"/files/{file_ids[1]}", params={"user_token": mock_public_user})
+    assert child_counts(dir_id) == {"directories": 1, "files": 0, "total": 1}
+
+    # Cleanup
+    for cleanup_id in [dir_id, other_id]:
+        client.request(
+            "DELETE",
+            f"/directories/{cleanup_id}",
+            params={"user_token": mock_public_user},
+            json={"recursive": True}
+        )
+
+# Test recursive directory totals follow creates, size changes, moves and deletes
+def test_directory_stats(client, mock_public_user):
+    def create(name, parent_id=None):
+        response = client.post(
+            "/directories",
+            params={"user_token": mock_public_user},
+            json={"name": name, "parent_id": parent_id}
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def create_file(name, parent_id, size=None):
+        response = client.post("/files/", params={"user_token": mock_public_user}, json={"filename": name, "parent_id": parent_id})
+        file_id = response.json()["id"]
+        if size is not None:
+            client.patch(f"/files/{file_id}", params={"user_token": mock_public_user}, json={"updates": {"metadata": {"size": size}}})
+        return file_id
+
+    def stats(dir_id):
+        response = client.get(f"/directories/{dir_id}/stats", params={"user_token": mock_public_user})
+        assert response.status_code == 200
+        data = response.json()
+        return data["files"], data["directories"], data["size"]
+
+    root_id = create(f"TestStatsRoot_{uuid.uuid4().hex[:8]}")
+    other_id = create(f"TestStatsOther_{uuid.uuid4().hex[:8]}")
+    a_id = create("a", root_id)
+    b_id = create("b", a_id)
+    create_file("root.txt", root_id, 100)
+    create_file("a.txt", a_id, 50)
+    b_file_id = create_file("b.txt", b_id, 25)
+    create_file("unsized.txt", b_id)
+    assert stats(root_id) == (4, 2, 175)
+    assert stats(a_id) == (3, 1, 75)
+    assert stats(b_id) == (2, 0, 25)
+
+    client.patch(f"/files/{b_file_id}", params={"user_token": mock_public_user}, json={"updates": {"metadata": {"size": 30}}})
+    assert stats(root_id) == (4, 2, 180)
+
+    # Moving a subtree takes its totals from the old ancestors to the new ones
+    client.patch(f"/directories/{b_id}", params={"user_token": mock_public_user}, json={"updates": {"parent_id": other_id}})
+    assert stats(root_id) == (2, 1, 150)
+    assert stats(other_id) == (2, 1, 30)
+
+    # Deleting a subtree takes the totals of all its levels from the ancestors
+    c_id = create("c", a_id)
+    create_file("c.txt", c_id, 10)
+    assert stats(root_id) == (3, 2, 160)
+
+    client.request("DELETE", f"/directories/{a_id}", params={"user_token": mock_public_user}, json={"recursive": True})
+    assert stats(root_id) == (1, 0, 100)
+
+    response = client.get(f"/directories/{uuid.uuid4()}/stats", params={"user_token": mock_public_user})
+    assert response.status_code == 404
+
+    # Cleanup
+    for cleanup_id in [root_id, other_id]:
+        client.request(
+            "DELETE",
+            f"/directories/{cleanup_id}",
+            params={"user_token": mock_public_user},
+            json={"recursive": True}
+        )
+
 # Test updating directory
 def test_update_directory(client, mock_public_user):
     # Create initial directory
@@ -233,6 +991,59 @@ def test_update_directory(client, mock_public_user):
         json={"recursive": True}
     )
 
+# Test moving a directory, and moving it into its own subtree
+def test_move_directory(client, mock_public_user):
+    def create(name, parent_id=None):
+        response = client.post(
+            "/directories",
+            params={"user_token": mock_public_user},
+            json={"name": name, "parent_id": parent_id}
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    outer_id = create(f"TestMoveOuter_{uuid.uuid4().hex[:8]}")
+    child_id = create("child", outer_id)
+    grandchild_id = create("grandchild", child_id)
+    target_id = create(f"TestMoveTarget_{uuid.uuid4().hex[:8]}")
+
+    # A directory cannot be moved into itself or one of its descendants
+    for parent_id in [outer_id, grandchild_id]:
+        response = client.patch(
+            f"/directories/{outer_id}",
+            params={"user_token": mock_public_user},
+            json={"updates": {"parent_id": parent_id}}
+        )
+        assert response.status_code != 200
+
+    # Moving a subtree keeps its contents reachable under the new parent
+    response = client.patch(
+        f"/directories/{child_id}",
+        params={"user_token": mock_public_user},
+        json={"updates": {"parent_id": target_id}}
+    )
+    assert response.status_code == 200
+    assert response.json()["parent_id"] == target_id
+    listing = client.get("/directories", params={"parent_id": child_id, "user_token": mock_public_user})
+    assert [d["id"] for d in listing.json()["directories"]] == [grandchild_id]
+
+    # The moved subtree is now inside target, so target cannot move under it
+    response = client.patch(
+        f"/directories/{target_id}",
+        params={"user_token": mock_public_user},
+        json={"updates": {"parent_id": grandchild_id}}
+    )
+    assert response.status_code != 200
+
+    # Cleanup
+    for dir_id in [outer_id, target_id]:
+        client.request(
+            "DELETE",
+            f"/directories/{dir_id}",
+            params={"user_token": mock_public_user},
+            json={"recursive": True}
+        )
+
 # Test copying directory
 def test_copy_directory(client, mock_public_user):
     # Create source directory
@@ -270,6 +1081,216 @@ def test_copy_directory(client, mock_public_user):
             json={"recursive": True}
         )
 
+# Test copying a directory copies every level of its subtree
+def test_copy_nested_directory(client, mock_public_user):
+    def create(name, parent_id=None):
+        response = client.post(
+            "/directories",
+            params={"user_token": mock_public_user},
+            json={"name": name, "parent_id": parent_id}
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def listing(parent_id):
+        response = client.get("/directories", params={"parent_id": parent_id, "user_token": mock_public_user})
+        assert response.status_code == 200
+        return response.json()
+
+    source_id = create(f"TestCopySource_{uuid.uuid4().hex[:8]}")
+    child_id = create("child", source_id)
+    grandchild_id = create("grandchild", child_id)
+    dest_id = create(f"TestCopyDest_{uuid.uuid4().hex[:8]}")
+
+    file_response = client.post(
+        "/files/",
+        params={"user_token": mock_public_user},
+        json={"filename": "deep.txt", "parent_id": grandchild_id}
+    )
+    file_id = file_response.json()["id"]
+    client.post(
+        f"/files/{file_id}/tags",
+        params={"user_token": mock_public_user},
+        json={"tags": ["copied"]}
+    )
+
+    copy_response = client.post(
+        f"/directories/{source_id}/copy",
+        params={"user_token": mock_public_user},
+        json={"destination_parent_id": dest_id}
+    )
+    assert copy_response.status_code == 200
+    copy_id = copy_response.json()["id"]
+    assert copy_id != source_id
+
+    # Walk down the copy: every level and the file at the bottom must be there
+    [child_copy] = listing(copy_id)["directories"]
+    assert child_copy["name"] == "child" and child_copy["id"] != child_id
+    [grandchild_copy] = listing(child_copy["id"])["directories"]
+    assert grandchild_copy["name"] == "grandchild" and grandchild_copy["id"] != grandchild_id
+    [file_copy] = listing(grandchild_copy["id"])["files"]
+    assert file_copy["name"] == "deep.txt" and file_copy["id"] != file_id
+
+    file_details = client.get(f"/files/{file_copy['id']}", params={"user_token": mock_public_user})
+    assert file_details.status_code == 200
+    assert file_details.json()["tags"]["names"] == ["copied"]
+
+    # Cleanup
+    for dir_id in [source_id, dest_id]:
+        client.request(
+            "DELETE",
+            f"/directories/{dir_id}",
+            params={"user_token": mock_public_user},
+            json={"recursive": True}
+        )
+
+# Test batches apply all operations or none in atomic mode, and each on its own in best-effort mode
+def test_batch(client, mock_public_user):
+    dir_response = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"TestBatchDir_{uuid.uuid4().hex[:8]}", "parent_id": None}
+    )
+    dir_id = dir_response.json()["id"]
+
+    def listing():
+        response = client.get("/directories", params={"parent_id": dir_id, "user_token": mock_public_user})
+        data = response.json()
+        return [d["name"] for d in data["directories"]], [f["name"] for f in data["files"]]
+
+    response = client.post("/batch", params={"user_token": mock_public_user}, json={"operations": [
+        {"op": "create_directory", "name": "sub", "parent_id": dir_id},
+        {"op": "create_file", "filename": "a.txt", "parent_id": dir_id},
+        {"op": "create_file", "filename": "b.txt", "parent_id": dir_id},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status_code"] for r in results] == [200, 200, 200]
+    assert results[0]["result"]["name"] == "sub"
+    sub_id, a_id, b_id = [r["result"]["id"] for r in results]
+    assert listing() == (["sub"], ["a.txt", "b.txt"])
+
+    # A failing operation rolls back the whole atomic batch
+    response = client.post("/batch", params={"user_token": mock_public_user}, json={"operations": [
+        {"op": "update_file", "id": a_id, "parent_id": sub_id},
+        {"op": "delete_file", "id": b_id},
+        {"op": "create_directory", "name": "sub", "parent_id": dir_id},
+    ]})
+    assert response.status_code == 409
+    assert listing() == (["sub"], ["a.txt", "b.txt"])
+
+    # In best-effort mode only the failing operation is left out
+    response = client.post("/batch", params={"user_token": mock_public_user}, json={"mode": "best_effort", "operations": [
+        {"op": "update_file", "id": a_id, "parent_id": sub_id},
+        {"op": "create_directory", "name": "sub", "parent_id": dir_id},
+        {"op": "delete_file", "id": b_id},
+        {"op": "copy_directory", "id": sub_id, "destination_parent_id": sub_id},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status_code"] for r in results][:3] == [200, 409, 200]
+    assert results[1]["detail"]
+    assert results[3]["status_code"] != 200
+    assert listing() == (["sub"], [])
+
+    # A failing first operation does not take the ones queued after it down
+    response = client.post("/batch", params={"user_token": mock_public_user}, json={"mode": "best_effort", "operations": [
+        {"op": "create_directory", "name": "sub", "parent_id": dir_id},
+        {"op": "create_directory", "name": "other", "parent_id": dir_id},
+        {"op": "create_directory", "name": "other", "parent_id": dir_id},
+    ]})
+    assert response.status_code == 200
+    assert [r["status_code"] for r in response.json()["results"]] == [409, 200, 409]
+    assert listing() == (["other", "sub"], [])
+
+    response = client.post("/batch", params={"user_token": mock_public_user}, json={"operations": [{"op": "rename"}]})
+    assert response.status_code == 422
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
+# Test importing a manifest creates the tree set-wise and skips names that are taken
+def test_import_manifest(client, mock_public_user):
+    dir_response = client.post(
+        "/directories",
+        params={"user_token": mock_public_user},
+        json={"name": f"TestImportDir_{uuid.uuid4().hex[:8]}", "parent_id": None}
+    )
+    dir_id = dir_response.json()["id"]
+    tag = f"imported_{uuid.uuid4().hex[:8]}"
+
+    manifest = "\n".join(json.dumps(entry) for entry in [
+        {"path": "photos/2024/beach.jpg", "metadata": {"size": 1024}, "tags": [tag]},
+        {"path": "photos/2024/sunset.jpg", "storage_id": "store_sunset"},
+        {"path": "photos/empty/"},
+        {"path": "notes.txt"},
+    ])
+    response = client.post("/import", params={"parent_id": dir_id, "user_token": mock_public_user}, content=manifest)
+    assert response.status_code == 200
+    assert response.json() == {"directories_created": 3, "files_created": 3, "files_skipped": 0}
+
+    tree = client.get("/directories/tree", params={"parent_id": dir_id, "user_token": mock_public_user}).json()
+    photos = tree["items"]["tree"][0]
+    assert [item["name"] for item in tree["items"]["tree"]] == ["photos", "notes.txt"]
+    assert [item["name"] for item in photos["children"]] == ["2024", "empty"]
+    assert [item["name"] for item in photos["children"][0]["children"]] == ["beach.jpg", "sunset.jpg"]
+
+    response = client.post("/search", params={"user_token": mock_public_user}, json={"type": "file", "tags": [tag]})
+    assert [f["name"] for f in response.json()["files"]] == ["beach.jpg"]
+    assert response.json()["files"][0]["metadata"] == {"size": 1024}
+
+    # Existing directories are reused and existing files skipped
+    manifest = "path,storage_id,metadata,tags\nphotos/2024/beach.jpg,,,\nphotos/2025/party.jpg,,\"{\"\"size\"\": 10}\",a;b\n"
+    response = client.post(
+        "/import",
+        params={"parent_id": dir_id, "format": "csv", "user_token": mock_public_user},
+        content=manifest
+    )
+    assert response.status_code == 200
+    assert response.json() == {"directories_created": 1, "files_created": 1, "files_skipped": 1}
+
+    # Quoted CSV fields may span lines
+    manifest = 'path,storage_id,metadata,tags\nnotes/multi.txt,,"{\n""size"": 20\n}",\nnotes/next.txt,,,\n'
+    response = client.post(
+        "/import",
+        params={"parent_id": dir_id, "format": "csv", "user_token": mock_public_user},
+        content=manifest
+    )
+    assert response.status_code == 200
+    assert response.json() == {"directories_created": 1, "files_created": 2, "files_skipped": 0}
+
+    response = client.post("/import", params={"parent_id": dir_id, "user_token": mock_public_user}, content='{"path": "../escape.txt"}')
+    assert response.status_code == 400
+
+    # Manifests that are not UTF-8 are rejected, naming the line
+    response = client.post(
+        "/import",
+        params={"parent_id": dir_id, "user_token": mock_public_user},
+        content=b'{"path": "ok.txt"}\n{"path": "caf\xe9.txt"}\n'
+    )
+    assert response.status_code == 400
+    assert "line 2" in response.json()["detail"]
+
+    response = client.post(
+        "/import",
+        params={"parent_id": dir_id, "format": "csv", "user_token": mock_public_user},
+        content='open.txt,,"{\n'
+    )
+    assert response.status_code == 400
+
+    # Cleanup
+    client.request(
+        "DELETE",
+        f"/directories/{dir_id}",
+        params={"user_token": mock_public_user},
+        json={"recursive": True}
+    )
+
 # Test file tags operations
 def test_file_tags(client, mock_public_user):
     # Create a directory and file first
@@ -3,19 +3,27 @@ import axios from "axios";
 
 const baseURL = "http://localhost:8000";
 
+// The listing comes in pages: follows next_cursor until the whole directory is loaded
+const listDirectory = async (parent_id) => {
+    const documents = { directories: [], files: [] };
+    let after = null;
+    do {
+        const response = await axios.get(`${baseURL}/directories`, {
+            params: { parent_id: parent_id ?? undefined, after: after ?? undefined },
+        });
+        documents.directories.push(...response.data.directories);
+        documents.files.push(...response.data.files);
+        after = response.data.next_cursor;
+    } while (after);
+    return documents
+}
+
 export const getRoot = async () => {
-    const response = await axios.get(`${baseURL}/directories`)
-    return response.data
+    return listDirectory(null)
 }
 
 export const getDocuments = async (dir_id) => {
-    let response;
-    if (dir_id === null){
-        response = await axios.get(`${baseURL}/directories`)
-    } else {
-        response = await axios.get(`${baseURL}/directories?parent_id=${dir_id}`)
-    }
-    return response.data
+    return listDirectory(dir_id)
 }
 
 